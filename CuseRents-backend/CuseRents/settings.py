@@ -88,6 +88,28 @@ DATABASES = {
     )
 }
 
+# Cache
+# Booking calendars, search result versions, geocoding results and the
+# shared rate limit are invalidated through the default cache, so every
+# worker must use the same one (e.g. REDIS_URL=redis://localhost:6379/0).
+# Without it each process has its own memory cache, and entries other
+# processes should have dropped are only bounded by short TTLs.
+REDIS_URL = config('REDIS_URL', default='')
+SHARED_CACHE = bool(REDIS_URL)
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
@@ -210,6 +232,24 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@rentradar.com
 
 # Google Maps API
 GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY', default='')
+# Outbound Google Maps requests per second (items/services.py), per
+# process, or across all workers when shared (needs REDIS_URL)
+GOOGLE_MAPS_RATE_LIMIT = config('GOOGLE_MAPS_RATE_LIMIT', default=10, cast=float)
+GOOGLE_MAPS_SHARED_RATE_LIMIT = config('GOOGLE_MAPS_SHARED_RATE_LIMIT', default=False, cast=bool)
+# Size in metres of the grid cells reverse geocoding results are cached
+# by (items/geocache.py); every point in a cell gets the same address
+REVERSE_GEOCODE_CELL_M = config('REVERSE_GEOCODE_CELL_M', default=25, cast=float)
+
+# Serve map searches and autocomplete from in-memory item indexes
+# (items/snapshot.py, items/autocomplete.py)
+ITEM_SNAPSHOT_ENABLED = config('ITEM_SNAPSHOT_ENABLED', default=True, cast=bool)
+
+# Cache search results in the default cache (items/search_cache.py)
+SEARCH_CACHE_ENABLED = config('SEARCH_CACHE_ENABLED', default=True, cast=bool)
+
+# Key of the permutation that turns booking ids into booking codes
+# (bookings/codes.py); changing it only costs retries on collisions
+BOOKING_CODE_KEY = config('BOOKING_CODE_KEY', default=SECRET_KEY)
 
 # Stripe Configuration
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
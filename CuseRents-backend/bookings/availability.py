@@ -0,0 +1,93 @@
+"""
+Busy intervals per item
+
+An item's pending/accepted/active bookings are merged into a sorted list
+of non-overlapping (start, end) intervals and kept in the cache, so a
+calendar for any date range is a binary search into that list instead of
+a scan over the item's bookings. Booking signals drop an item's entry
+whenever one of its bookings is created, changes status or is deleted.
+
+Those drops only reach other workers through a shared cache
+(settings.SHARED_CACHE); with per-process caches entries expire after
+LOCAL_CACHE_TTL instead, bounding how stale another worker's calendar is.
+"""
+
+import bisect
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+# Entries are dropped on every booking change, so this only bounds memory
+CACHE_TTL = 60 * 60 * 24
+
+# Other processes never see the drops when each has its own cache
+LOCAL_CACHE_TTL = 30
+
+
+def cache_ttl():
+    return CACHE_TTL if settings.SHARED_CACHE else LOCAL_CACHE_TTL
+
+
+def _cache_key(item_id):
+    return f"item_busy_intervals_{item_id}"
+
+
+def merge_intervals(intervals):
+    """Sort (start, end) intervals and merge the ones that overlap or touch"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def busy_intervals(item_id):
+    """Merged intervals during which the item is booked, bundles included"""
+    from .models import Booking
+
+    key = _cache_key(item_id)
+    intervals = cache.get(key)
+    if intervals is None:
+        intervals = merge_intervals(
+            Booking.objects.filter(
+                Q(item_id=item_id) | Q(booking_items__item_id=item_id),
+                status__in=Booking.BLOCKING_STATUSES
+            ).order_by().values_list('start_time', 'end_time').distinct()
+        )
+        cache.set(key, intervals, cache_ttl())
+    return intervals
+
+
+def busy_between(item_id, start, end):
+    """Busy intervals of the item within [start, end), clipped to it"""
+    intervals = busy_intervals(item_id)
+    # Skip intervals that end before the range starts
+    first = bisect.bisect_right(intervals, start, key=lambda interval: interval[1])
+    busy = []
+    for busy_start, busy_end in intervals[first:]:
+        if busy_start >= end:
+            break
+        busy.append((max(busy_start, start), min(busy_end, end)))
+    return busy
+
+
+def free_between(busy, start, end):
+    """The gaps between busy intervals within [start, end)"""
+    free = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start > cursor:
+            free.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        free.append((cursor, end))
+    return free
+
+
+def invalidate(item_ids):
+    """Drop the cached intervals of the given items"""
+    cache.delete_many([_cache_key(item_id) for item_id in item_ids if item_id is not None])
@@ -0,0 +1,121 @@
+"""
+Booking codes derived from primary keys
+
+A booking's code is its primary key run through a keyed permutation of
+the 36^6 possible 6-character codes, so codes are unique without looking
+up existing ones and don't reveal how many bookings there are.
+
+The permutation is a 4-round Feistel network over 32-bit numbers; a value
+that lands outside the code space is encrypted again ("cycle walking")
+until it falls inside, which keeps the mapping a permutation of
+[0, 36^6). About two rounds of walking are needed on average.
+
+Codes from before the allocator are random, so a derived code can still
+hit one of them (or, after BOOKING_CODE_KEY changes, an older derived
+code). The unique index rejects it and the next attempt uses a
+differently keyed permutation.
+"""
+
+import functools
+import hashlib
+import string
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+ROUNDS = 4
+MAX_ATTEMPTS = 8
+
+_HALF_BITS = 16
+_HALF_MASK = (1 << _HALF_BITS) - 1
+
+
+@functools.lru_cache(maxsize=MAX_ATTEMPTS)
+def _round_keys(key, attempt):
+    digest = hashlib.blake2b(
+        f'booking-code:{attempt}'.encode(), key=key.encode()[:64], digest_size=4 * ROUNDS
+    ).digest()
+    return tuple(int.from_bytes(digest[i:i + 4], 'big') for i in range(0, len(digest), 4))
+
+
+def _mix(half, key):
+    """Feistel round function: 16 bits in, 16 well mixed bits out"""
+    value = ((half ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+    value ^= value >> 15
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    return value & _HALF_MASK
+
+
+def _permute(value, keys):
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in keys:
+        left, right = right, left ^ _mix(right, key)
+    return (left << _HALF_BITS) | right
+
+
+def encode(number):
+    """The 6-character code of a number in [0, CODE_SPACE)"""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def code_for(pk, attempt=0):
+    """
+    Booking code of a primary key
+
+    Distinct primary keys get distinct codes for the same attempt.
+    """
+    if not 0 <= pk < CODE_SPACE:
+        raise ValueError(f"Booking id {pk} is outside the code space")
+    keys = _round_keys(settings.BOOKING_CODE_KEY, attempt)
+    value = _permute(pk, keys)
+    while value >= CODE_SPACE:
+        value = _permute(value, keys)
+    return encode(value)
+
+
+def assign(booking, using):
+    """
+    Store the code of a saved booking, retrying on collisions
+
+    Returns:
+        str: The code stored
+    """
+    queryset = type(booking)._base_manager.using(using).filter(pk=booking.pk)
+    for attempt in range(MAX_ATTEMPTS):
+        code = code_for(booking.pk, attempt)
+        try:
+            # Savepoint, so a collision doesn't abort the caller's transaction
+            with transaction.atomic(using=using):
+                queryset.update(booking_code=code)
+        except IntegrityError:
+            continue
+        booking.booking_code = code
+        return code
+    raise IntegrityError(f"No free booking code for booking {booking.pk}")
+
+
+def assign_bulk(bookings, using='default'):
+    """
+    Store codes for bookings inserted with bulk_create (primary keys set)
+    in one bulk update, falling back to one at a time on a collision
+    """
+    if not bookings:
+        return
+    model = type(bookings[0])
+    for booking in bookings:
+        booking.booking_code = code_for(booking.pk)
+    try:
+        with transaction.atomic(using=using):
+            model._base_manager.using(using).bulk_update(bookings, ['booking_code'])
+    except IntegrityError:
+        for booking in bookings:
+            assign(booking, using)
@@ -0,0 +1,153 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+from items.models import Item
+from bookings import codes
+from bookings.models import Booking
+import random
+import time
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic bookings after a benchmark run"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark booking creation: random code + exists() loop vs derived codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--existing',
+            type=int,
+            default=1000000,
+            help='Number of existing bookings (with random legacy codes)'
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=2000,
+            help='Number of bookings to create with each method'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting booking code benchmark...'))
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS("\nBenchmark complete! (synthetic bookings rolled back)"))
+
+    def _run(self, options):
+        renter = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        item = Item.objects.create(
+            owner=renter,
+            title='Benchmark item',
+            description='Synthetic item',
+            category='other',
+            price_per_hour=1,
+            address_text='Syracuse, NY',
+            lat=43.0361,
+            lng=-76.1275,
+            photo_url='https://example.com/item.jpg',
+        )
+        start_time = timezone.now() + timedelta(days=1)
+
+        def booking(**kwargs):
+            # Completed, so the overlap constraint doesn't apply
+            return Booking(
+                renter=renter,
+                item=item,
+                start_time=start_time,
+                end_time=start_time + timedelta(hours=1),
+                total_price=1,
+                status='completed',
+                **kwargs
+            )
+
+        self._create_existing(booking, options['existing'])
+        count = options['bookings']
+        rng = random.Random(1)
+
+        def legacy_code():
+            return ''.join(rng.choices(codes.ALPHABET, k=codes.CODE_LENGTH))
+
+        def legacy():
+            # The old Booking.save: random codes until one is not taken
+            code = legacy_code()
+            while Booking.objects.filter(booking_code=code).exists():
+                code = legacy_code()
+            booking(booking_code=code).save()
+
+        def derived():
+            booking().save()
+
+        self._time('Random + exists()', legacy, count)
+        first_id = Booking.objects.order_by('-pk').values_list('pk', flat=True)[0] + 1
+        self._time('Derived codes', derived, count)
+
+        bulk = [booking() for _ in range(count)]
+        start = time.perf_counter()
+        Booking.objects.bulk_create(bulk, batch_size=1000)
+        codes.assign_bulk(bulk)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"  {'bulk_create':<18} {elapsed / count * 1000:.2f} ms/booking")
+
+        retried = sum(
+            1 for pk, code in Booking.objects.filter(pk__gte=first_id).values_list('pk', 'booking_code')
+            if code != codes.code_for(pk)
+        )
+        self.stdout.write(f"  Derived codes that hit a legacy code: {retried}")
+
+        duplicates = Booking.objects.values('booking_code').annotate(
+            n=Count('id')
+        ).filter(n__gt=1, booking_code__isnull=False).count()
+        missing = Booking.objects.filter(booking_code__isnull=True).count()
+        if duplicates or missing:
+            raise CommandError(f"{duplicates} duplicate and {missing} missing booking codes")
+        self.stdout.write(self.style.SUCCESS("  ✓ All booking codes unique"))
+
+    def _time(self, label, create, count):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            for _ in range(count):
+                create()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"  {label:<18} {elapsed / count * 1000:.2f} ms/booking, "
+            f"{queries / count:.1f} queries/booking"
+        )
+
+    def _create_existing(self, booking, size):
+        rng = random.Random(0)
+        seen = set()
+        batch = []
+        start = time.perf_counter()
+
+        while len(seen) < size:
+            code = ''.join(rng.choices(codes.ALPHABET, k=codes.CODE_LENGTH))
+            if code in seen:
+                continue
+            seen.add(code)
+            batch.append(booking(booking_code=code))
+            if len(batch) == 10000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            Booking.objects.bulk_create(batch)
+
+        self.stdout.write(f"  Created {size} existing bookings in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,127 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.test import APIClient
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from items.models import Item
+from bookings.models import Booking
+import random
+import threading
+import time
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent conflicting bookings at one item and check none overlap'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=300,
+            help='Number of booking requests to send'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Number of concurrent clients'
+        )
+        parser.add_argument(
+            '--slots',
+            type=int,
+            default=24,
+            help='Requests pick a random 1-3 hour window within this many hours'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting booking load test...'))
+        self.stdout.write(f"  {options['requests']} requests, {options['workers']} workers")
+
+        # Created outside any transaction so every worker connection sees them
+        suffix = time.time_ns()
+        owner = User.objects.create(username=f'loadtest-owner-{suffix}')
+        renters = [
+            User.objects.create(username=f'loadtest-renter-{suffix}-{i}')
+            for i in range(options['workers'])
+        ]
+        item = Item.objects.create(
+            owner=owner,
+            title='Load test item',
+            description='Synthetic item',
+            category='other',
+            price_per_hour=1,
+            address_text='Syracuse, NY',
+            lat=43.0361,
+            lng=-76.1275,
+            photo_url='https://example.com/item.jpg',
+        )
+
+        try:
+            counts = self._run(item, renters, options)
+            self._report(item, counts)
+        finally:
+            User.objects.filter(pk__in=[owner.pk] + [renter.pk for renter in renters]).delete()
+
+    def _run(self, item, renters, options):
+        base = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+        rng = random.Random(0)
+        windows = []
+        for _ in range(options['requests']):
+            start = base + timedelta(hours=rng.randrange(options['slots']))
+            windows.append((start, start + timedelta(hours=rng.randint(1, 3))))
+
+        local = threading.local()
+        counts = {'created': 0, 'conflicts': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+
+        def book(index):
+            if not hasattr(local, 'client'):
+                local.client = APIClient(SERVER_NAME='localhost')
+                local.client.force_authenticate(renters[index % len(renters)])
+            start, end = windows[index]
+            try:
+                response = local.client.post('/api/bookings/bookings/', {
+                    'item_id': item.id,
+                    'start_time': start.isoformat(),
+                    'end_time': end.isoformat(),
+                }, format='json')
+                outcome = {201: 'created', 400: 'conflicts'}.get(response.status_code, 'errors')
+            except Exception as e:
+                # e.g. SQLite "database is locked" under write contention
+                self.stderr.write(f"  Request {index} failed: {e}")
+                outcome = 'errors'
+            finally:
+                connection.close()
+            with counts_lock:
+                counts[outcome] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            list(executor.map(book, range(options['requests'])))
+        counts['seconds'] = time.perf_counter() - start
+        return counts
+
+    def _report(self, item, counts):
+        self.stdout.write(
+            f"  Created {counts['created']}, rejected {counts['conflicts']}, "
+            f"errors {counts['errors']} in {counts['seconds']:.1f}s"
+        )
+
+        bookings = Booking.objects.filter(item=item, status__in=Booking.BLOCKING_STATUSES)
+        overlaps = bookings.filter(
+            item__bookings__status__in=Booking.BLOCKING_STATUSES,
+            item__bookings__start_time__lt=F('end_time'),
+            item__bookings__end_time__gt=F('start_time'),
+            item__bookings__id__lt=F('id'),
+        ).count()
+
+        if overlaps:
+            raise CommandError(f"{overlaps} bookings overlap an earlier booking of the item")
+        if not counts['created']:
+            raise CommandError("No booking was created")
+        self.stdout.write(self.style.SUCCESS("  ✓ No overlapping bookings"))
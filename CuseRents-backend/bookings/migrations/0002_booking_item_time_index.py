@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+        ('items', '0004_item_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['item', 'start_time', 'end_time'], name='bookings_item_id_b495f4_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+CONSTRAINT = 'bookings_item_no_overlap'
+
+
+def add_no_overlap_constraint(apps, schema_editor):
+    """
+    PostgreSQL only: reject overlapping pending/accepted/active bookings of
+    an item at the database level. Other databases rely on the row lock
+    taken by BookingCreateSerializer.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        f"ALTER TABLE bookings ADD CONSTRAINT {CONSTRAINT} EXCLUDE USING gist ("
+        f"item_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&"
+        f") WHERE (item_id IS NOT NULL AND status IN ('pending', 'accepted', 'active'))"
+    )
+
+
+def remove_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'ALTER TABLE bookings DROP CONSTRAINT IF EXISTS {CONSTRAINT}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_booking_item_time_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_no_overlap_constraint, remove_no_overlap_constraint),
+    ]
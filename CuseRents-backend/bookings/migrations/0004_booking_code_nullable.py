@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_booking_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='booking_code',
+            field=models.CharField(blank=True, help_text='Unique 6-character booking code, derived from the id on insert', max_length=6, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_booking_code_nullable'),
+        ('items', '0004_item_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['item', '-created_at'], name='bookings_item_id_257a41_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['bundle', '-created_at'], name='bookings_bundle__e0c121_idx'),
+        ),
+    ]
@@ -1,13 +1,33 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from decimal import Decimal
-import random
-import string
+from . import codes, transitions
+
+class BookingQuerySet(models.QuerySet):
+    """
+    Queryset with scheduling helpers
+    """
+    
+    def overlapping(self, start_time, end_time):
+        """Bookings that hold their item(s) at some point in [start_time, end_time)"""
+        return self.filter(
+            status__in=Booking.BLOCKING_STATUSES,
+            start_time__lt=end_time,
+            end_time__gt=start_time
+        )
+    
+    def held_item_ids(self):
+        """Ids of the items these bookings hold, bundle items included, in one query"""
+        bookings = self.order_by()
+        return set(
+            bookings.filter(item__isnull=False).values_list('item_id', flat=True).union(
+                bookings.filter(booking_items__isnull=False).values_list(
+                    'booking_items__item_id', flat=True
+                )
+            )
+        )
 
-def generate_booking_code():
-    """Generate unique 6-character booking code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
 class Booking(models.Model):
     """
@@ -22,6 +42,13 @@ class Booking(models.Model):
         ('disputed', 'Disputed'),
     ]
     
+    # Statuses in which a booking keeps its item(s) from being booked again
+    BLOCKING_STATUSES = ['pending', 'accepted', 'active']
+    
+    # PostgreSQL exclusion constraint rejecting overlapping blocking
+    # bookings of the same item (migration 0003)
+    NO_OVERLAP_CONSTRAINT = 'bookings_item_no_overlap'
+    
     # Relationships
     renter = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -107,7 +134,9 @@ class Booking(models.Model):
     booking_code = models.CharField(
         max_length=6,
         unique=True,
-        help_text="Unique 6-character booking code"
+        null=True,
+        blank=True,
+        help_text="Unique 6-character booking code, derived from the id on insert"
     )
     
     # Payment
@@ -135,14 +164,19 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookingQuerySet.as_manager()
+    
     class Meta:
         db_table = 'bookings'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['renter', '-created_at']),
+            models.Index(fields=['item', '-created_at']),  # For owners' booking lists
+            models.Index(fields=['bundle', '-created_at']),
             models.Index(fields=['status']),
             models.Index(fields=['booking_code']),
             models.Index(fields=['start_time', 'end_time']),
+            models.Index(fields=['item', 'start_time', 'end_time']),  # For overlap checks per item
         ]
     
     def __str__(self):
@@ -150,13 +184,16 @@ class Booking(models.Model):
         return f"{self.booking_code}: {item_name} by {self.renter.username}"
     
     def save(self, *args, **kwargs):
-        # Auto-generate booking code if not exists
-        if not self.booking_code:
-            self.booking_code = generate_booking_code()
-            # Ensure uniqueness
-            while Booking.objects.filter(booking_code=self.booking_code).exists():
-                self.booking_code = generate_booking_code()
-        super().save(*args, **kwargs)
+        if self.booking_code:
+            super().save(*args, **kwargs)
+            return
+        
+        # Insert without a code, then derive it from the new id; no lookup
+        # of existing codes is needed (see codes.py)
+        using = kwargs.get('using') or router.db_for_write(Booking, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            codes.assign(self, using)
     
     @property
     def owner(self):
@@ -201,16 +238,102 @@ class Booking(models.Model):
         return renter_points, owner_points
     
     def mark_active(self):
-        """Mark booking as active (pickup confirmed)"""
-        self.status = 'active'
-        self.save(update_fields=['status', 'updated_at'])
+        """
+        Mark booking as active (pickup confirmed)
+        
+        Raises:
+            transitions.InvalidTransition: The booking was not accepted
+        """
+        transitions.transition(self, 'activate')
     
     def mark_completed(self):
-        """Mark booking as completed (return confirmed)"""
+        """
+        Mark booking as completed (return confirmed)
+        
+        Raises:
+            transitions.InvalidTransition: The booking was not active
+        """
         from django.utils import timezone
-        self.status = 'completed'
-        self.actual_return_time = timezone.now()
-        self.save(update_fields=['status', 'actual_return_time', 'updated_at'])
+        transitions.transition(self, 'complete', actual_return_time=timezone.now())
+    
+    def complete(self):
+        """
+        Complete an active booking and settle it in one transaction
+        
+        Pays the owner, awards both parties' points, records the owner's
+        earning in the wallet ledger, counts the rental on the item(s) and
+        adds the renter's CO2 savings. Every counter is updated with an F()
+        expression instead of read-modify-write, so concurrent changes to
+        the same wallets, items or users are never lost.
+        
+        Returns:
+            tuple: (renter_points, owner_points)
+        
+        Raises:
+            transitions.InvalidTransition: The booking was not active
+            (e.g. completed concurrently); nothing is settled
+            Wallet.DoesNotExist: The renter or owner has no wallet; the
+            booking stays active and nothing is settled
+        """
+        from django.contrib.auth import get_user_model
+        from django.utils import timezone
+        from items.models import Item
+        from rewards.models import Wallet, WalletTransaction
+        
+        with transaction.atomic():
+            # Conditional on the booking being active, so it is settled once
+            self.mark_completed()
+            
+            renter_points, owner_points = self.calculate_reward_points()
+            earnings = self.total_price - self.wallet_credit_used
+            owner_id = self.item.owner_id if self.item_id else self.bundle.creator_id
+            now = timezone.now()
+            
+            credits = {self.renter_id: {'reward_points': renter_points}}
+            owner_credits = credits.setdefault(owner_id, {'reward_points': 0})
+            owner_credits['reward_points'] += owner_points
+            owner_credits.update(balance=earnings, lifetime_earned=self.total_price)
+            # In user id order, so completions between the same two users
+            # in opposite roles can't deadlock
+            for user_id in sorted(credits):
+                updated = Wallet.objects.filter(user_id=user_id).update(
+                    updated_at=now,
+                    **{field: models.F(field) + amount for field, amount in credits[user_id].items()}
+                )
+                # An update matching no row would drop the credit silently
+                if not updated:
+                    raise Wallet.DoesNotExist(f"User {user_id} has no wallet")
+            
+            # The row stays locked by the update, so this is the balance
+            # right after the earning
+            owner_wallet = Wallet.objects.filter(user_id=owner_id).values('id', 'balance').get()
+            WalletTransaction.objects.bulk_create([
+                WalletTransaction(
+                    wallet_id=owner_wallet['id'],
+                    amount=earnings,
+                    transaction_type='rental_earning',
+                    booking=self,
+                    description=f"Rental {self.booking_code}",
+                    balance_after=owner_wallet['balance'],
+                )
+            ])
+            
+            if self.item_id:
+                item_ids = [self.item_id]
+                co2_saved = self.item.carbon_offset_kg
+            else:
+                items = Item.objects.filter(booking_items__booking=self).values_list('id', 'carbon_offset_kg')
+                item_ids = [item_id for item_id, _ in items]
+                co2_saved = sum(kg for _, kg in items)
+            Item.objects.filter(pk__in=item_ids).update(
+                total_rentals=models.F('total_rentals') + 1, updated_at=now
+            )
+            if co2_saved:
+                get_user_model().objects.filter(pk=self.renter_id).update(
+                    co2_saved_kg=models.F('co2_saved_kg') + co2_saved
+                )
+        
+        return renter_points, owner_points
 
 
 class BookingItem(models.Model):
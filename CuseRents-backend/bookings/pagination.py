@@ -0,0 +1,29 @@
+from django.utils.dateparse import parse_datetime
+
+from items.pagination import KeysetPagination
+
+
+class CreatedCursorPagination(KeysetPagination):
+    """
+    Keyset pagination for bookings, newest first
+
+    Results are ordered by (-created_at, -id); positions are
+    (created_at, id), so each page is a limited index range scan however
+    deep it is.
+    """
+
+    @staticmethod
+    def position(booking):
+        return booking.created_at, booking.id
+
+    @staticmethod
+    def format_position(created_at, booking_id):
+        return f"{created_at.isoformat()}|{booking_id}"
+
+    @staticmethod
+    def parse_position(text):
+        created_at, booking_id = text.split('|')
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(text)
+        return created_at, int(booking_id)
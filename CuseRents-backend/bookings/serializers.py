@@ -1,11 +1,27 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import Booking
-from items.models import Item
+from items.models import Bundle, Item
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 User = get_user_model()
 
+OVERLAP_MESSAGE = "Item is already booked for this time period"
+
+# PostgreSQL SQLSTATE of a violated exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+
+def is_overlap_violation(error):
+    """Whether an IntegrityError comes from the bookings no-overlap constraint"""
+    cause = error.__cause__
+    if getattr(cause, 'pgcode', None) != EXCLUSION_VIOLATION:
+        return False
+    diag = getattr(cause, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == Booking.NO_OVERLAP_CONSTRAINT
+
 class BookingItemSerializer(serializers.ModelSerializer):
     """Simplified item serializer for bookings"""
     owner_username = serializers.CharField(source='owner.username', read_only=True)
@@ -21,36 +37,54 @@ class BookingRenterSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'phone', 'rating_avg']
 
+class BookingUserSummarySerializer(serializers.ModelSerializer):
+    """Just the user fields booking lists show"""
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+
+class BookingItemSummarySerializer(serializers.ModelSerializer):
+    """Just the item fields booking lists show"""
+    class Meta:
+        model = Item
+        fields = ['id', 'title', 'photo_url']
+
+class BookingBundleSummarySerializer(serializers.ModelSerializer):
+    """Just the bundle fields booking lists show"""
+    class Meta:
+        model = Bundle
+        fields = ['id', 'name']
+
 class BookingListSerializer(serializers.ModelSerializer):
-    """Serializer for listing bookings"""
-    item = BookingItemSerializer(read_only=True)
-    renter = BookingRenterSerializer(read_only=True)
+    """
+    Serializer for listing bookings
+    
+    Related rows must be select_related (BookingViewSet.LIST_RELATED);
+    the full details are in BookingDetailSerializer.
+    """
+    item = BookingItemSummarySerializer(read_only=True)
+    bundle = BookingBundleSummarySerializer(read_only=True)
+    renter = BookingUserSummarySerializer(read_only=True)
     owner = serializers.SerializerMethodField()
     
     class Meta:
         model = Booking
         fields = [
-            'id', 'booking_code', 'item', 'renter', 'owner',
-            'start_time', 'end_time',
-            'total_price', 'deposit_amount', 'wallet_credit_used',
-            'reward_points_earned', 'status',
-            'created_at', 'updated_at'
+            'id', 'booking_code', 'item', 'bundle', 'renter', 'owner',
+            'start_time', 'end_time', 'total_price', 'status',
+            'created_at'
         ]
     
     def get_owner(self, obj):
-        """Get item owner info"""
+        """Get item owner or bundle creator info"""
         owner = None
-        if obj.item and obj.item.owner:
+        if obj.item:
             owner = obj.item.owner
-        elif obj.bundle and obj.bundle.creator:
+        elif obj.bundle:
             owner = obj.bundle.creator
         
         if owner:
-            return {
-                'id': owner.id,
-                'username': owner.username,
-                'email': owner.email
-            }
+            return BookingUserSummarySerializer(owner).data
         return None
 
 class BookingCreateSerializer(serializers.ModelSerializer):
@@ -84,16 +118,9 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         if start_time < timezone.now():
             raise serializers.ValidationError("Start time cannot be in the past")
         
-        overlapping = Booking.objects.filter(
-            item=item,
-            status__in=['pending', 'accepted', 'active']
-        ).filter(
-            start_time__lt=end_time,
-            end_time__gt=start_time
-        ).exists()
-        
-        if overlapping:
-            raise serializers.ValidationError("Item is already booked for this time period")
+        # Cheap unlocked check; create() repeats it under the item's lock
+        if Booking.objects.filter(item=item).overlapping(start_time, end_time).exists():
+            raise serializers.ValidationError(OVERLAP_MESSAGE)
         
         data['item'] = item
         return data
@@ -113,19 +140,42 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         total_price = min(hourly_price, daily_price)
         reward_points = int(total_price * 10)
         
-        booking = Booking.objects.create(
-            item=item,
-            renter=self.context['request'].user,
-            start_time=validated_data['start_time'],
-            end_time=validated_data['end_time'],
-            total_price=total_price,
-            deposit_amount=item.deposit,
-            wallet_credit_used=validated_data.get('wallet_credit_used', 0),
-            reward_points_earned=reward_points,
-            status='pending'
-        )
+        # The overlap check and the insert must not interleave with another
+        # booking of the same item, so both run under a lock on its row
+        with transaction.atomic():
+            Item.objects.select_for_update().filter(pk=item.pk).exists()
+            
+            overlapping = Booking.objects.filter(item=item).overlapping(
+                validated_data['start_time'], validated_data['end_time']
+            ).exists()
+            if overlapping:
+                raise self.overlap_error()
+            
+            try:
+                with transaction.atomic():
+                    booking = Booking.objects.create(
+                        item=item,
+                        renter=self.context['request'].user,
+                        start_time=validated_data['start_time'],
+                        end_time=validated_data['end_time'],
+                        total_price=total_price,
+                        deposit_amount=item.deposit,
+                        wallet_credit_used=validated_data.get('wallet_credit_used', 0),
+                        reward_points_earned=reward_points,
+                        status='pending'
+                    )
+            except IntegrityError as e:
+                # Exclusion constraint on PostgreSQL, as a last line of defence
+                if is_overlap_violation(e):
+                    raise self.overlap_error() from e
+                raise
         
         return booking
+    
+    @staticmethod
+    def overlap_error():
+        """Same response body as the check in validate()"""
+        return serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE]})
 
 class BookingDetailSerializer(serializers.ModelSerializer):
     """Detailed serializer for single booking"""
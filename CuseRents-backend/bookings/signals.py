@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import availability
+from .models import Booking, BookingItem
+from .transitions import booking_transitioned
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_item_availability(sender, instance, **kwargs):
+    """Status changes (accept, reject, complete, cancel...) change busy intervals"""
+    item_ids = [instance.item_id]
+    if instance.bundle_id and kwargs.get('signal') is post_save:
+        item_ids += list(instance.booking_items.values_list('item_id', flat=True))
+    transaction.on_commit(lambda: availability.invalidate(item_ids))
+
+
+@receiver(booking_transitioned)
+def invalidate_availability_on_transition(sender, booking, **kwargs):
+    """Transitions are queryset updates, which don't send post_save"""
+    invalidate_item_availability(sender, booking, signal=post_save)
+
+
+@receiver(post_save, sender=BookingItem)
+@receiver(post_delete, sender=BookingItem)
+def invalidate_bundle_item_availability(sender, instance, **kwargs):
+    transaction.on_commit(lambda: availability.invalidate([instance.item_id]))
@@ -1,3 +1,441 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from items.autocomplete import title_index
+from items.models import Bundle
+from items.tests import create_item
+from rewards.models import Wallet, WalletTransaction
+from . import availability, codes, transitions
+from .models import Booking
+from .pagination import CreatedCursorPagination
+from .serializers import OVERLAP_MESSAGE, BookingCreateSerializer, is_overlap_violation
 
-# Create your tests here.
+User = get_user_model()
+
+
+class ItemAvailabilityTests(TestCase):
+    """Item calendars follow booking status transitions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='pass')
+        cls.renter = User.objects.create_user(username='renter', password='pass')
+        cls.item = create_item(cls.owner)
+        cls.start = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        cache.clear()
+
+    def book(self, start_hours, end_hours, status='pending'):
+        return Booking.objects.create(
+            renter=self.renter,
+            item=self.item,
+            start_time=self.start + timedelta(hours=start_hours),
+            end_time=self.start + timedelta(hours=end_hours),
+            total_price=20,
+            status=status,
+        )
+
+    def busy(self):
+        response = self.client.get(
+            f'/api/items/items/{self.item.id}/availability/',
+            {'start': self.start.isoformat(), 'end': (self.start + timedelta(days=1)).isoformat()}
+        )
+        return [(interval['start'], interval['end']) for interval in response.json()['busy']]
+
+    def hours(self, start_hours, end_hours):
+        return (
+            (self.start + timedelta(hours=start_hours)).isoformat().replace('+00:00', 'Z'),
+            (self.start + timedelta(hours=end_hours)).isoformat().replace('+00:00', 'Z'),
+        )
+
+    def test_merged_and_updated_on_transitions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(2, 5, status='accepted')
+            pending = self.book(4, 8)
+            self.book(10, 12, status='cancelled')
+        self.assertEqual(self.busy(), [self.hours(2, 8)])
+
+        self.client.force_authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/bookings/bookings/{pending.id}/reject/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.busy(), [self.hours(2, 5)])
+
+    def test_racing_transitions(self):
+        # Two requests that both read the booking as pending
+        first = Booking.objects.get(pk=self.book(2, 5).pk)
+        second = Booking.objects.get(pk=first.pk)
+        self.assertEqual(self.busy(), [self.hours(2, 5)])
+        events = []
+
+        def record(sender, booking, action, **kwargs):
+            events.append(action)
+
+        transitions.booking_transitioned.connect(record)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                transitions.transition(first, 'reject')
+            with self.assertRaises(transitions.InvalidTransition) as raised:
+                transitions.transition(second, 'accept')
+        finally:
+            transitions.booking_transitioned.disconnect(record)
+
+        self.assertEqual(raised.exception.status, 'cancelled')
+        self.assertEqual(events, ['reject'])
+        self.assertEqual(Booking.objects.get(pk=first.pk).status, 'cancelled')
+        self.assertEqual(self.busy(), [])
+
+    def test_clipped_to_range(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(-2, 1, status='active')
+        self.assertEqual(self.busy(), [self.hours(0, 1)])
+
+    def test_short_ttl_without_shared_cache(self):
+        # Other workers' drops never reach a per-process cache
+        with self.settings(SHARED_CACHE=False), mock.patch.object(cache, 'set') as cache_set:
+            availability.busy_intervals(self.item.id)
+        self.assertEqual(cache_set.call_args.args[2], availability.LOCAL_CACHE_TTL)
+        with self.settings(SHARED_CACHE=True), mock.patch.object(cache, 'set') as cache_set:
+            availability.busy_intervals(self.item.id)
+        self.assertEqual(cache_set.call_args.args[2], availability.CACHE_TTL)
+
+
+class BookingOverlapTests(TestCase):
+    """Creating a booking rejects windows the item is already booked for"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.renter = User.objects.create_user(username='renter', password='pass')
+        cls.item = create_item(owner)
+        cls.start = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.renter)
+
+    def book(self, start_hours, end_hours):
+        return self.client.post('/api/bookings/bookings/', {
+            'item_id': self.item.id,
+            'start_time': (self.start + timedelta(hours=start_hours)).isoformat(),
+            'end_time': (self.start + timedelta(hours=end_hours)).isoformat(),
+        }, format='json')
+
+    def serializer(self, start_hours, end_hours):
+        return BookingCreateSerializer(data={
+            'item_id': self.item.id,
+            'start_time': (self.start + timedelta(hours=start_hours)).isoformat(),
+            'end_time': (self.start + timedelta(hours=end_hours)).isoformat(),
+        }, context={'request': mock.Mock(user=self.renter)})
+
+    def test_overlap_rejected(self):
+        self.assertEqual(self.book(2, 5).status_code, 201)
+        response = self.book(4, 6)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': [OVERLAP_MESSAGE]})
+        # Back to back is fine
+        self.assertEqual(self.book(5, 6).status_code, 201)
+        self.assertEqual(Booking.objects.filter(item=self.item).count(), 2)
+
+    def test_overlap_found_under_lock(self):
+        # Another request books the window between validate() and create()
+        serializer = self.serializer(2, 5)
+        self.assertTrue(serializer.is_valid())
+        Booking.objects.create(
+            renter=self.renter,
+            item=self.item,
+            start_time=self.start + timedelta(hours=4),
+            end_time=self.start + timedelta(hours=6),
+            total_price=10,
+        )
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertEqual(raised.exception.detail, {'non_field_errors': [OVERLAP_MESSAGE]})
+        self.assertEqual(Booking.objects.filter(item=self.item).count(), 1)
+
+    def test_exclusion_violation(self):
+        def violation(pgcode, constraint_name):
+            # Django's IntegrityError wraps the driver's, which has the details
+            cause = Exception('conflicting key value violates exclusion constraint')
+            cause.pgcode = pgcode
+            cause.diag = SimpleNamespace(constraint_name=constraint_name)
+            error = IntegrityError(*cause.args)
+            error.__cause__ = cause
+            return error
+
+        overlap = violation('23P01', Booking.NO_OVERLAP_CONSTRAINT)
+        self.assertTrue(is_overlap_violation(overlap))
+        self.assertFalse(is_overlap_violation(violation('23505', Booking.NO_OVERLAP_CONSTRAINT)))
+        self.assertFalse(is_overlap_violation(violation('23P01', 'other_constraint')))
+        # Matched by SQLSTATE and name, not by message
+        self.assertFalse(is_overlap_violation(IntegrityError(Booking.NO_OVERLAP_CONSTRAINT)))
+
+        serializer = self.serializer(2, 5)
+        self.assertTrue(serializer.is_valid())
+        with mock.patch.object(Booking.objects, 'create', side_effect=overlap):
+            with self.assertRaises(ValidationError) as raised:
+                serializer.save()
+        self.assertEqual(raised.exception.detail, {'non_field_errors': [OVERLAP_MESSAGE]})
+
+        serializer = self.serializer(2, 5)
+        self.assertTrue(serializer.is_valid())
+        with mock.patch.object(Booking.objects, 'create', side_effect=IntegrityError('other')):
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+
+
+class BookingCodeTests(TestCase):
+    """Booking codes are derived from the id, skipping codes already taken"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.renter = User.objects.create_user(username='renter', password='pass')
+        cls.item = create_item(cls.renter)
+
+    def book(self, booking_code=None):
+        start = timezone.now() + timedelta(days=1)
+        return Booking.objects.create(
+            renter=self.renter,
+            item=self.item,
+            start_time=start,
+            end_time=start + timedelta(hours=2),
+            total_price=10,
+            status='completed',
+            booking_code=booking_code,
+        )
+
+    def test_derived_from_id(self):
+        booking = self.book()
+        self.assertEqual(booking.booking_code, codes.code_for(booking.pk))
+        booking.refresh_from_db()
+        self.assertEqual(booking.booking_code, codes.code_for(booking.pk))
+
+    def test_collision_with_existing_code(self):
+        # A legacy random code that happens to be the next booking's code
+        legacy = self.book(booking_code='LEGACY')
+        taken = codes.code_for(legacy.pk + 1)
+        legacy.booking_code = taken
+        legacy.save()
+
+        booking = self.book()
+        self.assertEqual(booking.pk, legacy.pk + 1)
+        self.assertEqual(booking.booking_code, codes.code_for(booking.pk, attempt=1))
+
+
+class BookingListTests(TestCase):
+    """The booking list merges renter, item owner and bundle creator bookings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        other = User.objects.create_user(username='other', password='pass')
+        own_item = create_item(cls.user)
+        other_item = create_item(other, title='Ladder')
+        bundle = Bundle.objects.create(creator=cls.user, name='Kit', description='Test bundle')
+        start = timezone.now() + timedelta(days=1)
+
+        def book(renter, **target):
+            return Booking.objects.create(
+                renter=renter,
+                start_time=start,
+                end_time=start + timedelta(hours=2),
+                total_price=10,
+                status='completed',
+                **target
+            )
+
+        cls.renting = [book(cls.user, item=other_item) for _ in range(15)]
+        cls.owning = [book(other, item=own_item) for _ in range(15)]
+        cls.bundles = [book(other, bundle=bundle) for _ in range(5)]
+        # In both the renter and the owner branch
+        cls.own_rental = book(cls.user, item=own_item)
+        book(other, item=other_item)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def ids(self, bookings):
+        return [booking.id for booking in sorted(bookings, key=lambda b: (b.created_at, b.id), reverse=True)]
+
+    def list_all(self, **params):
+        ids = []
+        response = self.client.get('/api/bookings/bookings/', dict(params, cursor=''))
+        while True:
+            ids += [booking['id'] for booking in response.json()['results']]
+            if not response.json()['next']:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_all_roles_paginated(self):
+        self.assertEqual(
+            self.list_all(),
+            self.ids(self.renting + self.owning + self.bundles + [self.own_rental])
+        )
+
+    def test_role_filter(self):
+        self.assertEqual(self.list_all(role='renter'), self.ids(self.renting + [self.own_rental]))
+        self.assertEqual(
+            self.list_all(role='owner'), self.ids(self.owning + self.bundles + [self.own_rental])
+        )
+        response = self.client.get('/api/bookings/bookings/', {'role': 'admin'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_numbers_by_default(self):
+        expected = self.ids(self.renting + self.owning + self.bundles + [self.own_rental])
+        body = self.client.get('/api/bookings/bookings/').json()
+        self.assertEqual(body['count'], len(expected))
+        self.assertIsNone(body['previous'])
+        self.assertEqual([booking['id'] for booking in body['results']], expected[:len(body['results'])])
+
+        body = self.client.get(body['next']).json()
+        self.assertIsNotNone(body['previous'])
+        self.assertEqual([booking['id'] for booking in body['results']], expected[len(expected) - len(body['results']):])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/bookings/bookings/', {'cursor': 'bm90IGEgY3Vyc29y'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingListQueryCountTests(TestCase):
+    """The booking list must not run a query per booking"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        others = [User.objects.create_user(username=f'other{i}', password='pass') for i in range(4)]
+        start = timezone.now() + timedelta(days=1)
+        for i in range(100):
+            other = others[i % len(others)]
+            if i % 4 == 0:
+                # Bundle booked by someone else
+                target = {'bundle': Bundle.objects.create(
+                    creator=cls.user, name=f'Kit {i}', description='Test bundle'
+                )}
+                renter = other
+            else:
+                target = {'item': create_item(cls.user if i % 2 else other, title=f'Item {i}')}
+                renter = other if i % 2 else cls.user
+            Booking.objects.create(
+                renter=renter,
+                start_time=start,
+                end_time=start + timedelta(hours=2),
+                total_price=10,
+                status='completed',
+                **target
+            )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.user)
+
+    def test_100_booking_page(self):
+        # One query per role branch: renter, item owner, bundle creator
+        with mock.patch.object(CreatedCursorPagination, 'page_size', 100):
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/bookings/bookings/', {'cursor': ''})
+        results = response.json()['results']
+        self.assertEqual(len(results), 100)
+        bundles = [result for result in results if result['bundle']]
+        self.assertEqual(len(bundles), 25)
+        self.assertTrue(all(result['owner']['username'] == 'user' for result in bundles))
+
+    def test_page_number_page(self):
+        # Count + page, both over the union of the per-role lookups
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/bookings/bookings/')
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertIn(' UNION ', query['sql'])
+            self.assertNotIn(' OR ', query['sql'])
+        body = response.json()
+        self.assertEqual(body['count'], 100)
+        self.assertEqual(len(body['results']), 20)
+
+
+class BookingCompletionTests(TestCase):
+    """Completing bookings settles wallets and counters without lost updates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='pass')
+        cls.renter = User.objects.create_user(username='renter', password='pass')
+        Wallet.objects.create(user=cls.owner)
+        Wallet.objects.create(user=cls.renter)
+        cls.item = create_item(cls.owner, carbon_offset_kg=3)
+        start = timezone.now() - timedelta(hours=3)
+        cls.bookings = [
+            Booking.objects.create(
+                renter=cls.renter,
+                item=cls.item,
+                start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i + 1),
+                total_price=10,
+                wallet_credit_used=2,
+                status='active',
+            )
+            for i in range(2)
+        ]
+
+    def load(self, booking):
+        return Booking.objects.select_related(
+            'item__owner__wallet', 'renter__wallet'
+        ).get(pk=booking.pk)
+
+    def test_no_lost_updates(self):
+        # Both loaded before either completes, as by two concurrent requests
+        first, second = self.load(self.bookings[0]), self.load(self.bookings[1])
+        self.assertEqual(first.complete(), (100, 400))
+        self.assertEqual(second.complete(), (100, 400))
+        # Already completed
+        with self.assertRaises(transitions.InvalidTransition):
+            self.load(self.bookings[0]).complete()
+
+        owner_wallet = Wallet.objects.get(user=self.owner)
+        self.assertEqual(owner_wallet.balance, 16)
+        self.assertEqual(owner_wallet.lifetime_earned, 20)
+        self.assertEqual(owner_wallet.reward_points, 800)
+        self.assertEqual(Wallet.objects.get(user=self.renter).reward_points, 200)
+        self.assertEqual(
+            sorted(WalletTransaction.objects.values_list('balance_after', flat=True)), [8, 16]
+        )
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.total_rentals, 2)
+        self.renter.refresh_from_db()
+        self.assertEqual(self.renter.co2_saved_kg, 6)
+
+    def test_missing_wallet(self):
+        Wallet.objects.filter(user=self.renter).delete()
+        with self.assertRaises(Wallet.DoesNotExist):
+            self.load(self.bookings[0]).complete()
+        # Rolled back: still active, nothing settled
+        self.assertEqual(Booking.objects.get(pk=self.bookings[0].pk).status, 'active')
+        self.assertEqual(Wallet.objects.get(user=self.owner).balance, 0)
+        self.assertFalse(WalletTransaction.objects.exists())
+
+    def test_suggestions_reranked(self):
+        title_index.reset()
+        self.assertEqual(title_index.suggest('cord')[0][3], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load(self.bookings[0]).complete()
+        # Without waiting for the periodic refresh
+        self.assertEqual(title_index.suggest('cord')[0][3], 1)
+
+    def test_complete_endpoint(self):
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(self.owner)
+        url = f'/api/bookings/bookings/{self.bookings[0].id}/complete/'
+        response = client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rewards'], {'renter_points': 100, 'owner_points': 400})
+        self.assertEqual(client.post(url).status_code, 400)
@@ -0,0 +1,69 @@
+"""
+Booking status transitions
+
+Every status change goes through transition(), which applies it as one
+conditional UPDATE ... WHERE status = <expected status>. When two
+requests race, the database lets exactly one of them change the row; the
+other updates nothing and gets InvalidTransition, with no read before
+the write and no save of the whole row.
+
+Queryset updates don't send post_save, so each successful transition
+sends booking_transitioned instead; caches and counters that depend on
+booking status subscribe to it.
+"""
+
+import django.dispatch
+from django.utils import timezone
+
+# Sent after a transition is applied, inside its transaction.
+# Arguments: booking, action, old_status, new_status
+booking_transitioned = django.dispatch.Signal()
+
+# action: (expected status, new status)
+TRANSITIONS = {
+    'accept': ('pending', 'accepted'),
+    'reject': ('pending', 'cancelled'),
+    'activate': ('accepted', 'active'),
+    'complete': ('active', 'completed'),
+}
+
+
+class InvalidTransition(Exception):
+    """The booking was not in the status the action starts from"""
+
+    def __init__(self, action, status):
+        self.action = action
+        self.status = status
+        super().__init__(f"Cannot {action} booking with status: {status}")
+
+
+def transition(booking, action, **fields):
+    """
+    Apply an action to a booking if it is still in the expected status
+
+    Args:
+        booking: The booking; its status and fields are updated in place
+        action: A key of TRANSITIONS
+        **fields: Other fields to set in the same UPDATE
+
+    Raises:
+        InvalidTransition: The booking had another status, e.g. because a
+            concurrent request changed it first
+    """
+    from .models import Booking
+
+    old_status, new_status = TRANSITIONS[action]
+    changes = dict(fields, status=new_status, updated_at=timezone.now())
+
+    updated = Booking.objects.filter(pk=booking.pk, status=old_status).update(**changes)
+    if not updated:
+        current = Booking.objects.filter(pk=booking.pk).values_list('status', flat=True).first()
+        raise InvalidTransition(action, current)
+
+    for field, value in changes.items():
+        setattr(booking, field, value)
+    booking_transitioned.send(
+        sender=Booking, booking=booking, action=action,
+        old_status=old_status, new_status=new_status
+    )
+    return booking
@@ -1,9 +1,14 @@
+import heapq
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q
+from rewards.models import Wallet
+from . import transitions
 from .models import Booking
+from .pagination import CreatedCursorPagination
 from .serializers import (
     BookingListSerializer,
     BookingCreateSerializer,
@@ -16,12 +21,95 @@ class BookingViewSet(viewsets.ModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     
+    # Everything BookingListSerializer reads, in the bookings query itself
+    LIST_RELATED = ('item', 'item__owner', 'renter', 'bundle', 'bundle__creator')
+    
     def get_queryset(self):
         """Get bookings for current user (as renter or owner)"""
         user = self.request.user
         return Booking.objects.filter(
-            Q(renter=user) | Q(item__owner=user)
-        ).select_related('item', 'renter', 'item__owner').order_by('-created_at')
+            Q(renter=user) | Q(item__owner=user) | Q(bundle__creator=user)
+        ).select_related(*self.LIST_RELATED).order_by('-created_at')
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Bookings of the current user, newest first
+        
+        Query params:
+        - role (optional): renter, or owner (of the item or bundle); both
+          when omitted
+        - cursor (optional): Keyset pagination; send it empty for the first
+          page, then follow the "next" link. Without it, pages are numbered
+          (page param) and responses have count and previous as before.
+        
+        Each role is its own query served by a (column, -created_at)
+        index - one OR across the items join can't use an index. In keyset
+        mode they are merged here by created_at; with page numbers the
+        database pages through the union of their ids.
+        """
+        role = request.query_params.get('role') or None
+        if role not in (None, 'renter', 'owner'):
+            return Response(
+                {'error': 'role must be renter or owner'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        user = request.user
+        conditions = []
+        if role != 'owner':
+            conditions.append(Q(renter=user))
+        if role != 'renter':
+            conditions.append(Q(item__owner=user))
+            conditions.append(Q(bundle__creator=user))
+        
+        if not CreatedCursorPagination.requested(request):
+            # The union of the per-role id lookups, each served by its
+            # index, instead of one OR across the items and bundles joins;
+            # the count and the page both read from it
+            branches = [
+                Booking.objects.filter(condition).order_by().values('pk')
+                for condition in conditions
+            ]
+            queryset = Booking.objects.filter(
+                pk__in=branches[0].union(*branches[1:])
+            ).select_related(*self.LIST_RELATED).order_by('-created_at', '-id')
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        cursor = CreatedCursorPagination(request)
+        limit = cursor.page_size + 1
+        
+        def branch(condition):
+            queryset = Booking.objects.filter(condition)
+            if cursor.after:
+                after_created, after_id = cursor.after
+                queryset = queryset.filter(
+                    Q(created_at__lt=after_created) |
+                    Q(created_at=after_created, id__lt=after_id)
+                )
+            return queryset.select_related(
+                *self.LIST_RELATED
+            ).order_by('-created_at', '-id')[:limit]
+        
+        bookings = []
+        seen = set()
+        for booking in heapq.merge(
+            *(branch(condition) for condition in conditions),
+            key=CreatedCursorPagination.position,
+            reverse=True
+        ):
+            # Renting your own item puts a booking in two branches
+            if booking.id in seen:
+                continue
+            seen.add(booking.id)
+            bookings.append(booking)
+            if len(bookings) == limit:
+                break
+        
+        page = cursor.paginate(bookings, CreatedCursorPagination.position)
+        serializer = self.get_serializer(page, many=True)
+        return cursor.get_paginated_response(serializer.data)
     
     def get_serializer_class(self):
         """Return appropriate serializer"""
@@ -43,28 +131,30 @@ class BookingViewSet(viewsets.ModelViewSet):
             'booking': BookingDetailSerializer(booking).data
         }, status=status.HTTP_201_CREATED)
     
+    def _transition(self, booking, action):
+        """Apply a status transition, or the error response if it lost a race"""
+        try:
+            transitions.transition(booking, action)
+        except transitions.InvalidTransition as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+    
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         """Owner accepts booking request"""
         booking = self.get_object()
         
         # Only owner can accept
-        if booking.item.owner != request.user:
+        if booking.owner != request.user:
             return Response(
                 {'error': 'Only the item owner can accept this booking'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Can only accept pending bookings
-        if booking.status != 'pending':
-            return Response(
-                {'error': f'Cannot accept booking with status: {booking.status}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Accept booking
-        booking.status = 'accepted'
-        booking.save()
+        # Only from pending, and only once if requests race
+        error = self._transition(booking, 'accept')
+        if error:
+            return error
         
         serializer = self.get_serializer(booking)
         return Response({
@@ -78,22 +168,15 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking = self.get_object()
         
         # Only owner can reject
-        if booking.item.owner != request.user:
+        if booking.owner != request.user:
             return Response(
                 {'error': 'Only the item owner can reject this booking'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Can only reject pending bookings
-        if booking.status != 'pending':
-            return Response(
-                {'error': f'Cannot reject booking with status: {booking.status}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Reject booking
-        booking.status = 'cancelled'
-        booking.save()
+        error = self._transition(booking, 'reject')
+        if error:
+            return error
         
         return Response({
             'message': 'Booking rejected'
@@ -105,34 +188,17 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking = self.get_object()
         
         # Only owner can mark complete
-        if booking.item.owner != request.user:
+        if booking.owner != request.user:
             return Response(
                 {'error': 'Only the item owner can complete this booking'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Can only complete active bookings
-        if booking.status != 'active':
-            return Response(
-                {'error': 'Only active bookings can be completed'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Mark as completed
-        booking.mark_completed()
-        
-        # Award reward points
-        renter_points, owner_points = booking.calculate_reward_points()
-        
-        # Update wallets
-        booking.renter.wallet.add_points(renter_points)
-        booking.item.owner.wallet.add_points(owner_points)
-        booking.item.owner.wallet.add_balance(booking.total_price - booking.wallet_credit_used)
-        booking.item.owner.wallet.lifetime_earned += booking.total_price
-        booking.item.owner.wallet.save()
-        
-        # Update CO2 saved
-        booking.renter.add_co2_saved(booking.item.carbon_offset_kg)
+        # Complete and settle wallets, item and CO2 counters in one transaction
+        try:
+            renter_points, owner_points = booking.complete()
+        except (transitions.InvalidTransition, Wallet.DoesNotExist) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = self.get_serializer(booking)
         return Response({
@@ -150,22 +216,18 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking = self.get_object()
         
         # Owner or renter can activate
-        if booking.item.owner != request.user and booking.renter != request.user:
+        if booking.owner != request.user and booking.renter != request.user:
             return Response(
                 {'error': 'Permission denied'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        if booking.status != 'accepted':
-            return Response(
-                {'error': 'Only accepted bookings can be activated'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        booking.mark_active()
+        error = self._transition(booking, 'activate')
+        if error:
+            return error
         
         serializer = self.get_serializer(booking)
         return Response({
             'message': 'Booking activated - rental started',
             'booking': serializer.data
-        })
\ No newline at end of file
+        })
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ItemsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'items'
+
+    def ready(self):
+        from .geo import register_sqlite_functions
+        connection_created.connect(register_sqlite_functions)
+        from . import signals  # noqa: F401
@@ -0,0 +1,183 @@
+"""
+In-memory title index for search-as-you-type
+
+Every word of an available item's title becomes one entry; entries are
+kept in a NumPy array sorted by word, so all words starting with a
+prefix are one contiguous slice found by binary search. Matches are
+ranked by popularity (total_rentals).
+
+Like the location snapshot, it is an incremental index
+(items/incremental.py), here with its main segment sorted by word.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+
+from . import geo, incremental
+
+# Longer words are truncated; nobody types 32 characters before picking
+MAX_WORD_LENGTH = 32
+
+# Sorts after every character a word can contain
+_PREFIX_END = '\U0010ffff'
+
+
+def normalize_words(text):
+    """Lowercase, accent-free words of text"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word[:MAX_WORD_LENGTH] for word in re.findall(r'\w+', text.lower())]
+
+
+def _build_columns(rows, category_codes):
+    """Entry columns from (id, title, category, total_rentals, lat, lng) tuples"""
+    entries = [
+        (word, item_id, popularity, category_codes.get(category, -1),
+         geo.cell_for(lat, lng), title)
+        for item_id, title, category, popularity, lat, lng in rows
+        for word in dict.fromkeys(normalize_words(title))
+    ]
+    words, ids, popularity, categories, cells, titles = (
+        zip(*entries) if entries else ([], [], [], [], [], [])
+    )
+    title_array = np.empty(len(titles), dtype=object)
+    title_array[:] = titles
+    return {
+        'word': np.array(words, dtype=f'<U{MAX_WORD_LENGTH}'),
+        'id': np.array(ids, dtype=np.int64),
+        'popularity': np.array(popularity, dtype=np.int64),
+        'category': np.array(categories, dtype=np.int8),
+        # Items without coordinates never match a location filter
+        'cell': np.array([-1 if cell is None else cell for cell in cells], dtype=np.int64),
+        'title': title_array,
+    }
+
+
+class _Segment(incremental.Segment):
+    """Entries sorted by word; an item has one entry per word"""
+    sort_column = 'word'
+
+
+class TitleIndex(incremental.IncrementalIndex):
+    """
+    Per-process prefix index over available item titles
+    """
+    name = 'title index'
+    fields = ('id', 'title', 'category', 'total_rentals', 'lat', 'lng')
+    segment_class = _Segment
+
+    def build_columns(self, rows):
+        return _build_columns(rows, self.category_codes)
+
+    # Queries
+
+    def suggest(self, text, category=None, cells=None, limit=8):
+        """
+        Most rented available items whose title has a word starting with
+        the last word of text and contains every earlier word
+
+        Args:
+            cells: Optional grid cells (geo.cell_for) to restrict items to
+
+        Returns:
+            list: (id, title, category, total_rentals) tuples
+        """
+        words = normalize_words(text)
+        if not words:
+            return []
+        *required, prefix = words
+
+        self.ensure_fresh()
+        state = self._state
+
+        candidates = self._matching(state, prefix, prefix + _PREFIX_END, side='left')
+        mask = np.ones(len(candidates['id']), dtype=bool)
+        if required and len(candidates['id']):
+            # Lookup table by item id, cheaper than np.isin's sorting
+            size = int(candidates['id'].max()) + 1
+            for word in required:
+                has_word = np.zeros(size, dtype=bool)
+                ids = self._matching(state, word, word, side='right', names=('id',))['id']
+                has_word[ids[ids < size]] = True
+                mask &= has_word[candidates['id']]
+        if category:
+            mask &= candidates['category'] == self.category_codes.get(category, -2)
+        if cells is not None:
+            mask &= np.isin(candidates['cell'], np.asarray(cells, dtype=np.int64))
+        candidates = {name: array[mask] for name, array in candidates.items()}
+
+        # Most popular first, newest first among equals; only the top few
+        # need sorting
+        score = (candidates['popularity'] << 32) | candidates['id']
+        shortlist = min(len(score), limit * 4)
+        results = self._collect(state, candidates, score, shortlist, limit)
+        if len(results) < limit and shortlist < len(score):
+            # Titles with several words matching the prefix took up the shortlist
+            results = self._collect(state, candidates, score, len(score), limit)
+        return results
+
+    @staticmethod
+    def _matching(state, low, high, side, names=('id', 'popularity', 'category', 'cell')):
+        """
+        Columns of the live entries whose word is between low and high
+        (high is included with side='right')
+        """
+        main_words = state.main['word']
+        start = np.searchsorted(main_words, low, side='left')
+        stop = np.searchsorted(main_words, high, side=side)
+        positions = np.arange(start, stop)
+        positions = positions[state.live[positions]]
+        tail_words = state.tail['word']
+        in_range = tail_words <= high if side == 'right' else tail_words < high
+        tail_rows = np.flatnonzero((tail_words >= low) & in_range)
+        columns = {
+            name: np.concatenate([state.main[name][positions], state.tail[name][tail_rows]])
+            for name in names
+        }
+        # Where each entry came from; tail rows are stored as -(row + 1)
+        columns['position'] = np.concatenate([positions, -tail_rows - 1])
+        return columns
+
+    def _collect(self, state, candidates, score, count, limit):
+        """Up to limit distinct results from the count best scored candidates"""
+        if count < len(score):
+            top = np.argpartition(-score, count - 1)[:count]
+        else:
+            top = np.arange(len(score))
+        top = top[np.argsort(-score[top])]
+
+        category_names = list(self.category_codes)
+        results = []
+        seen = set()
+        for row in top:
+            item_id = int(candidates['id'][row])
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            position = int(candidates['position'][row])
+            if position >= 0:
+                title = state.main['title'][position]
+            else:
+                title = state.tail['title'][-position - 1]
+            code = int(candidates['category'][row])
+            results.append((
+                item_id, title, category_names[code] if code >= 0 else None,
+                int(candidates['popularity'][row]),
+            ))
+            if len(results) == limit:
+                break
+        return results
+
+    def stats(self):
+        state = self._state
+        return {
+            'entries': state.rows,
+            'tail_entries': len(state.tail['id']),
+            'watermark': self._watermark,
+        }
+
+
+# Singleton instance
+title_index = TitleIndex()
@@ -0,0 +1,176 @@
+"""
+Map marker clustering
+
+Items are aggregated into a grid per zoom level: a 256px map tile at
+zoom z spans 360 / 2**z degrees of longitude and is split into
+CELLS_PER_TILE x CELLS_PER_TILE cluster cells. The finest level is
+computed from the items, and every coarser level is computed from the
+level below by merging 2x2 blocks of cells, so building all levels costs
+little more than building one.
+"""
+
+import math
+
+import numpy as np
+
+# Zoom levels up to this are served as clusters; deeper zooms get items
+MAX_CLUSTER_ZOOM = 16
+
+# Cluster cells per tile edge (4 -> 64px cells)
+CELLS_PER_TILE = 4
+
+
+def cell_size(zoom):
+    """Cluster cell size in degrees at a zoom level"""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def grid_columns(zoom):
+    """Number of cluster cells around the globe at a zoom level"""
+    return (2 ** zoom) * CELLS_PER_TILE
+
+
+def lng_ranges(west, east):
+    """Split a viewport's longitude span in two when it crosses the antimeridian"""
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east)]
+
+
+class _Level:
+    """Clusters of one zoom level, sorted by cell key"""
+
+    def __init__(self, zoom, keys, count, lat_sum, lng_sum, min_price, first_id, histogram):
+        self.zoom = zoom
+        self.keys = keys
+        self.count = count
+        self.lat_sum = lat_sum
+        self.lng_sum = lng_sum
+        self.min_price = min_price
+        self.first_id = first_id
+        self.histogram = histogram
+
+    @classmethod
+    def from_points(cls, zoom, ids, lat, lng, price, category, n_categories):
+        size = cell_size(zoom)
+        columns = grid_columns(zoom)
+        rows = np.clip(((lat + 90.0) // size).astype(np.int64), 0, columns // 2 - 1)
+        cols = np.clip(((lng + 180.0) // size).astype(np.int64), 0, columns - 1)
+        return cls._aggregate(
+            zoom, rows * columns + cols,
+            np.ones(len(ids), dtype=np.int64), lat, lng, price, ids,
+            np.eye(n_categories, dtype=np.int32)[category] if len(ids)
+            else np.zeros((0, n_categories), dtype=np.int32),
+        )
+
+    def parent(self):
+        """The next coarser level, merging 2x2 blocks of cells"""
+        columns = grid_columns(self.zoom)
+        rows, cols = self.keys // columns, self.keys % columns
+        parent_keys = (rows // 2) * (columns // 2) + cols // 2
+        return self._aggregate(
+            self.zoom - 1, parent_keys, self.count, self.lat_sum, self.lng_sum,
+            self.min_price, self.first_id, self.histogram,
+        )
+
+    @classmethod
+    def _aggregate(cls, zoom, keys, count, lat_sum, lng_sum, min_price, first_id, histogram):
+        if not len(keys):
+            empty = np.empty(0)
+            return cls(zoom, keys, count, empty, empty, empty, first_id, histogram)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        unique_keys, starts = np.unique(keys, return_index=True)
+        return cls(
+            zoom,
+            unique_keys,
+            np.add.reduceat(count[order], starts),
+            np.add.reduceat(lat_sum[order], starts),
+            np.add.reduceat(lng_sum[order], starts),
+            np.minimum.reduceat(min_price[order], starts),
+            np.minimum.reduceat(first_id[order], starts),
+            np.add.reduceat(histogram[order], starts, axis=0),
+        )
+
+    def in_bbox(self, south, west, north, east):
+        """Positions of the clusters whose cell intersects the viewport"""
+        size = cell_size(self.zoom)
+        columns = grid_columns(self.zoom)
+        first_row = int(math.floor((south + 90.0) / size))
+        last_row = int(math.floor((north + 90.0) / size))
+
+        # Cells are keyed row by row, so the viewport rows form one key range
+        start = np.searchsorted(self.keys, first_row * columns, side='left')
+        stop = np.searchsorted(self.keys, (last_row + 1) * columns, side='left')
+        positions = np.arange(start, stop)
+        cols = self.keys[positions] % columns
+
+        mask = np.zeros(len(positions), dtype=bool)
+        for low, high in lng_ranges(west, east):
+            first_col = int(math.floor((low + 180.0) / size))
+            last_col = int(math.floor((high + 180.0) / size))
+            mask |= (cols >= first_col) & (cols <= last_col)
+        return positions[mask]
+
+
+class ClusterIndex:
+    """
+    Precomputed clusters for every zoom level up to MAX_CLUSTER_ZOOM
+    """
+
+    def __init__(self, ids, lat, lng, price, category, category_names):
+        self.category_names = list(category_names)
+        # Unknown categories (code -1) are counted as the last category
+        category = np.where(category < 0, len(self.category_names) - 1, category)
+
+        self.levels = {}
+        level = _Level.from_points(
+            MAX_CLUSTER_ZOOM, ids, lat, lng, price, category, len(self.category_names)
+        )
+        self.levels[MAX_CLUSTER_ZOOM] = level
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            level = level.parent()
+            self.levels[zoom] = level
+
+    @classmethod
+    def from_rows(cls, rows, category_names):
+        """Build from (id, lat, lng, category, price) tuples"""
+        category_names = list(category_names)
+        codes = {name: code for code, name in enumerate(category_names)}
+        rows = list(rows)
+        return cls(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.float64),
+            np.array([row[2] for row in rows], dtype=np.float64),
+            np.array([float(row[4]) for row in rows], dtype=np.float64),
+            np.array([codes.get(row[3], -1) for row in rows], dtype=np.int64),
+            category_names,
+        )
+
+    def clusters(self, south, west, north, east, zoom):
+        """
+        Clusters intersecting a viewport at a zoom level
+
+        Returns:
+            list: dicts with count, centroid, min price and category counts
+        """
+        level = self.levels[max(0, min(zoom, MAX_CLUSTER_ZOOM))]
+        results = []
+        for position in level.in_bbox(south, west, north, east):
+            count = int(level.count[position])
+            histogram = level.histogram[position]
+            cluster = {
+                'lat': round(float(level.lat_sum[position]) / count, 6),
+                'lng': round(float(level.lng_sum[position]) / count, 6),
+                'count': count,
+                'min_price': round(float(level.min_price[position]), 2),
+                'categories': {
+                    name: int(histogram[code])
+                    for code, name in enumerate(self.category_names)
+                    if histogram[code]
+                },
+            }
+            if count == 1:
+                cluster['item_id'] = int(level.first_id[position])
+            results.append(cluster)
+        return results
@@ -0,0 +1,74 @@
+"""
+Facet counts for search results
+
+All facets are conditional COUNTs in one aggregate query over the
+matching items, instead of one query per category or bucket.
+"""
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+# (label, low, high) price per hour buckets; high is exclusive
+PRICE_BUCKETS = [
+    ('0-5', 0, 5),
+    ('5-10', 5, 10),
+    ('10-20', 10, 20),
+    ('20-50', 20, 50),
+    ('50+', 50, None),
+]
+
+# (label, low, high) rating bands over rated items; high is exclusive
+RATING_BANDS = [
+    ('4+', 4, None),
+    ('3-4', 3, 4),
+    ('2-3', 2, 3),
+    ('0-2', 0, 2),
+]
+
+
+def _range_q(field, low, high):
+    q = Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__lt': high})
+    return q
+
+
+def facet_counts(queryset):
+    """
+    Category, price, video and rating counts of the items in queryset
+
+    Returns:
+        dict: categories (every Item.CATEGORY_CHOICES value), price,
+        has_video and rating counts
+    """
+    from .models import Item, ItemVideo
+
+    aggregates = {'total': Count('id')}
+    for value, _ in Item.CATEGORY_CHOICES:
+        aggregates[f'category_{value}'] = Count('id', filter=Q(category=value))
+    for index, (_, low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count('id', filter=_range_q('price_per_hour', low, high))
+    aggregates['has_video'] = Count(
+        'id', filter=Exists(ItemVideo.objects.filter(item=OuterRef('pk')))
+    )
+    aggregates['unrated'] = Count('id', filter=Q(total_ratings=0))
+    for index, (_, low, high) in enumerate(RATING_BANDS):
+        aggregates[f'rating_{index}'] = Count(
+            'id', filter=Q(total_ratings__gt=0) & _range_q('rating_avg', low, high)
+        )
+
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        'total': counts['total'],
+        'categories': {
+            value: counts[f'category_{value}'] for value, _ in Item.CATEGORY_CHOICES
+        },
+        'price': {
+            label: counts[f'price_{index}']
+            for index, (label, _, _) in enumerate(PRICE_BUCKETS)
+        },
+        'has_video': counts['has_video'],
+        'rating': dict(
+            [(label, counts[f'rating_{index}']) for index, (label, _, _) in enumerate(RATING_BANDS)],
+            unrated=counts['unrated'],
+        ),
+    }
@@ -0,0 +1,107 @@
+"""
+Full-text search over item titles, descriptions and categories
+
+PostgreSQL keeps a weighted tsvector in Item.search_vector behind a GIN
+index; SQLite (local runs) keeps an FTS5 table keyed by item id. Both are
+refreshed when an item is saved, and matches are annotated with a
+search_rank where higher means more relevant.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# SQLite FTS5 table (created by migration 0004)
+FTS_TABLE = 'items_fts'
+
+# Fields that feed the index; saves touching none of them skip reindexing
+TEXT_FIELDS = ('title', 'description', 'category')
+
+# bm25 column weights matching the A/B/C tsvector weights
+FTS_WEIGHTS = '10.0, 4.0, 1.0'
+
+
+def search_vector():
+    """Weighted tsvector expression for an item row"""
+    return (
+        SearchVector('title', weight='A') +
+        SearchVector('description', weight='B') +
+        SearchVector('category', weight='C')
+    )
+
+
+def fts5_query(text):
+    """
+    Turn user input into an FTS5 query where every word must match
+
+    Words are quoted so FTS5 operators in the input are matched literally.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"' for word in words) or None
+
+
+def index_item(item, using='default'):
+    """Refresh the full-text index entry of a saved item"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        type(item).objects.using(using).filter(pk=item.pk).update(
+            search_vector=search_vector()
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [item.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, category) '
+                f'VALUES (%s, %s, %s, %s)',
+                [item.pk, item.title, item.description, item.category]
+            )
+
+
+def unindex_item(pk, using='default'):
+    """Drop a deleted item from the SQLite index (tsvectors go with the row)"""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def match(queryset, text):
+    """
+    Items of queryset matching text, annotated with search_rank
+
+    Other database backends fall back to case-insensitive containment
+    with a constant rank.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+    if vendor == 'sqlite':
+        query = fts5_query(text)
+        if query is None:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        # bm25() is lower for better matches
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query])
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+                [query],
+                output_field=FloatField()
+            )
+        )
+
+    return queryset.filter(
+        Q(title__icontains=text) |
+        Q(description__icontains=text) |
+        Q(category__icontains=text)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,276 @@
+"""
+Geo helpers for item search
+
+Items are bucketed into a fixed lat/lng grid so that radius searches can
+be narrowed to the covering cells (and the existing (lat, lng) index)
+before the exact Haversine check runs.
+
+This module is the single home of the Haversine formula: haversine_km()
+for one pair of points, haversine_array() for batches, and the Haversine
+expression for distances computed by the database.
+"""
+
+import math
+import numpy as np
+from django.db.models import F, FloatField, Func, Q, Value
+
+EARTH_RADIUS_KM = 6371
+
+# Grid cell size in degrees (~5.5km north-south)
+CELL_SIZE_DEG = 0.05
+CELL_ROWS = int(math.ceil(180 / CELL_SIZE_DEG))
+CELL_COLS = int(math.ceil(360 / CELL_SIZE_DEG))
+
+# Above this many cell rows the bounding box alone is a better prefilter
+MAX_CELL_ROWS = 64
+
+# Distances are rounded to 2 decimals before being compared to the radius,
+# so the prefilter has to keep anything that could round down into range
+RADIUS_PADDING_KM = 0.01
+
+
+def cell_row(lat):
+    """Grid row for a latitude"""
+    return min(int((lat + 90) // CELL_SIZE_DEG), CELL_ROWS - 1)
+
+
+def cell_col(lng):
+    """Grid column for a longitude"""
+    return min(int((lng + 180) // CELL_SIZE_DEG), CELL_COLS - 1)
+
+
+def cell_for(lat, lng):
+    """
+    Get the grid cell id for a coordinate
+
+    Cells are numbered row by row, so every cell in a latitude band forms a
+    contiguous id range.
+    """
+    if lat is None or lng is None:
+        return None
+    return cell_row(lat) * CELL_COLS + cell_col(lng)
+
+
+def neighbour_cells(lat, lng):
+    """The cell containing a coordinate and the eight cells around it"""
+    row, col = cell_row(lat), cell_col(lng)
+    return [
+        r * CELL_COLS + (c % CELL_COLS)
+        for r in range(max(row - 1, 0), min(row + 1, CELL_ROWS - 1) + 1)
+        for c in range(col - 1, col + 2)
+    ]
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Get the lat/lng box containing every point within radius_km
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lng, max_lng). The longitude span
+        falls back to the full range when the circle reaches a pole or
+        crosses the antimeridian.
+    """
+    angular = (radius_km + RADIUS_PADDING_KM) / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angular)
+    min_lat = max(lat - delta_lat, -90.0)
+    max_lat = min(lat + delta_lat, 90.0)
+
+    cos_lat = math.cos(math.radians(lat))
+    if min_lat == -90.0 or max_lat == 90.0 or math.sin(angular) >= cos_lat:
+        return min_lat, max_lat, -180.0, 180.0
+
+    delta_lng = math.degrees(math.asin(math.sin(angular) / cos_lat))
+    min_lng = lng - delta_lng
+    max_lng = lng + delta_lng
+    if min_lng < -180.0 or max_lng > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def cell_ranges(min_lat, max_lat, min_lng, max_lng):
+    """
+    Get the (first, last) cell id ranges covering a bounding box,
+    one range per grid row
+    """
+    first_col = cell_col(min_lng)
+    last_col = cell_col(max_lng)
+    return [
+        (row * CELL_COLS + first_col, row * CELL_COLS + last_col)
+        for row in range(cell_row(min_lat), cell_row(max_lat) + 1)
+    ]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Calculate distance using Haversine formula
+    Returns distance in kilometers, rounded to 2 decimals
+    """
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lng = math.radians(lng2 - lng1)
+    
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lng / 2) ** 2)
+    # Rounding can push a just past 1 for near-antipodal points
+    a = min(1.0, max(0.0, a))
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    
+    return round(EARTH_RADIUS_KM * c, 2)
+
+
+def haversine_array(lat1, lng1, lat2, lng2):
+    """
+    Vectorized Haversine distance
+
+    Args:
+        lat1, lng1: Origin coordinate(s) - scalars or arrays
+        lat2, lng2: Destination coordinates - scalars or arrays
+
+    Inputs are broadcast against each other, so a single origin can be
+    measured against an array of item coordinates in one call.
+
+    Returns:
+        np.ndarray: Distances in kilometers, rounded to 2 decimals
+    """
+    lat1 = np.asarray(lat1, dtype=np.float64)
+    lng1 = np.asarray(lng1, dtype=np.float64)
+    lat2 = np.asarray(lat2, dtype=np.float64)
+    lng2 = np.asarray(lng2, dtype=np.float64)
+    
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = np.radians(lat2 - lat1)
+    delta_lng = np.radians(lng2 - lng1)
+    
+    a = np.clip(
+        np.sin(delta_lat / 2) ** 2 +
+        np.cos(lat1_rad) * np.cos(lat2_rad) *
+        np.sin(delta_lng / 2) ** 2,
+        0, 1
+    )
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    return np.round(EARTH_RADIUS_KM * c, 2)
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    """Register HAVERSINE() on new SQLite connections (connection_created hook)"""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'HAVERSINE', 4, haversine_km, deterministic=True
+        )
+
+
+class Haversine(Func):
+    """
+    Database-side distance in km from a fixed point to an item's lat/lng,
+    rounded to 2 decimals to match haversine_km()
+
+    SQLite calls the HAVERSINE() function registered on each connection;
+    PostgreSQL evaluates the formula inline.
+    """
+    function = 'HAVERSINE'
+    output_field = FloatField()
+    
+    def __init__(self, lat, lng, lat_field='lat', lng_field='lng', **extra):
+        lat, lng = float(lat), float(lng)
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            raise ValueError("Coordinates must be finite numbers")
+        super().__init__(Value(lat), Value(lng), F(lat_field), F(lng_field), **extra)
+    
+    def as_postgresql(self, compiler, connection, **extra_context):
+        origin_lat, origin_lng, lat_expr, lng_expr = self.get_source_expressions()
+        lat_sql, lat_params = compiler.compile(lat_expr)
+        lng_sql, lng_params = compiler.compile(lng_expr)
+        # The origin is a validated float, so it is inlined as a literal
+        lat1, lng1 = repr(origin_lat.value), repr(origin_lng.value)
+        # Clamped like haversine_km(), so SQRT(1 - a) never sees a negative
+        a = (
+            f"LEAST(1, GREATEST(0, "
+            f"POWER(SIN(RADIANS({lat_sql} - {lat1}) / 2), 2) + "
+            f"COS(RADIANS({lat1})) * COS(RADIANS({lat_sql})) * "
+            f"POWER(SIN(RADIANS({lng_sql} - {lng1}) / 2), 2)))"
+        )
+        sql = (
+            f"ROUND(({EARTH_RADIUS_KM} * 2 * ATAN2(SQRT({a}), SQRT(1 - ({a}))))"
+            f"::numeric, 2)::double precision"
+        )
+        a_params = list(lat_params) * 2 + list(lng_params)
+        return sql, a_params * 2
+
+
+def parse_point(lat, lng):
+    """
+    Parse lat/lng query values
+
+    Raises:
+        ValueError: If either is missing, not a number (NaN included) or
+            out of range
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("lat and lng must be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat and lng are out of range")
+    return lat, lng
+
+
+def parse_bbox(value):
+    """
+    Parse a "south,west,north,east" viewport string
+
+    West may be greater than east for a viewport crossing the antimeridian.
+
+    Raises:
+        ValueError: If the value is malformed or out of range
+    """
+    try:
+        south, west, north, east = (float(part) for part in value.split(','))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("bbox must be south,west,north,east")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is out of range")
+    return south, west, north, east
+
+
+def bbox_center(south, west, north, east):
+    """Centre (lat, lng) of a viewport"""
+    if west > east:
+        east += 360.0
+    lng = (west + east) / 2
+    if lng > 180.0:
+        lng -= 360.0
+    return (south + north) / 2, lng
+
+
+def bbox_filter(south, west, north, east):
+    """Build a Q object selecting items inside a viewport"""
+    if west <= east:
+        lng_filter = Q(lng__range=(west, east))
+    else:
+        lng_filter = Q(lng__gte=west) | Q(lng__lte=east)
+    return Q(lat__range=(south, north)) & lng_filter
+
+
+def radius_prefilter(lat, lng, radius_km):
+    """
+    Build a Q object selecting every item that may lie within radius_km
+
+    The result is a superset of the Haversine matches: callers still have
+    to check the exact distance of each candidate.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    prefilter = Q(lat__range=(min_lat, max_lat), lng__range=(min_lng, max_lng))
+
+    ranges = cell_ranges(min_lat, max_lat, min_lng, max_lng)
+    if len(ranges) <= MAX_CELL_ROWS:
+        cells = Q()
+        for first, last in ranges:
+            cells |= Q(geo_cell__range=(first, last))
+        prefilter &= cells
+
+    return prefilter
@@ -0,0 +1,238 @@
+"""
+Two-tier cache of geocoding results
+
+Addresses are canonicalized (case, accents, punctuation, whitespace and
+common abbreviations) and hashed, so spellings of the same address share
+one entry and keys have a fixed length whatever the address. Lookups try
+a small in-process LRU before the shared Django cache. Addresses the
+provider can't resolve are cached too, for a short time, so they aren't
+requested again on every save.
+
+Reverse lookups are snapped to a grid of small cells (about
+REVERSE_GEOCODE_CELL_M metres across), so every point in a cell shares
+one entry. A miss is first answered from the address of an item in the
+cell that was itself geocoded, and only then sent to the provider.
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import geo
+
+RESULT_TTL = 60 * 60 * 24 * 30
+NEGATIVE_TTL = 60 * 60
+
+# Local copies expire sooner, so they don't outlive shared entries by much
+LOCAL_TTL = 60 * 10
+LOCAL_SIZE = 2048
+
+# Stored for addresses without a result (a cache miss is None)
+NOT_FOUND = 'not_found'
+
+METRES_PER_DEG_LAT = 111320
+
+# Long and short forms map to the short one
+ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'road': 'rd', 'drive': 'dr',
+    'boulevard': 'blvd', 'lane': 'ln', 'court': 'ct', 'place': 'pl', 'terrace': 'ter',
+    'circle': 'cir', 'parkway': 'pkwy', 'highway': 'hwy', 'square': 'sq', 'trail': 'trl',
+    'apartment': 'apt', 'suite': 'ste', 'building': 'bldg', 'floor': 'fl',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se', 'southwest': 'sw',
+}
+
+
+def canonical_address(text):
+    """Lowercase, accent and punctuation free words, abbreviated"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in re.findall(r'\w+', text))
+
+
+def cache_key(address_text):
+    digest = hashlib.blake2b(canonical_address(address_text).encode(), digest_size=16)
+    return f"geocode_address_{digest.hexdigest()}"
+
+
+def reverse_cell(lat, lng):
+    """
+    Reverse geocoding grid cell of a coordinate
+
+    Rows are REVERSE_GEOCODE_CELL_M tall; columns are widened by the
+    latitude of their row, so cells stay roughly square away from the
+    equator.
+
+    Returns:
+        tuple: (row, col)
+    """
+    size = settings.REVERSE_GEOCODE_CELL_M / METRES_PER_DEG_LAT
+    row = math.floor((lat + 90) / size)
+    return row, math.floor((lng + 180) / _column_width(row, size))
+
+
+def _column_width(row, size):
+    centre_lat = (row + 0.5) * size - 90
+    return min(size / max(math.cos(math.radians(centre_lat)), 0.01), 360.0)
+
+
+def cell_bounds(row, col):
+    """(south, west, north, east) of a reverse geocoding cell"""
+    size = settings.REVERSE_GEOCODE_CELL_M / METRES_PER_DEG_LAT
+    width = _column_width(row, size)
+    return (
+        row * size - 90, col * width - 180,
+        (row + 1) * size - 90, (col + 1) * width - 180,
+    )
+
+
+def reverse_cache_key(lat, lng):
+    # The cell size is part of the key, so changing it never mixes grids
+    row, col = reverse_cell(lat, lng)
+    return f"reverse_geocode_{settings.REVERSE_GEOCODE_CELL_M:g}_{row}_{col}"
+
+
+def known_address(lat, lng):
+    """
+    Address of the nearest geocoded item in the same cell
+
+    Only items with a place id are used: their address is the formatted
+    address the provider returned, not free text typed by an owner
+    (Item.save() drops the place id when the address is edited). User
+    addresses are private and never used.
+
+    Returns:
+        str: The address, or None if no item in the cell has one
+    """
+    from .models import Item
+
+    in_cell = geo.bbox_filter(*cell_bounds(*reverse_cell(lat, lng)))
+    candidates = list(
+        Item.objects.filter(in_cell).exclude(google_place_id='').exclude(address_text='')
+        .values_list('lat', 'lng', 'address_text')[:20]
+    )
+    if not candidates:
+        return None
+    nearest = min(candidates, key=lambda c: geo.haversine_km(lat, lng, c[0], c[1]))
+    return nearest[2]
+
+
+class GeocodeCache:
+    """
+    In-process LRU in front of the shared cache
+    """
+
+    def __init__(self, size=LOCAL_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop local entries and counters"""
+        with self._lock:
+            self._local = OrderedDict()
+            self.local_hits = 0
+            self.shared_hits = 0
+            self.negative_hits = 0
+            self.known_hits = 0
+            self.misses = 0
+
+    def _remember(self, key, value, ttl):
+        self._local[key] = (value, time.monotonic() + min(ttl, LOCAL_TTL))
+        self._local.move_to_end(key)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+    def _get(self, key):
+        """
+        Returns:
+            tuple: (hit, result); result is None for an entry known to
+            have no result
+        """
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._local.move_to_end(key)
+                self.local_hits += 1
+                value = entry[0]
+            else:
+                value = None
+
+        if value is None:
+            value = cache.get(key)
+            with self._lock:
+                if value is None:
+                    self.misses += 1
+                    return False, None
+                self.shared_hits += 1
+                self._remember(key, value, NEGATIVE_TTL if value == NOT_FOUND else RESULT_TTL)
+
+        if value == NOT_FOUND:
+            with self._lock:
+                self.negative_hits += 1
+            return True, None
+        return True, value
+
+    def _set(self, key, result):
+        if result is None:
+            value, ttl = NOT_FOUND, NEGATIVE_TTL
+        else:
+            value, ttl = result, RESULT_TTL
+        cache.set(key, value, ttl)
+        with self._lock:
+            self._remember(key, value, ttl)
+
+    def get(self, address_text):
+        """Cached result of geocoding an address, as (hit, result)"""
+        return self._get(cache_key(address_text))
+
+    def set(self, address_text, result):
+        """Store a result, or None for an address without one"""
+        self._set(cache_key(address_text), result)
+
+    def get_reverse(self, lat, lng):
+        """
+        Cached address of the cell containing a coordinate, as (hit, result)
+
+        On a miss, the address of a geocoded item in the cell is cached
+        and returned instead.
+        """
+        key = reverse_cache_key(lat, lng)
+        hit, result = self._get(key)
+        if hit:
+            return hit, result
+        address = known_address(lat, lng)
+        if address is None:
+            return False, None
+        with self._lock:
+            self.known_hits += 1
+        self._set(key, address)
+        return True, address
+
+    def set_reverse(self, lat, lng, address):
+        """Store the address of a cell, or None for a cell without one"""
+        self._set(reverse_cache_key(lat, lng), address)
+
+    def stats(self):
+        """Hit counts for this process"""
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'negative_hits': self.negative_hits,
+            'known_address_hits': self.known_hits,
+            'misses': self.misses,
+            'hit_ratio': round((lookups - self.misses) / lookups, 4) if lookups else None,
+            'local_entries': len(self._local),
+        }
+
+
+# Singleton instance
+geocode_cache = GeocodeCache()
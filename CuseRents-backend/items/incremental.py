@@ -0,0 +1,223 @@
+"""
+Incrementally refreshed in-memory item indexes
+
+The location snapshot and the title index keep item columns in NumPy
+arrays, made of a "main" segment sorted for their queries, a mask of its
+live rows and a small unsorted "tail" holding rows changed since the
+last compaction. A refresh reads only the items whose updated_at moved
+past the watermark, marks their old rows dead, appends their new rows to
+the tail and swaps in a new immutable state, so readers never see a
+half-applied update. Once the tail grows past about 1% of the segment it
+is merged into a freshly sorted one.
+
+Subclasses of IncrementalIndex say which item fields they read and how
+to turn them into columns.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Refresh from the database at most this often (seconds)
+REFRESH_INTERVAL = 1.0
+
+# Rebuild from scratch this often, to drop rows deleted by other processes
+FULL_REBUILD_INTERVAL = 300.0
+
+# Re-read rows this far behind the watermark, in case a slow transaction
+# committed an older updated_at after we advanced past it
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+# Merge the tail into the main segment once it grows past this size
+MIN_COMPACT_ROWS = 1024
+
+
+class Segment:
+    """Main rows sorted by sort_column, with a lookup of rows by item id"""
+    sort_column = None
+
+    def __init__(self, columns):
+        order = np.argsort(columns[self.sort_column], kind='stable')
+        self.columns = {name: array[order] for name, array in columns.items()}
+        self.id_order = np.argsort(self.columns['id'], kind='stable')
+        self.sorted_ids = self.columns['id'][self.id_order]
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    @property
+    def nbytes(self):
+        total = self.id_order.nbytes + self.sorted_ids.nbytes
+        return total + sum(array.nbytes for array in self.columns.values())
+
+    def positions(self, ids):
+        """Row positions of the given item ids (missing ids skipped)"""
+        starts = np.searchsorted(self.sorted_ids, ids, side='left')
+        counts = np.searchsorted(self.sorted_ids, ids, side='right') - starts
+        # Every position from each start, without a Python loop
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.id_order[np.repeat(starts, counts) + offsets]
+
+
+class State:
+    """Immutable index: a main segment, its live-row mask and the tail"""
+
+    def __init__(self, segment, live=None, tail=None):
+        self.segment = segment
+        self.main = segment.columns
+        self.live = np.ones(len(segment), dtype=bool) if live is None else live
+        if tail is None:
+            tail = {name: array[:0] for name, array in self.main.items()}
+        self.tail = tail
+
+    def live_columns(self):
+        """All live rows, main segment and tail together"""
+        return {
+            name: np.concatenate([self.main[name][self.live], self.tail[name]])
+            for name in self.main
+        }
+
+    @property
+    def rows(self):
+        return int(self.live.sum()) + len(self.tail['id'])
+
+    @property
+    def nbytes(self):
+        total = self.segment.nbytes + self.live.nbytes
+        return total + sum(array.nbytes for array in self.tail.values())
+
+
+class IncrementalIndex:
+    """
+    Per-process index over available items, refreshed from updated_at
+
+    Subclasses set `fields` (the item fields passed to build_columns(),
+    starting with id), `segment_class` and `name`.
+    """
+    name = 'index'
+    fields = ('id',)
+    segment_class = Segment
+
+    def __init__(self):
+        from .models import Item
+        self.category_codes = {
+            value: code for code, (value, _) in enumerate(Item.CATEGORY_CHOICES)
+        }
+        self._lock = threading.Lock()
+        self.reset()
+
+    def build_columns(self, rows):
+        """Column arrays from tuples of the values of `fields`"""
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop all data; the next query rebuilds from the database"""
+        with self._lock:
+            self._state = State(self.segment_class(self.build_columns([])))
+            self._watermark = None
+            self._last_refresh = 0.0
+            self._last_full_rebuild = 0.0
+            self._last_refresh_duration = 0.0
+            self._refresh_count = 0
+            self._full_rebuild_count = 0
+
+    def mark_stale(self):
+        """Force a refresh before the next query (used by item signals)"""
+        self._last_refresh = 0.0
+
+    def _fetch(self, since=None):
+        from .models import Item
+        queryset = Item.objects.all()
+        if since is None:
+            queryset = queryset.filter(is_available=True)
+        else:
+            queryset = queryset.filter(updated_at__gte=since - REFRESH_OVERLAP)
+        return queryset.order_by().values_list(*self.fields, 'is_available', 'updated_at')
+
+    def ensure_fresh(self, force=False):
+        """
+        Refresh the index if it is older than REFRESH_INTERVAL
+
+        Args:
+            force (bool): Refresh now, e.g. before caching results that
+                other processes will read
+        """
+        if not force and time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+            return
+        # One thread refreshes while the others keep answering from the
+        # current state, which is swapped in whole; they only wait when
+        # forced or when nothing has been built yet
+        if not self._lock.acquire(blocking=force or self._watermark is None):
+            return
+        try:
+            if not force and time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+                return
+            start = time.monotonic()
+            if (self._watermark is None
+                    or start - self._last_full_rebuild >= FULL_REBUILD_INTERVAL):
+                self._rebuild()
+            else:
+                self._refresh()
+            self._last_refresh = time.monotonic()
+            self._last_refresh_duration = self._last_refresh - start
+            self._refresh_count += 1
+        finally:
+            self._lock.release()
+
+    def _rebuild(self):
+        width = len(self.fields)
+        rows = list(self._fetch())
+        watermark = max((row[width + 1] for row in rows), default=None)
+        self._state = State(self.segment_class(
+            self.build_columns([row[:width] for row in rows])
+        ))
+        self._watermark = watermark or self._watermark
+        self._last_full_rebuild = time.monotonic()
+        self._full_rebuild_count += 1
+        logger.info(
+            f"Rebuilt {self.name}: {len(rows)} items, {self._state.rows} rows, "
+            f"{self._state.nbytes} bytes"
+        )
+
+    def _refresh(self):
+        width = len(self.fields)
+        rows = list(self._fetch(since=self._watermark))
+        if not rows:
+            return
+        self._watermark = max(self._watermark, max(row[width + 1] for row in rows))
+        self._apply(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            [row[:width] for row in rows if row[width]],
+        )
+
+    def _apply(self, changed_ids, available_rows):
+        """Swap in a new state with changed_ids replaced by available_rows"""
+        state = self._state
+
+        live = state.live.copy()
+        live[state.segment.positions(changed_ids)] = False
+
+        keep = ~np.isin(state.tail['id'], changed_ids)
+        added = self.build_columns(available_rows)
+        tail = {
+            name: np.concatenate([state.tail[name][keep], added[name]])
+            for name in state.tail
+        }
+
+        if len(tail['id']) > max(MIN_COMPACT_ROWS, len(live) // 100):
+            self._state = State(self.segment_class({
+                name: np.concatenate([state.main[name][live], tail[name]])
+                for name in tail
+            }))
+        else:
+            self._state = State(state.segment, live, tail)
+
+    def discard(self, item_ids):
+        """Remove deleted items from this process's index"""
+        with self._lock:
+            self._apply(np.asarray(item_ids, dtype=np.int64), [])
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from items.geo import haversine_array, haversine_km
+import numpy as np
+import time
+
+# Syracuse University
+CENTER_LAT = 43.0361
+CENTER_LNG = -76.1275
+
+
+class Command(BaseCommand):
+    help = 'Benchmark scalar vs vectorized Haversine distance throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=1000000,
+            help='Number of destination points'
+        )
+        parser.add_argument(
+            '--spread',
+            type=float,
+            default=1.5,
+            help='Points are spread uniformly within +/- this many degrees of campus'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting Haversine benchmark...'))
+
+        points = options['points']
+        rng = np.random.default_rng(0)
+        lats = CENTER_LAT + rng.uniform(-options['spread'], options['spread'], points)
+        lngs = CENTER_LNG + rng.uniform(-options['spread'], options['spread'], points)
+
+        # Scalar: one math call chain per point
+        lat_list = lats.tolist()
+        lng_list = lngs.tolist()
+        start = time.perf_counter()
+        scalar = [
+            haversine_km(CENTER_LAT, CENTER_LNG, lat, lng)
+            for lat, lng in zip(lat_list, lng_list)
+        ]
+        scalar_time = time.perf_counter() - start
+
+        # Vectorized: one call for the whole batch
+        start = time.perf_counter()
+        vectorized = haversine_array(CENTER_LAT, CENTER_LNG, lats, lngs)
+        vector_time = time.perf_counter() - start
+
+        max_diff = float(np.max(np.abs(np.asarray(scalar) - vectorized)))
+        if max_diff > 0.01:
+            raise CommandError(f"Scalar and vectorized results differ by {max_diff} km")
+
+        self.stdout.write(f"\n  Points:      {points}")
+        self.stdout.write(f"  Scalar:      {scalar_time:.3f}s ({points / scalar_time:,.0f} points/s)")
+        self.stdout.write(f"  Vectorized:  {vector_time:.3f}s ({points / vector_time:,.0f} points/s)")
+        self.stdout.write(f"  Max diff:    {max_diff} km")
+
+        self.stdout.write("\n" + "="*50)
+        self.stdout.write(self.style.SUCCESS(
+            f"\nVectorized kernel is {scalar_time / vector_time:.1f}x faster"
+        ))
@@ -0,0 +1,151 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from items.models import Item
+from items import geo
+from decimal import Decimal
+import random
+import time
+
+User = get_user_model()
+
+# Syracuse University
+CENTER_LAT = 43.0361
+CENTER_LNG = -76.1275
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic items after a benchmark run"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark radius search: full table scan vs grid cell prefilter vs within()'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Catalogue sizes to benchmark'
+        )
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=5.0,
+            help='Search radius in km'
+        )
+        parser.add_argument(
+            '--spread',
+            type=float,
+            default=1.5,
+            help='Items are spread uniformly within +/- this many degrees of campus'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=5,
+            help='Number of searches to time per catalogue size'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting search benchmark...'))
+        self.stdout.write(f"  Radius: {options['radius']} km")
+
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        self.stdout.write("\n" + "="*50)
+        self.stdout.write(self.style.SUCCESS("\nBenchmark complete! (synthetic items rolled back)"))
+
+    def _run(self, size, options):
+        self.stdout.write(f"\nCatalogue size: {size}")
+
+        owner = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        self._create_items(owner, size, options['spread'])
+
+        rng = random.Random(size)
+        full_times = []
+        grid_times = []
+        db_times = []
+
+        for _ in range(options['queries']):
+            lat = CENTER_LAT + rng.uniform(-0.1, 0.1)
+            lng = CENTER_LNG + rng.uniform(-0.1, 0.1)
+            queryset = Item.objects.filter(is_available=True)
+
+            start = time.perf_counter()
+            full_ids = self._search(queryset, lat, lng, options['radius'])
+            full_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            grid_ids = self._search(
+                queryset.filter(geo.radius_prefilter(lat, lng, options['radius'])),
+                lat, lng, options['radius']
+            )
+            grid_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            db_ids = sorted(
+                queryset.within(lat, lng, options['radius']).values_list('distance_km', 'id')
+            )
+            db_times.append(time.perf_counter() - start)
+
+            if not (full_ids == grid_ids == db_ids):
+                raise CommandError(
+                    f"Result mismatch at ({lat}, {lng}): "
+                    f"{len(full_ids)} vs {len(grid_ids)} vs {len(db_ids)} items"
+                )
+
+        full_ms = sum(full_times) / len(full_times) * 1000
+        grid_ms = sum(grid_times) / len(grid_times) * 1000
+        db_ms = sum(db_times) / len(db_times) * 1000
+        self.stdout.write(f"  Full scan:   {full_ms:.1f} ms/query")
+        self.stdout.write(f"  Grid cells:  {grid_ms:.1f} ms/query")
+        self.stdout.write(f"  within():    {db_ms:.1f} ms/query")
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Identical results, {full_ms / grid_ms:.1f}x faster"))
+
+    @staticmethod
+    def _search(queryset, lat, lng, radius):
+        """Haversine filter as done by ItemViewSet.search"""
+        matches = []
+        for item_id, item_lat, item_lng in queryset.values_list('id', 'lat', 'lng').iterator():
+            distance = geo.haversine_km(lat, lng, item_lat, item_lng)
+            if distance <= radius:
+                matches.append((distance, item_id))
+        matches.sort()
+        return matches
+
+    def _create_items(self, owner, size, spread):
+        rng = random.Random(0)
+        batch = []
+        start = time.perf_counter()
+
+        for i in range(size):
+            lat = CENTER_LAT + rng.uniform(-spread, spread)
+            lng = CENTER_LNG + rng.uniform(-spread, spread)
+            batch.append(Item(
+                owner=owner,
+                title=f'Benchmark item {i}',
+                description='Synthetic item',
+                category='other',
+                price_per_hour=Decimal('1.00'),
+                address_text='Syracuse, NY',
+                lat=lat,
+                lng=lng,
+                geo_cell=geo.cell_for(lat, lng),
+                photo_url='https://example.com/item.jpg',
+            ))
+            if len(batch) == 5000:
+                Item.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            Item.objects.bulk_create(batch)
+
+        self.stdout.write(f"  Created {size} items in {time.perf_counter() - start:.1f}s")
@@ -1,11 +1,61 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from items import geo
 from items.models import Item
-from items.services import geocoding_service
+from items.ratelimit import TokenBucket
+from items.search_cache import search_cache
+from items.services import GeocodingService, GeocodingUnavailable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
 import time
 
+# Syracuse University
+CENTER_LAT = 43.0361
+CENTER_LNG = -76.1275
+
+# bulk_update skips Item.save(), so the grid cell and updated_at (which
+# the search indexes refresh from) are written explicitly
+UPDATE_FIELDS = ['lat', 'lng', 'google_place_id', 'address_text', 'geo_cell', 'updated_at']
+
+# Most recent address results kept for deduplication; bounded so memory
+# stays flat however many items there are
+RESOLVED_CACHE_SIZE = 10000
+
+
+class FakeGeocodingService:
+    """
+    Local stand-in for GeocodingService: deterministic coordinates near
+    campus after a fixed latency, under the same kind of rate limit,
+    without network calls or quota
+    """
+
+    def __init__(self, latency=0.05, rate=10.0):
+        self.latency = latency
+        self.rate_limiter = TokenBucket(rate)
+
+    def address_to_coords(self, address_text, raise_unavailable=False):
+        self.rate_limiter.acquire()
+        time.sleep(self.latency)
+        if not address_text.strip():
+            return None
+        digest = hashlib.sha1(address_text.encode()).digest()
+        return {
+            'lat': CENTER_LAT + (digest[0] - 128) / 2560,
+            'lng': CENTER_LNG + (digest[1] - 128) / 2560,
+            'place_id': f'fake-{digest.hex()[:16]}',
+            'formatted_address': address_text.strip(),
+        }
+
+
 class Command(BaseCommand):
     help = 'Geocode all items that are missing coordinates'
-    
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--all',
@@ -18,61 +68,236 @@ class Command(BaseCommand):
             default=None,
             help='Limit number of items to geocode'
         )
-    
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of concurrent geocoding requests'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=None,
+            help=(
+                "Maximum geocoding requests per second, across all workers; "
+                "sets the geocoding service's own rate limit (default: GOOGLE_MAPS_RATE_LIMIT)"
+            )
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Items loaded and written back per batch'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='geocode_items.checkpoint.json',
+            help='File recording progress after every chunk'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue after the last chunk recorded in the checkpoint file'
+        )
+        parser.add_argument(
+            '--retry-file',
+            default='geocode_items.failed.jsonl',
+            help='File that failed items and addresses are appended to, one JSON object per line'
+        )
+        parser.add_argument(
+            '--fake',
+            action='store_true',
+            help='Use a local fake geocoder instead of the Google Maps API'
+        )
+        parser.add_argument(
+            '--fake-latency',
+            type=float,
+            default=0.05,
+            help='Seconds each fake geocoding request takes'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting geocoding process...'))
-        
+
         # Query items
+        mode = 'all' if options['all'] else 'missing'
         if options['all']:
             items = Item.objects.all()
             self.stdout.write(f"Re-geocoding ALL {items.count()} items")
         else:
-            items = Item.objects.filter(lat__isnull=True) | Item.objects.filter(lng__isnull=True)
+            items = Item.objects.filter(Q(lat__isnull=True) | Q(lng__isnull=True))
             self.stdout.write(f"Geocoding {items.count()} items with missing coordinates")
-        
-        # Apply limit if specified
-        if options['limit']:
-            items = items[:options['limit']]
-            self.stdout.write(f"Limited to {options['limit']} items")
-        
-        success_count = 0
-        failure_count = 0
-        
-        for item in items:
-            self.stdout.write(f"\nProcessing: {item.title} (ID: {item.id})")
-            self.stdout.write(f"  Address: {item.address_text}")
-            
-            # Geocode the address
-            result = geocoding_service.address_to_coords(item.address_text)
-            
-            if result:
-                # Update item with coordinates
-                item.lat = result['lat']
-                item.lng = result['lng']
-                item.google_place_id = result['place_id']
-                item.address_text = result['formatted_address']  # Use formatted address
-                item.save()
-                
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"  ✓ Success: ({result['lat']}, {result['lng']})"
-                    )
+
+        progress = {'mode': mode, 'last_id': 0, 'success': 0, 'failures': 0, 'requests': 0}
+        if options['resume']:
+            progress = self._load_checkpoint(options['checkpoint'], mode)
+            self.stdout.write(
+                f"Resuming after item {progress['last_id']} "
+                f"({progress['success']} done, {progress['failures']} failed so far)"
+            )
+        elif os.path.exists(options['retry_file']):
+            # A fresh run starts a fresh retry file
+            os.remove(options['retry_file'])
+
+        limit = options['limit']
+        if limit:
+            self.stdout.write(f"Limited to {limit} items")
+
+        rate = options['rate'] or settings.GOOGLE_MAPS_RATE_LIMIT
+        if options['fake']:
+            service = FakeGeocodingService(options['fake_latency'], rate)
+            self.stdout.write("Using the fake geocoder")
+        else:
+            # The service's rate limiter is the only one; a batch waits for
+            # its tokens instead of giving up after RATE_LIMIT_TIMEOUT
+            service = GeocodingService(rate=rate)
+            service.RATE_LIMIT_TIMEOUT = None
+
+        def geocode(address):
+            return address, service.address_to_coords(address, raise_unavailable=True)
+
+        # Recent results by address, so repeated addresses are geocoded once
+        resolved = OrderedDict()
+        processed = 0
+        start = time.perf_counter()
+        run_requests = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while not limit or processed < limit:
+                # Keyset chunks: each one is an index range scan after the
+                # previous, so memory and query cost don't grow with the table
+                size = options['chunk_size']
+                if limit:
+                    size = min(size, limit - processed)
+                chunk = list(
+                    items.filter(pk__gt=progress['last_id']).order_by('pk')
+                    .only('id', 'title', 'address_text', 'lat', 'lng')[:size]
                 )
-                success_count += 1
-            else:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"  ✗ Failed to geocode address"
+                if not chunk:
+                    break
+
+                for item in chunk:
+                    if item.address_text in resolved:
+                        resolved.move_to_end(item.address_text)
+                pending = {item.address_text for item in chunk} - resolved.keys()
+                try:
+                    resolved.update(executor.map(geocode, pending))
+                except GeocodingUnavailable as e:
+                    # Not the addresses' fault: stop before the checkpoint
+                    # moves past this chunk, so --resume retries it
+                    raise CommandError(
+                        f"Geocoding unavailable ({e}); rerun with --resume to continue "
+                        f"after item {progress['last_id']}"
                     )
+                run_requests += len(pending)
+
+                updated, failed = self._apply(chunk, resolved)
+                while len(resolved) > RESOLVED_CACHE_SIZE:
+                    resolved.popitem(last=False)
+
+                self._record_failures(options['retry_file'], failed)
+                for item in failed:
+                    self.stdout.write(self.style.ERROR(
+                        f"  ✗ Failed to geocode {item.title} (ID: {item.id}): {item.address_text}"
+                    ))
+
+                processed += len(chunk)
+                progress['last_id'] = chunk[-1].pk
+                progress['success'] += len(updated)
+                progress['failures'] += len(failed)
+                progress['requests'] += len(pending)
+                self._save_checkpoint(options['checkpoint'], progress)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"  Up to item {progress['last_id']}: {processed} items this run "
+                    f"({processed / elapsed:.1f} items/s)"
                 )
-                failure_count += 1
-            
-            # Rate limiting: wait 0.2 seconds between requests
-            time.sleep(0.2)
-        
+
+        elapsed = time.perf_counter() - start
+        total = progress['success'] + progress['failures']
+
         # Summary
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS(f"\nGeocoding complete!"))
-        self.stdout.write(f"  Success: {success_count}")
-        self.stdout.write(f"  Failures: {failure_count}")
-        self.stdout.write(f"  Total: {success_count + failure_count}")
\ No newline at end of file
+        self.stdout.write(f"  Success: {progress['success']}")
+        self.stdout.write(f"  Failures: {progress['failures']}")
+        self.stdout.write(f"  Total: {total}")
+        self.stdout.write(
+            f"  Geocoding requests: {progress['requests']} "
+            f"({total - progress['requests']} saved by deduplication)"
+        )
+        if progress['failures']:
+            self.stdout.write(f"  Failed addresses: {options['retry_file']}")
+        if elapsed and processed:
+            self.stdout.write(
+                f"  Throughput: {processed / elapsed:.1f} items/s, "
+                f"{run_requests / elapsed:.1f} requests/s in {elapsed:.1f}s"
+            )
+
+    @staticmethod
+    def _load_checkpoint(path, mode):
+        try:
+            with open(path) as f:
+                progress = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No checkpoint to resume from at {path}")
+        except ValueError:
+            raise CommandError(f"Unreadable checkpoint file {path}")
+        if progress.get('mode') != mode:
+            raise CommandError(
+                f"Checkpoint {path} is from a run with{'' if mode == 'missing' else 'out'} --all; "
+                f"rerun with the same options or without --resume"
+            )
+        return progress
+
+    @staticmethod
+    def _save_checkpoint(path, progress):
+        """Write the checkpoint atomically, so a crash never leaves half a file"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(progress, f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _record_failures(path, failed):
+        if not failed:
+            return
+        with open(path, 'a') as f:
+            for item in failed:
+                f.write(json.dumps({'id': item.id, 'address': item.address_text}) + '\n')
+
+    @staticmethod
+    def _apply(chunk, resolved):
+        """
+        Write the geocoding results of a chunk of items in one bulk update
+
+        Returns:
+            tuple: (updated items, items whose address failed)
+        """
+        now = timezone.now()
+        updated = []
+        failed = []
+        # Cached searches around both the old and the new position go stale
+        coords = []
+
+        for item in chunk:
+            result = resolved.get(item.address_text)
+            if not result:
+                failed.append(item)
+                continue
+            coords.append((item.lat, item.lng))
+            item.lat = result['lat']
+            item.lng = result['lng']
+            item.google_place_id = result['place_id']
+            item.address_text = result['formatted_address']  # Use formatted address
+            item.geo_cell = geo.cell_for(item.lat, item.lng)
+            item.updated_at = now
+            coords.append((item.lat, item.lng))
+            updated.append(item)
+
+        if updated:
+            with transaction.atomic():
+                Item.objects.bulk_update(updated, UPDATE_FIELDS)
+                transaction.on_commit(lambda: search_cache.invalidate(coords))
+        return updated, failed
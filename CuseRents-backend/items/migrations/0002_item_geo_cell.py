@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-17 00:52
+
+from django.conf import settings
+from django.db import migrations, models
+from items.geo import cell_for
+
+
+def populate_geo_cells(apps, schema_editor):
+    Item = apps.get_model('items', 'Item')
+    items = list(Item.objects.only('id', 'lat', 'lng'))
+    for item in items:
+        item.geo_cell = cell_for(item.lat, item.lng)
+    Item.objects.bulk_update(items, ['geo_cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, editable=False, help_text='Search grid cell derived from lat/lng', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['geo_cell'], name='items_geo_cel_6d04e0_idx'),
+        ),
+        migrations.RunPython(populate_geo_cells, migrations.RunPython.noop),
+    ]
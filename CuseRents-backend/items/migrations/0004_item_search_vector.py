@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:07
+
+import django.contrib.postgres.search
+from django.db import migrations
+from items.fulltext import FTS_TABLE, search_vector
+
+
+def create_search_index(apps, schema_editor):
+    """
+    GIN index on PostgreSQL, FTS5 table on SQLite; neither can be declared
+    in Meta.indexes portably, so they are created per vendor here
+    """
+    Item = apps.get_model('items', 'Item')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX items_search_vector_gin ON items USING gin (search_vector)'
+        )
+        Item.objects.update(search_vector=search_vector())
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"title, description, category, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, category) '
+            f'SELECT id, title, description, category FROM items'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS items_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0003_item_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
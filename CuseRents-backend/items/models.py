@@ -1,8 +1,61 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.contrib.postgres.search import SearchVectorField
 from decimal import Decimal
-import math
+from . import fulltext, geo
+
+class ItemQuerySet(models.QuerySet):
+    """
+    Queryset with geo search helpers
+    """
+    
+    def by_distance(self, lat, lng):
+        """
+        Items ordered nearest first from (lat, lng)
+        
+        Distance is computed by the database and exposed as distance_km.
+        """
+        return self.annotate(
+            distance_km=geo.Haversine(lat, lng)
+        ).order_by('distance_km', '-created_at')
+    
+    def within(self, lat, lng, radius_km):
+        """Items within radius_km of (lat, lng), nearest first"""
+        return self.filter(
+            geo.radius_prefilter(lat, lng, radius_km)
+        ).by_distance(lat, lng).filter(distance_km__lte=radius_km)
+    
+    def free_between(self, start_time, end_time):
+        """
+        Items with no pending/accepted/active booking overlapping
+        [start_time, end_time), directly or as part of a bundle
+        """
+        from bookings.models import Booking, BookingItem
+        return self.filter(
+            ~models.Exists(
+                Booking.objects.overlapping(start_time, end_time).filter(item=models.OuterRef('pk'))
+            ),
+            ~models.Exists(
+                BookingItem.objects.filter(
+                    item=models.OuterRef('pk'),
+                    booking__in=Booking.objects.overlapping(start_time, end_time)
+                )
+            )
+        )
+    
+    def search_text(self, text):
+        """Full-text matches for text, annotated with search_rank"""
+        return fulltext.match(self, text)
+    
+    def with_video_flag(self):
+        """Annotate has_video_demo with an EXISTS subquery instead of a query per item"""
+        return self.annotate(
+            has_video_demo=models.Exists(
+                ItemVideo.objects.filter(item=models.OuterRef('pk'))
+            )
+        )
+
 
 class Item(models.Model):
     """
@@ -80,6 +133,12 @@ class Item(models.Model):
         validators=[MinValueValidator(-180), MaxValueValidator(180)],
         help_text="Longitude coordinate"
     )
+    geo_cell = models.IntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Search grid cell derived from lat/lng"
+    )
     
     # Media
     photo_url = models.URLField(
@@ -121,38 +180,66 @@ class Item(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Full-text index (PostgreSQL only; SQLite uses the items_fts table)
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+    
+    objects = ItemQuerySet.as_manager()
+    
     class Meta:
         db_table = 'items'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['lat', 'lng']),  # For geo queries
+            models.Index(fields=['geo_cell']),  # For radius prefiltering
             models.Index(fields=['category']),
             models.Index(fields=['is_available']),
             models.Index(fields=['-created_at']),
+            models.Index(fields=['updated_at']),  # For snapshot refreshes
         ]
     
     def __str__(self):
         return f"{self.title} by {self.owner.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the item was, so moving it invalidates cached
+        # searches around the old position too
+        instance._loaded_coords = (
+            instance.__dict__.get('lat'), instance.__dict__.get('lng')
+        )
+        # The place id vouches for this address only
+        instance._geocoded = (
+            instance.__dict__.get('address_text'), instance.__dict__.get('google_place_id')
+        )
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Keep the search grid cell in sync with the coordinates
+        self.geo_cell = geo.cell_for(self.lat, self.lng)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'lat', 'lng'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geo_cell'}
+        # An address edited by hand is no longer the geocoder's formatted
+        # address, so drop the place id that said it was
+        address, place_id = getattr(self, '_geocoded', (None, None))
+        if (address is not None and place_id
+                and self.address_text != address and self.google_place_id == place_id):
+            self.google_place_id = ''
+            if update_fields is not None and 'address_text' in update_fields:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'google_place_id'}
+        super().save(*args, **kwargs)
+        self._geocoded = (self.address_text, self.google_place_id)
+    
     def calculate_distance(self, target_lat, target_lng):
         """
         Calculate distance to target location using Haversine formula
         Returns distance in kilometers
         """
-        R = 6371  # Earth's radius in kilometers
-        
-        lat1 = math.radians(self.lat)
-        lat2 = math.radians(target_lat)
-        delta_lat = math.radians(target_lat - self.lat)
-        delta_lng = math.radians(target_lng - self.lng)
-        
-        a = (math.sin(delta_lat / 2) ** 2 +
-             math.cos(lat1) * math.cos(lat2) *
-             math.sin(delta_lng / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        distance = R * c
-        return round(distance, 2)
+        return geo.haversine_km(self.lat, self.lng, target_lat, target_lng)
     
     def update_rating(self, new_rating):
         """Update item's average rating"""
@@ -183,6 +270,7 @@ class Item(models.Model):
             self.lng = result['lng']
             self.google_place_id = result.get('place_id', '')
             self.address_text = result.get('formatted_address', self.address_text)
+            self._geocoded = (self.address_text, self.google_place_id)
             return True
         
         return False
@@ -285,7 +373,7 @@ class Bundle(models.Model):
             for bundle_item in self.bundle_items.all()
         ) * hours
         
-        discount = total * (self.discount_percent / 100)
+        discount = total * Decimal(self.discount_percent) / 100
         return total - discount
     
     def increment_bookings(self):
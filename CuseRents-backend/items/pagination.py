@@ -0,0 +1,111 @@
+import base64
+import binascii
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Base for keyset (cursor) pagination
+
+    Results are ordered by a unique key, e.g. (distance, -id). The cursor
+    holds the key of the last result on the page, so the next page is
+    simply "everything after that position" and costs the same however
+    deep it is - unlike page numbers, which redo and skip all earlier
+    pages.
+
+    Subclasses turn a position into the text inside the cursor and back
+    with format_position() and parse_position().
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE or 20
+
+    def __init__(self, request):
+        self.request = request
+        self.after = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        self.next_position = None
+
+    @classmethod
+    def requested(cls, request):
+        """Keyset mode is used whenever a cursor param is sent (empty for page 1)"""
+        return cls.cursor_query_param in request.query_params
+
+    @staticmethod
+    def format_position(*position):
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_position(text):
+        """
+        Raises:
+            ValueError: The text isn't a position
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def encode_cursor(cls, *position):
+        raw = cls.format_position(*position).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @classmethod
+    def decode_cursor(cls, value):
+        """
+        Returns:
+            tuple: Position of the last result seen, or None for page 1
+        """
+        if not value:
+            return None
+        try:
+            padded = value + '=' * (-len(value) % 4)
+            return cls.parse_position(base64.urlsafe_b64decode(padded).decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+    def paginate(self, results, position):
+        """
+        Take one page from results fetched with a limit of page_size + 1,
+        remembering where the next page starts
+
+        Args:
+            position: Callable returning the position of a result
+        """
+        results = list(results)
+        if len(results) > self.page_size:
+            results = results[:self.page_size]
+            self.next_position = position(results[-1])
+        return results
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(*self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+
+class DistanceCursorPagination(KeysetPagination):
+    """
+    Keyset pagination for distance-ordered search results
+
+    Results are ordered by (distance, -id); positions are (distance, id).
+    """
+
+    @staticmethod
+    def format_position(distance, item_id):
+        return f"{distance!r}:{item_id}"
+
+    @staticmethod
+    def parse_position(text):
+        distance, item_id = text.split(':')
+        return float(distance), int(item_id)
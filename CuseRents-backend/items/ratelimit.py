@@ -0,0 +1,172 @@
+"""
+Client-side protection for outbound API calls
+
+TokenBucket limits the request rate of one process; CacheTokenBucket
+shares a budget between all workers through the default cache, which
+must then be shared (settings.SHARED_CACHE).
+CircuitBreaker stops calling a provider that keeps failing.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    each call takes one, so bursts of up to `capacity` go through at once
+    and the sustained rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available right now"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Wait until tokens are available and take them
+
+        Returns:
+            bool: False if they weren't available within timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+
+class CacheTokenBucket:
+    """
+    Rate limit shared by every process using the same cache
+
+    The cache has no compare-and-swap, so this is a token bucket refilled
+    all at once every `window` seconds: one atomic incr() per request on
+    a counter for the current window. On a per-process cache (LocMemCache)
+    every process counts on its own, so the limit is per process.
+    """
+
+    def __init__(self, key, rate, window=1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.key = key
+        self.capacity = max(1, int(rate * window))
+        self.window = window
+
+    def try_acquire(self):
+        """Take a token from the current window if one is left"""
+        window_id = int(time.time() // self.window)
+        key = f"{self.key}_{window_id}"
+        # Expire the counter soon after its window ends
+        cache.add(key, 0, int(self.window) + 2)
+        try:
+            used = cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); don't block on it
+            return True
+        return used <= self.capacity
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a token, retrying at the start of each window
+
+        Returns:
+            bool: False if none was available within timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            wait = self.window - time.time() % self.window
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """
+    Fail fast while a provider is down
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds. Then one trial call is let
+    through (half-open): success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """Whether a call may be made now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """
+        End a call that says nothing about the provider's health (e.g. an
+        invalid request): the state is unchanged, and a half-open circuit
+        lets another trial call through
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
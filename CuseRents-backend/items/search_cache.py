@@ -0,0 +1,222 @@
+"""
+Search result cache
+
+Students around campus send near-identical searches, so results are
+cached under a key made of the search centre snapped to a small grid,
+the viewport rounded outwards and the normalized filters. The cached
+value is the (id, lat, lng) of every candidate in the area any search
+with that key can cover, plus facet counts when asked for. Each request
+then measures distances from its own exact centre, applies its own
+radius or viewport, and cuts its page from the result.
+
+Invalidation is versioned: the map is split into coarse cells, each with
+a version counter in the cache, and every key embeds the versions of the
+cells its search area covers. Creating, updating or deleting an item
+bumps the versions of its old and new cells, so only searches touching
+those cells miss afterwards. Searches with a time window also depend on
+bookings, so they embed a bookings version bumped by every booking change.
+
+Version bumps only reach other workers through a shared cache
+(settings.SHARED_CACHE). With per-process caches, results another worker
+cached stay stale until RESULT_TTL expires them.
+"""
+
+import hashlib
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import geo
+
+# Search centres are snapped to this grid (~20m) before keying
+QUANTUM_DEG = 0.0002
+
+# Snapping moves a centre by at most ~16m, so candidates are fetched
+# this much beyond the radius
+QUANTUM_PAD_KM = 0.05
+
+# Viewports are rounded outwards to this many decimals before keying
+BBOX_DECIMALS = 4
+
+# Invalidation cell size in degrees (~55km north-south)
+VERSION_CELL_DEG = 0.5
+
+# Searches covering more cells than this key on a global version instead
+MAX_VERSION_CELLS = 64
+
+# Results are also dropped after this long, bounding staleness from the
+# per-process snapshot refresh lag, and from version bumps made by other
+# workers when the cache isn't shared
+RESULT_TTL = 30
+
+GLOBAL_VERSION_KEY = 'search_version_global'
+
+# Bumped by any booking change; only searches with a time window use it
+BOOKINGS_VERSION_KEY = 'search_version_bookings'
+
+
+def quantize(value):
+    """Snap a coordinate to the cache grid"""
+    return round(round(value / QUANTUM_DEG) * QUANTUM_DEG, 6)
+
+
+def key_params(params):
+    """
+    Search params shared by every search that uses the same cached
+    candidates: centre snapped to the grid, viewport rounded outwards
+    """
+    bbox = params['bbox']
+    if bbox is not None:
+        step = 10 ** BBOX_DECIMALS
+        south, west, north, east = bbox
+        bbox = (
+            math.floor(south * step) / step, math.floor(west * step) / step,
+            math.ceil(north * step) / step, math.ceil(east * step) / step,
+        )
+    return dict(params, lat=quantize(params['lat']), lng=quantize(params['lng']), bbox=bbox)
+
+
+def covering_params(params):
+    """
+    Params for fetching the candidates of a key: the radius grows by
+    the snapping distance, so the exact search area is always inside
+    """
+    radius = params['radius']
+    return dict(params, radius=None if radius is None else radius + QUANTUM_PAD_KM)
+
+
+def version_cell(lat, lng):
+    """Invalidation cell containing a coordinate"""
+    return f"{math.floor((lat + 90) / VERSION_CELL_DEG)}:{math.floor((lng + 180) / VERSION_CELL_DEG)}"
+
+
+def version_cells(min_lat, max_lat, min_lng, max_lng):
+    """Invalidation cells covering a box, or None if there are too many"""
+    first_row = math.floor((min_lat + 90) / VERSION_CELL_DEG)
+    last_row = math.floor((max_lat + 90) / VERSION_CELL_DEG)
+    first_col = math.floor((min_lng + 180) / VERSION_CELL_DEG)
+    last_col = math.floor((max_lng + 180) / VERSION_CELL_DEG)
+    if (last_row - first_row + 1) * (last_col - first_col + 1) > MAX_VERSION_CELLS:
+        return None
+    return [
+        f"{row}:{col}"
+        for row in range(first_row, last_row + 1)
+        for col in range(first_col, last_col + 1)
+    ]
+
+
+def _version_key(cell):
+    return f"search_version_{cell}"
+
+
+class SearchCache:
+    """
+    Versioned cache of ordered search matches
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'SEARCH_CACHE_ENABLED', True)
+
+    def _covering_cells(self, lat, lng, radius_km, bbox):
+        if bbox is not None:
+            south, west, north, east = bbox
+            if west > east:
+                return None
+            return version_cells(south, north, west, east)
+        return version_cells(*geo.bounding_box(lat, lng, radius_km))
+
+    def key_for(self, params):
+        """
+        Cache key for params from key_params(), including the current versions of the cells the search covers
+        """
+        # The cells of the area candidates are fetched for, padding included
+        covering = covering_params(params)
+        cells = self._covering_cells(
+            covering['lat'], covering['lng'], covering['radius'], covering['bbox']
+        )
+        version_keys = [GLOBAL_VERSION_KEY]
+        if cells is not None:
+            version_keys += [_version_key(cell) for cell in cells]
+        if params.get('start'):
+            version_keys.append(BOOKINGS_VERSION_KEY)
+        versions = cache.get_many(version_keys)
+        if cells is not None:
+            # Cell bumps also bump the global version, which only
+            # matters for searches keyed on it
+            version_keys = version_keys[1:]
+        stamp = ','.join(str(versions.get(key, 0)) for key in version_keys)
+
+        raw = repr((sorted(params.items()), stamp)).encode()
+        return f"search_results_{hashlib.sha1(raw).hexdigest()}"
+
+    def get_or_compute(self, key, part, compute):
+        """
+        Cached value of one part ('candidates', 'facets') of a search,
+        calling compute() on a miss
+
+        Args:
+            key: From key_for()
+            compute: Callable returning the value, e.g. the candidate
+                ids and coordinates
+        """
+        part_key = f"{key}_{part}"
+        value = cache.get(part_key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = compute()
+            cache.set(part_key, value, RESULT_TTL)
+        return value
+
+    def invalidate(self, coords):
+        """
+        Bump the versions of the cells containing the given (lat, lng)
+        positions; None positions are skipped
+        """
+        cells = {
+            version_cell(lat, lng) for lat, lng in coords
+            if lat is not None and lng is not None
+        }
+        self._bump([GLOBAL_VERSION_KEY] + [_version_key(cell) for cell in cells])
+
+    def invalidate_bookings(self):
+        """Expire every cached search with a time window"""
+        self._bump([BOOKINGS_VERSION_KEY])
+
+    def _bump(self, keys):
+        for key in keys:
+            # add() is a no-op when the key exists; incr() then bumps it
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Evicted between add() and incr()
+                cache.set(key, 1, None)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """Hit ratio and invalidation count for this process"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+        }
+
+
+# Singleton instance
+search_cache = SearchCache()
@@ -36,12 +36,18 @@ class ItemListSerializer(serializers.ModelSerializer):
         ]
     
     def get_distance_km(self, obj):
-        """Get pre-calculated distance from context"""
-        return self.context.get('distances', {}).get(obj.id)
+        """Get distance annotated by Item.objects.within()"""
+        distance = getattr(obj, 'distance_km', None)
+        if distance is None:
+            distance = self.context.get('distances', {}).get(obj.id)
+        return distance
     
     def get_has_video_demo(self, obj):
-        """Check if item has video demo"""
-        return obj.videos.exists()
+        """Use the with_video_flag() annotation, falling back to a query"""
+        has_video_demo = getattr(obj, 'has_video_demo', None)
+        if has_video_demo is None:
+            has_video_demo = obj.videos.exists()
+        return has_video_demo
 
 class ItemDetailSerializer(serializers.ModelSerializer):
     """
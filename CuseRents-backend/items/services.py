@@ -1,31 +1,127 @@
 import googlemaps
-import math
 from django.conf import settings
-from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from .geo import haversine_km
+from .geocache import geocode_cache
+from .ratelimit import CacheTokenBucket, CircuitBreaker, TokenBucket
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
+# API statuses worth retrying; others (e.g. INVALID_REQUEST) fail the same way again
+TRANSIENT_API_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+
+class GeocodingUnavailable(Exception):
+    """The provider is not called: circuit open or no rate limit token in time"""
+
+
+def is_transient(error):
+    """Whether a Google Maps client error may succeed if retried"""
+    if isinstance(error, googlemaps.exceptions.ApiError):
+        return error.status in TRANSIENT_API_STATUSES
+    return isinstance(error, (googlemaps.exceptions.TransportError, googlemaps.exceptions.Timeout))
+
+
 class GeocodingService:
     """
     Service for handling Google Maps geocoding operations
+    
+    Every outbound call goes through _call(), which takes a rate limit
+    token, retries transient errors with jittered exponential backoff and
+    fails fast while the circuit breaker is open.
     """
+    MAX_RETRIES = 3
+    BACKOFF_BASE = 0.5  # seconds, doubled per retry
+    BACKOFF_MAX = 8.0
+    # Longest a call waits for a rate limit token before giving up (None
+    # waits as long as it takes, e.g. in batch jobs)
+    RATE_LIMIT_TIMEOUT = 5.0
+    BREAKER_THRESHOLD = 5
+    BREAKER_RESET_TIMEOUT = 30.0
     
-    def __init__(self):
-        """Initialize Google Maps client"""
-        api_key = settings.GOOGLE_MAPS_API_KEY
-        if not api_key:
+    def __init__(self, client=None, rate=None):
+        """
+        Initialize Google Maps client
+        
+        Args:
+            client: Optional client to use instead (e.g. a stub in tests)
+            rate: Optional requests per second, instead of
+                GOOGLE_MAPS_RATE_LIMIT
+        """
+        if client is not None:
+            self.client = client
+        elif not settings.GOOGLE_MAPS_API_KEY:
             logger.warning("Google Maps API key not configured")
             self.client = None
         else:
-            self.client = googlemaps.Client(key=api_key)
+            # Retries and rate limiting are done here, not in the client
+            self.client = googlemaps.Client(
+                key=settings.GOOGLE_MAPS_API_KEY,
+                timeout=10,
+                retry_timeout=10,
+                retry_over_query_limit=False,
+            )
+        
+        rate = rate or settings.GOOGLE_MAPS_RATE_LIMIT
+        if settings.GOOGLE_MAPS_SHARED_RATE_LIMIT:
+            if not settings.SHARED_CACHE:
+                raise ImproperlyConfigured(
+                    "GOOGLE_MAPS_SHARED_RATE_LIMIT needs a shared cache (REDIS_URL)"
+                )
+            self.rate_limiter = CacheTokenBucket('google_maps_rate', rate)
+        else:
+            self.rate_limiter = TokenBucket(rate)
+        self.breaker = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_RESET_TIMEOUT)
+    
+    def _call(self, method, *args, **kwargs):
+        """
+        Call a client method under the rate limit, retrying transient errors
+        
+        Raises:
+            GeocodingUnavailable: The circuit is open or the rate limit
+                didn't allow a call in time
+            Exception: The client's error, once retries are exhausted or
+                if it isn't transient
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            # Checked before waiting for a token, so an open circuit fails
+            # fast; allow() then claims the half-open trial call, if any
+            if self.breaker.state == 'open':
+                raise GeocodingUnavailable("Google Maps circuit open")
+            if not self.rate_limiter.acquire(timeout=self.RATE_LIMIT_TIMEOUT):
+                raise GeocodingUnavailable("Google Maps rate limit exceeded")
+            if not self.breaker.allow():
+                raise GeocodingUnavailable("Google Maps circuit open")
+            try:
+                result = getattr(self.client, method)(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The provider answered, but that doesn't show it recovered
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.MAX_RETRIES:
+                    raise
+                # Full jitter, so retrying workers don't move in lockstep
+                delay = random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+                logger.warning(f"Google Maps {method} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
     
-    def address_to_coords(self, address_text):
+    def address_to_coords(self, address_text, raise_unavailable=False):
         """
         Convert address to coordinates using Google Geocoding API
         
         Args:
             address_text (str): Full address string
+            raise_unavailable (bool): Raise GeocodingUnavailable instead of
+                returning None when the provider isn't called, so callers
+                can retry later rather than treat the address as failed
             
         Returns:
             dict: {
@@ -35,23 +131,23 @@ class GeocodingService:
                 'formatted_address': str
             } or None if failed
         """
+        # Check cache first: this process, then the shared cache
+        hit, cached_result = geocode_cache.get(address_text)
+        if hit:
+            logger.info(f"Using cached geocoding result for: {address_text}")
+            return cached_result
+        
         if not self.client:
             logger.error("Google Maps client not initialized")
             return None
         
-        # Check cache first (cache for 30 days)
-        cache_key = f"geocode_address_{address_text}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Using cached geocoding result for: {address_text}")
-            return cached_result
-        
         try:
             # Call Google Geocoding API
-            geocode_result = self.client.geocode(address_text)
+            geocode_result = self._call('geocode', address_text)
             
             if not geocode_result:
                 logger.warning(f"No geocoding results found for: {address_text}")
+                geocode_cache.set(address_text, None)
                 return None
             
             # Extract first result
@@ -66,14 +162,22 @@ class GeocodingService:
                 'formatted_address': formatted_address
             }
             
-            # Cache the result
-            cache.set(cache_key, result, 60 * 60 * 24 * 30)  # 30 days
+            # Cache the result (for 30 days)
+            geocode_cache.set(address_text, result)
             
             logger.info(f"Successfully geocoded: {address_text} → ({result['lat']}, {result['lng']})")
             return result
             
+        except GeocodingUnavailable as e:
+            if raise_unavailable:
+                raise
+            logger.warning(f"Skipped geocoding {address_text}: {e}")
+            return None
         except googlemaps.exceptions.ApiError as e:
             logger.error(f"Google Maps API error: {e}")
+            if not is_transient(e):
+                # e.g. INVALID_REQUEST: the same address fails the same way
+                geocode_cache.set(address_text, None)
             return None
         except Exception as e:
             logger.error(f"Unexpected error during geocoding: {e}")
@@ -90,36 +194,41 @@ class GeocodingService:
         Returns:
             str: Formatted address or None if failed
         """
+        # Check cache first: the grid cell, then addresses known in it
+        hit, cached_result = geocode_cache.get_reverse(lat, lng)
+        if hit:
+            logger.info(f"Using cached reverse geocoding result for: ({lat}, {lng})")
+            return cached_result
+        
         if not self.client:
             logger.error("Google Maps client not initialized")
             return None
         
-        # Check cache first
-        cache_key = f"reverse_geocode_{lat}_{lng}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Using cached reverse geocoding result for: ({lat}, {lng})")
-            return cached_result
-        
         try:
             # Call Google Reverse Geocoding API
-            reverse_geocode_result = self.client.reverse_geocode((lat, lng))
+            reverse_geocode_result = self._call('reverse_geocode', (lat, lng))
             
             if not reverse_geocode_result:
                 logger.warning(f"No reverse geocoding results found for: ({lat}, {lng})")
+                geocode_cache.set_reverse(lat, lng, None)
                 return None
             
             # Extract formatted address
             formatted_address = reverse_geocode_result[0].get('formatted_address', '')
             
-            # Cache the result
-            cache.set(cache_key, formatted_address, 60 * 60 * 24 * 30)  # 30 days
+            # Cache the result for the whole cell (for 30 days)
+            geocode_cache.set_reverse(lat, lng, formatted_address)
             
             logger.info(f"Successfully reverse geocoded: ({lat}, {lng}) → {formatted_address}")
             return formatted_address
             
+        except GeocodingUnavailable as e:
+            logger.warning(f"Skipped reverse geocoding ({lat}, {lng}): {e}")
+            return None
         except googlemaps.exceptions.ApiError as e:
             logger.error(f"Google Maps API error: {e}")
+            if not is_transient(e):
+                geocode_cache.set_reverse(lat, lng, None)
             return None
         except Exception as e:
             logger.error(f"Unexpected error during reverse geocoding: {e}")
@@ -149,13 +258,14 @@ class GeocodingService:
         
         try:
             # Use Places Autocomplete for suggestions
-            autocomplete_result = self.client.places_autocomplete(
+            autocomplete_result = self._call(
+                'places_autocomplete',
                 input_text=address_text,
                 types='address'
             )
             
             # Try exact geocoding
-            geocode_result = self.client.geocode(address_text)
+            geocode_result = self._call('geocode', address_text)
             
             valid = len(geocode_result) > 0
             formatted_address = geocode_result[0]['formatted_address'] if valid else address_text
@@ -192,22 +302,7 @@ class GeocodingService:
         Returns:
             float: Distance in kilometers
         """
-        R = 6371  # Earth's radius in kilometers
-        
-        # Convert to radians
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lng = math.radians(lng2 - lng1)
-        
-        # Haversine formula
-        a = (math.sin(delta_lat / 2) ** 2 +
-             math.cos(lat1_rad) * math.cos(lat2_rad) *
-             math.sin(delta_lng / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        distance = R * c
-        return round(distance, 2)
+        return haversine_km(lat1, lng1, lat2, lng2)
     
     def get_distance_matrix(self, origins, destinations):
         """
@@ -225,7 +320,8 @@ class GeocodingService:
             return None
         
         try:
-            result = self.client.distance_matrix(
+            result = self._call(
+                'distance_matrix',
                 origins=origins,
                 destinations=destinations,
                 mode='driving'
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from bookings.transitions import booking_transitioned
+from . import fulltext
+from .autocomplete import title_index
+from .models import Item, ItemVideo
+from .search_cache import search_cache
+from .snapshot import item_snapshot
+
+# Saves touching only other fields cannot change search results or facets
+SEARCH_FIELDS = {
+    'lat', 'lng', 'category', 'price_per_hour', 'is_available', 'title', 'description',
+    'rating_avg', 'total_ratings',
+}
+
+
+@receiver(post_save, sender=Item)
+def refresh_snapshot_on_save(sender, instance, **kwargs):
+    """Make this process pick up item changes on its next search"""
+    item_snapshot.mark_stale()
+    title_index.mark_stale()
+
+
+@receiver(booking_transitioned)
+def refresh_titles_on_completion(sender, action, **kwargs):
+    """Completion bumps total_rentals with a queryset update, which ranks suggestions"""
+    if action == 'complete':
+        transaction.on_commit(title_index.mark_stale)
+
+
+@receiver(post_delete, sender=Item)
+def discard_from_snapshot(sender, instance, **kwargs):
+    """Deleted items never show up in an updated_at refresh, so drop them here"""
+    item_snapshot.discard([instance.pk])
+    title_index.discard([instance.pk])
+
+
+@receiver(post_save, sender=Item)
+def update_fulltext_index(sender, instance, update_fields=None, using='default', **kwargs):
+    """Reindex the item's text when it might have changed"""
+    if update_fields is not None and not set(fulltext.TEXT_FIELDS) & set(update_fields):
+        return
+    fulltext.index_item(instance, using=using)
+
+
+@receiver(post_delete, sender=Item)
+def remove_from_fulltext_index(sender, instance, using='default', **kwargs):
+    fulltext.unindex_item(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Item)
+def invalidate_search_cache_on_save(sender, instance, update_fields=None, **kwargs):
+    """Expire cached searches around the item's old and new position"""
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    coords = [
+        getattr(instance, '_loaded_coords', (None, None)),
+        (instance.lat, instance.lng),
+    ]
+    instance._loaded_coords = (instance.lat, instance.lng)
+    # Wait for the commit so a search can't re-cache the old rows
+    transaction.on_commit(lambda: search_cache.invalidate(coords))
+
+
+@receiver(post_delete, sender=Item)
+def invalidate_search_cache_on_delete(sender, instance, **kwargs):
+    coords = [(instance.lat, instance.lng)]
+    transaction.on_commit(lambda: search_cache.invalidate(coords))
+
+
+@receiver(post_save, sender=ItemVideo)
+@receiver(post_delete, sender=ItemVideo)
+def invalidate_search_cache_on_video_change(sender, instance, **kwargs):
+    """Videos only show up in the has-video facet, but that is cached too"""
+    coords = list(Item.objects.filter(pk=instance.item_id).values_list('lat', 'lng'))
+    transaction.on_commit(lambda: search_cache.invalidate(coords))
+
+
+@receiver(post_save, sender='bookings.Booking')
+@receiver(post_delete, sender='bookings.Booking')
+@receiver(booking_transitioned)
+@receiver(post_save, sender='bookings.BookingItem')
+@receiver(post_delete, sender='bookings.BookingItem')
+def invalidate_windowed_searches(sender, **kwargs):
+    """Bookings decide which items are free in a time window"""
+    transaction.on_commit(search_cache.invalidate_bookings)
@@ -0,0 +1,335 @@
+"""
+In-memory location snapshot of available items
+
+Map searches only need id/lat/lng/category/price/availability to decide
+which items match, so each process keeps those columns in NumPy arrays
+and answers radius queries from them. The views then load full rows for
+a single page of results only.
+
+The snapshot is an incremental index (items/incremental.py) whose main
+segment is sorted by grid cell, so a radius query only slices the
+covering cells.
+"""
+
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import cKDTree
+
+from . import clustering, geo, incremental
+
+# Rebuild marker clusters at most this often (seconds)
+CLUSTER_REBUILD_INTERVAL = 30.0
+
+COLUMNS = ('cell', 'id', 'lat', 'lng', 'category', 'price')
+DTYPES = {
+    'cell': np.int64,
+    'id': np.int64,
+    'lat': np.float64,
+    'lng': np.float64,
+    'category': np.int8,
+    'price': np.float64,
+}
+
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=DTYPES[name]) for name in COLUMNS}
+
+
+def _build_columns(rows, category_codes):
+    """Build column arrays from (id, lat, lng, category, price) tuples"""
+    if not rows:
+        return _empty_columns()
+    ids, lats, lngs, categories, prices = zip(*rows)
+    lat = np.array(lats, dtype=np.float64)
+    lng = np.array(lngs, dtype=np.float64)
+    return {
+        'cell': np.array([geo.cell_for(a, b) for a, b in zip(lats, lngs)], dtype=np.int64),
+        'id': np.array(ids, dtype=np.int64),
+        'lat': lat,
+        'lng': lng,
+        'category': np.array(
+            [category_codes.get(c, -1) for c in categories], dtype=np.int8
+        ),
+        'price': np.array([float(p) for p in prices], dtype=np.float64),
+    }
+
+
+def _unit_vectors(lat, lng):
+    """Points on the unit sphere; chord length orders like great-circle distance"""
+    lat_rad = np.radians(lat)
+    lng_rad = np.radians(lng)
+    return np.column_stack((
+        np.cos(lat_rad) * np.cos(lng_rad),
+        np.cos(lat_rad) * np.sin(lng_rad),
+        np.sin(lat_rad),
+    ))
+
+
+class _Segment(incremental.Segment):
+    """Main rows sorted by grid cell, so a radius query only slices the covering cells"""
+    sort_column = 'cell'
+
+    def __init__(self, columns):
+        super().__init__(columns)
+        # KD-trees per category, built on first k-NN query
+        self._trees = {}
+        self._trees_lock = threading.Lock()
+
+    def tree(self, category_code=None):
+        """
+        KD-tree over the rows of one category (None for all rows)
+
+        Returns:
+            tuple: (cKDTree or None, row positions indexed by tree point)
+        """
+        with self._trees_lock:
+            if category_code not in self._trees:
+                if category_code is None:
+                    rows = np.arange(len(self))
+                else:
+                    rows = np.flatnonzero(self.columns['category'] == category_code)
+                points = _unit_vectors(self.columns['lat'][rows], self.columns['lng'][rows])
+                tree = cKDTree(points) if len(rows) else None
+                self._trees[category_code] = (tree, rows)
+            return self._trees[category_code]
+
+
+class ItemLocationSnapshot(incremental.IncrementalIndex):
+    """
+    Per-process, column-oriented copy of available items
+    """
+    name = 'item snapshot'
+    fields = ('id', 'lat', 'lng', 'category', 'price_per_hour')
+    segment_class = _Segment
+
+    def __init__(self):
+        self._clusters_lock = threading.Lock()
+        super().__init__()
+
+    def build_columns(self, rows):
+        return _build_columns(rows, self.category_codes)
+
+    def reset(self):
+        """Drop all data; the next query rebuilds from the database"""
+        super().reset()
+        with self._clusters_lock:
+            self._clusters = (None, None, 0.0)
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'ITEM_SNAPSHOT_ENABLED', True)
+
+    # Queries
+
+    @staticmethod
+    def _in_box(state, min_lat, max_lat, min_lng, max_lng):
+        """Columns of the live rows inside a lat/lng box"""
+        ranges = geo.cell_ranges(min_lat, max_lat, min_lng, max_lng)
+        cells = state.main['cell']
+        if not ranges:
+            # Empty box, e.g. from a negative radius
+            positions = np.empty(0, dtype=np.int64)
+        elif len(ranges) <= geo.MAX_CELL_ROWS:
+            firsts, lasts = np.array(ranges, dtype=np.int64).T
+            starts = np.searchsorted(cells, firsts, side='left')
+            stops = np.searchsorted(cells, lasts, side='right')
+            positions = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+            positions = positions[state.live[positions]]
+        else:
+            positions = np.flatnonzero(state.live)
+
+        candidates = {
+            name: np.concatenate([state.main[name][positions], state.tail[name]])
+            for name in ('id', 'lat', 'lng', 'category', 'price')
+        }
+        mask = (
+            (candidates['lat'] >= min_lat) & (candidates['lat'] <= max_lat) &
+            (candidates['lng'] >= min_lng) & (candidates['lng'] <= max_lng)
+        )
+        return {name: array[mask] for name, array in candidates.items()}
+
+    def in_bbox(self, south, west, north, east):
+        """
+        Columns (id, lat, lng, category, price) of the available items
+        inside a viewport; west > east means it crosses the antimeridian
+        """
+        self.ensure_fresh()
+        return self._in_viewport(self._state, south, west, north, east)
+
+    @classmethod
+    def _in_viewport(cls, state, south, west, north, east):
+        parts = [
+            cls._in_box(state, south, north, low, high)
+            for low, high in clustering.lng_ranges(west, east)
+        ]
+        return {
+            name: np.concatenate([part[name] for part in parts])
+            for name in parts[0]
+        }
+
+    def cluster_index(self):
+        """
+        Marker clusters for every zoom level
+
+        Rebuilt when the snapshot has changed, but at most once every
+        CLUSTER_REBUILD_INTERVAL seconds since a full build is O(n).
+        """
+        self.ensure_fresh()
+        state = self._state
+        with self._clusters_lock:
+            clusters, built_from, built_at = self._clusters
+            if clusters is None or (
+                built_from is not state
+                and time.monotonic() - built_at >= CLUSTER_REBUILD_INTERVAL
+            ):
+                columns = state.live_columns()
+                clusters = clustering.ClusterIndex(
+                    columns['id'], columns['lat'], columns['lng'],
+                    columns['price'], columns['category'],
+                    self.category_codes.keys(),
+                )
+                self._clusters = (clusters, state, time.monotonic())
+            return clusters
+
+    def search(self, lat, lng, radius_km=None, bbox=None, category=None,
+               min_price=None, max_price=None, ids=None, exclude_ids=None,
+               after=None, limit=None, with_coords=False):
+        """
+        Available items within radius_km of (lat, lng), or inside a
+        (south, west, north, east) viewport with distances still measured
+        from (lat, lng)
+
+        Args:
+            ids: Optional item ids to restrict matches to (e.g. full-text
+                matches)
+            exclude_ids: Optional item ids to leave out (e.g. booked ones)
+            after (tuple): Optional (distance, id) keyset cursor; only items
+                ordered after it are returned
+            limit (int): Optional maximum number of items
+            with_coords (bool): Also return the items' latitudes and
+                longitudes
+
+        Returns:
+            tuple: (ids, distances), or (ids, distances, lats, lngs), as
+            NumPy arrays, nearest first and newest first among equal
+            distances
+        """
+        self.ensure_fresh()
+        state = self._state
+
+        if bbox is not None:
+            candidates = self._in_viewport(state, *bbox)
+        else:
+            candidates = self._in_box(state, *geo.bounding_box(lat, lng, radius_km))
+
+        mask = np.ones(len(candidates['id']), dtype=bool)
+        if category:
+            mask &= candidates['category'] == self.category_codes.get(category, -2)
+        if min_price is not None:
+            mask &= candidates['price'] >= min_price
+        if max_price is not None:
+            mask &= candidates['price'] <= max_price
+        if ids is not None:
+            mask &= np.isin(candidates['id'], np.asarray(ids, dtype=np.int64))
+        if exclude_ids:
+            mask &= ~np.isin(candidates['id'], np.fromiter(exclude_ids, dtype=np.int64))
+
+        ids = candidates['id'][mask]
+        lats, lngs = candidates['lat'][mask], candidates['lng'][mask]
+        distances = geo.haversine_array(lat, lng, lats, lngs)
+
+        keep = np.ones(len(ids), dtype=bool)
+        if radius_km is not None:
+            keep &= distances <= radius_km
+        if after is not None:
+            after_distance, after_id = after
+            keep &= (distances > after_distance) | (
+                (distances == after_distance) & (ids < after_id)
+            )
+        ids, distances, lats, lngs = ids[keep], distances[keep], lats[keep], lngs[keep]
+
+        if limit is not None and len(ids) > limit:
+            # Only rows up to the limit-th smallest distance need sorting
+            cutoff = np.partition(distances, limit - 1)[limit - 1]
+            near = np.flatnonzero(distances <= cutoff)
+            ids, distances, lats, lngs = ids[near], distances[near], lats[near], lngs[near]
+
+        order = np.lexsort((-ids, distances))[:limit]
+        if with_coords:
+            return ids[order], distances[order], lats[order], lngs[order]
+        return ids[order], distances[order]
+
+    def nearest(self, lat, lng, k, category=None):
+        """
+        The k available items closest to (lat, lng)
+
+        Main rows are searched through a KD-tree built once per segment;
+        rows that were replaced since are skipped and the (small) tail is
+        checked directly.
+
+        Returns:
+            tuple: (ids, distances) as NumPy arrays, nearest first
+        """
+        self.ensure_fresh()
+        state = self._state
+        category_code = self.category_codes.get(category, -2) if category else None
+
+        tree, rows = state.segment.tree(category_code)
+        main_rows = np.empty(0, dtype=np.int64)
+        if tree is not None:
+            point = _unit_vectors(np.array([lat]), np.array([lng]))[0]
+            # Ask for extra neighbours to make up for replaced rows
+            want = min(k + int(len(state.live) - state.live.sum()), tree.n)
+            while True:
+                _, found = tree.query(point, k=max(want, 1))
+                found = np.atleast_1d(found)
+                main_rows = rows[found[found < tree.n]]
+                main_rows = main_rows[state.live[main_rows]]
+                if len(main_rows) >= k or want >= tree.n:
+                    break
+                want = min(want * 2, tree.n)
+            main_rows = main_rows[:k]
+
+        tail = state.tail
+        tail_rows = np.arange(len(tail['id']))
+        if category_code is not None:
+            tail_rows = tail_rows[tail['category'] == category_code]
+
+        ids = np.concatenate([state.main['id'][main_rows], tail['id'][tail_rows]])
+        distances = geo.haversine_array(
+            lat, lng,
+            np.concatenate([state.main['lat'][main_rows], tail['lat'][tail_rows]]),
+            np.concatenate([state.main['lng'][main_rows], tail['lng'][tail_rows]]),
+        )
+
+        order = np.lexsort((-ids, distances))[:k]
+        return ids[order], distances[order]
+
+    # Metrics
+
+    def stats(self):
+        """Memory usage and refresh lag of this process's snapshot"""
+        state = self._state
+        now = time.monotonic()
+        return {
+            'rows': state.rows,
+            'tail_rows': len(state.tail['id']),
+            'memory_bytes': state.nbytes,
+            'refresh_lag_seconds': (
+                round(now - self._last_refresh, 3) if self._last_refresh else None
+            ),
+            'last_refresh_ms': round(self._last_refresh_duration * 1000, 2),
+            'watermark': self._watermark,
+            'refresh_count': self._refresh_count,
+            'full_rebuild_count': self._full_rebuild_count,
+            'clusters_age_seconds': (
+                round(now - self._clusters[2], 3) if self._clusters[0] is not None else None
+            ),
+        }
+
+
+# Singleton instance
+item_snapshot = ItemLocationSnapshot()
@@ -1,3 +1,1195 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+import json
+import os
+import random
+import tempfile
+import threading
+from unittest import mock
+from django.core.management import CommandError, call_command
+import googlemaps
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from bookings.models import Booking
+from . import clustering, geo, incremental
+from .autocomplete import title_index
+from .geocache import cache_key, canonical_address, cell_bounds, geocode_cache, reverse_cell
+from .management.commands.geocode_items import FakeGeocodingService
+from .models import Item, ItemVideo, Bundle, BundleItem
+from .pagination import DistanceCursorPagination
+from .ratelimit import CacheTokenBucket, TokenBucket
+from .search_cache import QUANTUM_PAD_KM, key_params, search_cache
+from .services import GeocodingService, GeocodingUnavailable
+from .snapshot import item_snapshot
 
-# Create your tests here.
+User = get_user_model()
+
+
+def create_item(owner, **fields):
+    """Create an item at Syracuse University, with any fields overridden"""
+    return Item.objects.create(**{
+        'owner': owner,
+        'title': 'Cordless drill',
+        'description': 'Test item',
+        'category': 'tools',
+        'price_per_hour': 5,
+        'address_text': 'Syracuse University',
+        'lat': 43.0361,
+        'lng': -76.1275,
+        'photo_url': 'https://example.com/item.jpg',
+        **fields,
+    })
+
+
+def scatter_items(owner, count=120, spread=0.2, seed=1):
+    """Items spread uniformly around campus, across many grid cells"""
+    rng = random.Random(seed)
+    return [
+        create_item(
+            owner,
+            title=f'Item {i}',
+            category=rng.choice(['tools', 'camera', 'sports']),
+            price_per_hour=rng.choice([5, 12, 30]),
+            lat=43.0361 + rng.uniform(-spread, spread),
+            lng=-76.1275 + rng.uniform(-spread, spread),
+        )
+        for i in range(count)
+    ]
+
+
+def full_scan(items, lat, lng, radius_km):
+    """Ids within radius_km, checked one by one, nearest first"""
+    matches = [
+        (geo.haversine_km(lat, lng, item.lat, item.lng), -item.id, item.id) for item in items
+    ]
+    return [item_id for distance, _, item_id in sorted(matches) if distance <= radius_km]
+
+
+@override_settings(ITEM_SNAPSHOT_ENABLED=False, SEARCH_CACHE_ENABLED=False)
+class GridPrefilterTests(TestCase):
+    """Radius search narrowed by grid cells finds exactly what a full scan does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(owner)
+        # On a cell boundary
+        cls.items.append(create_item(owner, lat=43.05, lng=-76.15))
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def test_cells(self):
+        self.assertEqual(self.items[-1].geo_cell, geo.cell_for(43.05, -76.15))
+        self.assertEqual(geo.cell_for(90, 180), geo.CELL_ROWS * geo.CELL_COLS - 1)
+        self.assertIsNone(geo.cell_for(None, -76.15))
+
+    def test_matches_full_scan(self):
+        for lat, lng, radius in [
+            (43.0361, -76.1275, 5), (43.05, -76.15, 2.5), (43.1, -76.0, 12), (43.0361, -76.1275, 0.5)
+        ]:
+            with self.subTest(lat=lat, lng=lng, radius=radius):
+                found = list(Item.objects.within(lat, lng, radius).values_list('id', flat=True))
+                self.assertEqual(sorted(found), sorted(full_scan(self.items, lat, lng, radius)))
+
+    def test_invalid_coordinates(self):
+        for params in [{'lat': 'nan', 'lng': '-76.1'}, {'lat': '43', 'lng': 'inf'},
+                       {'lat': '91', 'lng': '0'}, {'lat': '43'}]:
+            for url in ['/api/items/items/search/', '/api/items/items/nearby/']:
+                with self.subTest(url=url, **params):
+                    self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+@override_settings(ITEM_SNAPSHOT_ENABLED=False, SEARCH_CACHE_ENABLED=False)
+class DatabaseDistanceTests(TestCase):
+    """Distances computed by the database agree with haversine_km()"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(owner, count=40)
+
+    def test_annotation_matches_python(self):
+        rows = list(
+            Item.objects.by_distance(43.0361, -76.1275).values_list('lat', 'lng', 'distance_km')
+        )
+        self.assertEqual(len(rows), 40)
+        for lat, lng, distance in rows:
+            self.assertEqual(distance, geo.haversine_km(43.0361, -76.1275, lat, lng))
+        distances = [distance for _, _, distance in rows]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_search_distances(self):
+        response = APIClient(SERVER_NAME='localhost').get(
+            '/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275, 'radius': 10}
+        )
+        results = response.json()['results']
+        items = {item.id: item for item in self.items}
+        self.assertEqual(
+            [result['id'] for result in results][:20],
+            full_scan(self.items, 43.0361, -76.1275, 10)[:20]
+        )
+        for result in results:
+            item = items[result['id']]
+            self.assertEqual(
+                result['distance_km'], geo.haversine_km(43.0361, -76.1275, item.lat, item.lng)
+            )
+
+    def test_rejects_non_finite_origin(self):
+        with self.assertRaises(ValueError):
+            geo.Haversine(float('nan'), -76.1275)
+
+
+class AntipodalDistanceTests(TestCase):
+    """Near-antipodal points, where rounding pushes the haversine term past 1"""
+
+    # The item is exactly opposite this origin
+    ORIGIN = (66.16849958870057, -92.19208432063249)
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.item = create_item(owner, lat=-66.16849958870057, lng=87.80791567936751)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        cache.clear()
+        item_snapshot.reset()
+
+    def test_kernels(self):
+        lat, lng = self.ORIGIN
+        self.assertEqual(geo.haversine_km(lat, lng, self.item.lat, self.item.lng), 20015.09)
+        self.assertEqual(
+            geo.haversine_array(lat, lng, [self.item.lat], [self.item.lng]).tolist(), [20015.09]
+        )
+
+    def test_endpoints(self):
+        lat, lng = self.ORIGIN
+        for snapshot in (True, False):
+            with self.subTest(snapshot=snapshot), self.settings(ITEM_SNAPSHOT_ENABLED=snapshot):
+                response = self.client.get('/api/items/items/nearest/', {'lat': lat, 'lng': lng})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [(r['id'], r['distance_km']) for r in response.json()], [(self.item.id, 20015.09)]
+                )
+
+                response = self.client.get(
+                    '/api/items/items/search/', {'lat': lat, 'lng': lng, 'radius': 20100}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [(r['id'], r['distance_km']) for r in response.json()['results']],
+                    [(self.item.id, 20015.09)]
+                )
+
+
+class HaversineKernelTests(TestCase):
+    """The NumPy kernel agrees with the scalar formula"""
+
+    def test_matches_scalar(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(-89, 89), rng.uniform(-180, 180)) for _ in range(200)]
+        lats, lngs = zip(*points)
+        distances = geo.haversine_array(43.0361, -76.1275, lats, lngs)
+        # Both round to 10m; allow a rounding step for the last ulp
+        np.testing.assert_allclose(
+            distances,
+            [geo.haversine_km(43.0361, -76.1275, lat, lng) for lat, lng in points],
+            rtol=0, atol=0.01 + 1e-9
+        )
+
+    def test_broadcast_and_edges(self):
+        self.assertEqual(geo.haversine_array([0, 10], [0, 0], 0, 0).tolist(), [0.0, 1111.95])
+        self.assertEqual(geo.haversine_km(0, 0, 0, 180), 20015.09)
+        self.assertEqual(geo.haversine_array(0, 0, [0], [180]).tolist(), [20015.09])
+
+
+@override_settings(SEARCH_CACHE_ENABLED=False)
+class ItemSnapshotTests(TestCase):
+    """Searches from the in-memory snapshot match the database and follow item changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(cls.owner)
+        for item in cls.items[::10]:
+            item.is_available = False
+            item.save()
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+
+    @staticmethod
+    def database_matches(lat, lng, radius, category=None, min_price=None):
+        queryset = Item.objects.filter(is_available=True)
+        if category:
+            queryset = queryset.filter(category=category)
+        if min_price is not None:
+            queryset = queryset.filter(price_per_hour__gte=min_price)
+        return list(
+            queryset.within(lat, lng, radius).order_by('distance_km', '-id')
+            .values_list('id', 'distance_km')
+        )
+
+    @staticmethod
+    def snapshot_matches(lat, lng, radius, **filters):
+        ids, distances = item_snapshot.search(lat, lng, radius_km=radius, **filters)
+        return list(zip(ids.tolist(), distances.tolist()))
+
+    def test_matches_database(self):
+        for lat, lng, radius, filters in [
+            (43.0361, -76.1275, 5, {}),
+            (43.0361, -76.1275, 15, {'category': 'camera'}),
+            (43.1, -76.0, 10, {'min_price': 12}),
+            (43.05, -76.15, 40, {}),
+        ]:
+            with self.subTest(lat=lat, lng=lng, radius=radius, **filters):
+                self.assertEqual(
+                    self.snapshot_matches(lat, lng, radius, **filters),
+                    self.database_matches(lat, lng, radius, **filters)
+                )
+
+    def test_follows_changes(self):
+        self.snapshot_matches(43.0361, -76.1275, 40)
+        rebuilds = item_snapshot.stats()['full_rebuild_count']
+
+        moved, hidden, deleted = self.items[1], self.items[2], self.items[3]
+        moved.lat, moved.lng = 43.0361, -76.1275
+        moved.save()
+        hidden.is_available = False
+        hidden.save()
+        deleted.delete()
+        added = create_item(self.owner, lat=43.0362)
+
+        found = self.snapshot_matches(43.0361, -76.1275, 40)
+        self.assertEqual(found, self.database_matches(43.0361, -76.1275, 40))
+        self.assertEqual(found[0][0], moved.id)
+        self.assertIn(added.id, dict(found))
+        # Applied as a delta on top of the main segment
+        stats = item_snapshot.stats()
+        self.assertEqual(stats['full_rebuild_count'], rebuilds)
+        self.assertGreater(stats['tail_rows'], 0)
+
+    def test_serves_current_state_during_refresh(self):
+        before = self.snapshot_matches(43.0361, -76.1275, 40)
+        create_item(self.owner, lat=43.0362)
+        found = []
+        # Another thread is refreshing: answer from the current state
+        # rather than waiting for it
+        with item_snapshot._lock:
+            reader = threading.Thread(
+                target=lambda: found.append(self.snapshot_matches(43.0361, -76.1275, 40))
+            )
+            reader.start()
+            reader.join(timeout=5)
+            self.assertFalse(reader.is_alive())
+        self.assertEqual(found, [before])
+        self.assertEqual(
+            self.snapshot_matches(43.0361, -76.1275, 40),
+            self.database_matches(43.0361, -76.1275, 40)
+        )
+
+    def test_invalid_radius(self):
+        self.assertEqual(self.snapshot_matches(43.0361, -76.1275, -1), [])
+        for enabled in [True, False]:
+            with self.subTest(snapshot=enabled), self.settings(ITEM_SNAPSHOT_ENABLED=enabled):
+                for radius in ['-1', '0', 'nan', 'far']:
+                    response = self.client.get(
+                        '/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275, 'radius': radius}
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+    def test_invalid_price(self):
+        for params in [{'min_price': 'abc'}, {'max_price': 'nan'}, {'min_price': '5', 'max_price': 'x'}]:
+            with self.subTest(**params):
+                response = self.client.get(
+                    '/api/items/items/search/', dict(params, lat=43.0361, lng=-76.1275)
+                )
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            '/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275, 'min_price': '5'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class NearestItemsTests(TestCase):
+    """nearest returns the k closest available items on both paths"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(owner, count=150)
+        for item in cls.items[::7]:
+            item.is_available = False
+            item.save()
+        cls.available = [item for item in cls.items if item.is_available]
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+
+    def nearest(self, **params):
+        response = self.client.get('/api/items/items/nearest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(result['id'], result['distance_km']) for result in response.json()]
+
+    def expected(self, lat, lng, k, category=None):
+        items = [item for item in self.available if not category or item.category == category]
+        matches = sorted(
+            (geo.haversine_km(lat, lng, item.lat, item.lng), -item.id) for item in items
+        )
+        return [(-negative_id, distance) for distance, negative_id in matches[:k]]
+
+    def test_ordering_and_parity(self):
+        for params in [
+            {'lat': 43.0361, 'lng': -76.1275, 'k': 10},
+            {'lat': 43.2, 'lng': -76.3, 'k': 25, 'category': 'camera'},
+        ]:
+            with self.subTest(**params):
+                expected = self.expected(
+                    params['lat'], params['lng'], params['k'], params.get('category')
+                )
+                snapshot = self.nearest(**params)
+                with self.settings(ITEM_SNAPSHOT_ENABLED=False):
+                    database = self.nearest(**params)
+                self.assertEqual([d for _, d in snapshot], [d for _, d in expected])
+                self.assertEqual([d for _, d in database], [d for _, d in expected])
+                self.assertEqual({i for i, _ in snapshot}, {i for i, _ in expected})
+
+    def test_skips_changed_rows(self):
+        self.nearest(lat=43.0361, lng=-76.1275)
+        closest = self.expected(43.0361, -76.1275, 1)[0][0]
+        Item.objects.get(pk=closest).delete()
+        self.available = [item for item in self.available if item.id != closest]
+        self.assertEqual(
+            self.nearest(lat=43.0361, lng=-76.1275, k=5), self.expected(43.0361, -76.1275, 5)
+        )
+
+    def test_k_clamped(self):
+        self.assertEqual(len(self.nearest(lat=43.0361, lng=-76.1275, k=0)), 1)
+        self.assertEqual(len(self.nearest(lat=43.0361, lng=-76.1275, k=500)), 100)
+        response = self.client.get('/api/items/items/nearest/', {'lat': 43, 'lng': -76, 'k': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_coordinates(self):
+        for enabled in [True, False]:
+            with self.subTest(snapshot=enabled), self.settings(ITEM_SNAPSHOT_ENABLED=enabled):
+                response = self.client.get('/api/items/items/nearest/', {'lat': 'nan', 'lng': -76})
+                self.assertEqual(response.status_code, 400)
+
+
+class ClusterTests(TestCase):
+    """Map clusters aggregate every available item at every zoom level"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(owner, count=80, spread=1.0)
+        cls.items.append(
+            create_item(owner, title='Far away', lat=-33.86, lng=151.2, price_per_hour=2)
+        )
+        for item in cls.items[::9]:
+            item.is_available = False
+            item.save()
+        cls.available = [item for item in cls.items if item.is_available]
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+
+    def clusters(self, bbox, zoom):
+        response = self.client.get('/api/items/items/clusters/', {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_levels_match_direct_aggregation(self):
+        # Coarse levels are merged from finer ones; they must equal
+        # aggregating the items at that zoom directly
+        names = [value for value, _ in Item.CATEGORY_CHOICES]
+        ids = np.array([item.id for item in self.available])
+        lat = np.array([item.lat for item in self.available])
+        lng = np.array([item.lng for item in self.available])
+        price = np.array([float(item.price_per_hour) for item in self.available])
+        category = np.array([names.index(item.category) for item in self.available])
+        index = clustering.ClusterIndex(ids, lat, lng, price, category, names)
+
+        for zoom in [0, 5, 11, 16]:
+            with self.subTest(zoom=zoom):
+                direct = clustering._Level.from_points(
+                    zoom, ids, lat, lng, price, category, len(names)
+                )
+                merged = index.levels[zoom]
+                self.assertEqual(merged.keys.tolist(), direct.keys.tolist())
+                self.assertEqual(merged.count.tolist(), direct.count.tolist())
+                self.assertEqual(merged.min_price.tolist(), direct.min_price.tolist())
+                self.assertEqual(merged.histogram.tolist(), direct.histogram.tolist())
+                np.testing.assert_allclose(merged.lat_sum, direct.lat_sum)
+
+    def test_counts_and_parity(self):
+        world = '-90,-180,90,180'
+        for zoom in [0, 8, 14]:
+            with self.subTest(zoom=zoom):
+                clusters = self.clusters(world, zoom)['clusters']
+                self.assertEqual(sum(c['count'] for c in clusters), len(self.available))
+                self.assertEqual(min(c['min_price'] for c in clusters), 2)
+                with self.settings(ITEM_SNAPSHOT_ENABLED=False):
+                    database = self.clusters(world, zoom)['clusters']
+                key = lambda c: (c['lat'], c['lng'])
+                self.assertEqual(sorted(clusters, key=key), sorted(database, key=key))
+
+        # The lone item far away is its own cluster
+        far = self.clusters('-34,151,-33,152', 10)['clusters']
+        self.assertEqual([(c['count'], c['item_id']) for c in far], [(1, self.items[-1].id)])
+
+    def test_items_past_max_zoom(self):
+        bbox = '42.9,-76.3,43.2,-76.0'
+        inside = {
+            item.id for item in self.available
+            if 42.9 <= item.lat <= 43.2 and -76.3 <= item.lng <= -76.0
+        }
+        data = self.clusters(bbox, clustering.MAX_CLUSTER_ZOOM + 1)
+        self.assertEqual(data['clusters'], [])
+        self.assertEqual({item['id'] for item in data['items']}, inside)
+
+    def test_invalid_params(self):
+        for params in [{'bbox': '43,-76,42,-75', 'zoom': 5}, {'bbox': '42,-76,43,-75'}]:
+            response = self.client.get('/api/items/items/clusters/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+class ViewportCursorSearchTests(TestCase):
+    """Viewport searches and keyset cursors return every match exactly once, in order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = scatter_items(owner, count=60, spread=0.1)
+        # Equal distances, split across pages
+        cls.items += [create_item(owner, lat=43.05, lng=-76.1) for _ in range(5)]
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+        cache.clear()
+
+    def walk(self, **params):
+        """Ids and distances of every page, following the next links"""
+        results = []
+        with mock.patch.object(DistanceCursorPagination, 'page_size', 7):
+            response = self.client.get('/api/items/items/search/', dict(params, cursor=''))
+            while True:
+                self.assertEqual(response.status_code, 200)
+                results += [(r['id'], r['distance_km']) for r in response.json()['results']]
+                if not response.json()['next']:
+                    return results
+                response = self.client.get(response.json()['next'])
+
+    def expected(self, lat, lng, keep):
+        matches = sorted(
+            (geo.haversine_km(lat, lng, item.lat, item.lng), -item.id)
+            for item in self.items if keep(item)
+        )
+        return [(-negative_id, distance) for distance, negative_id in matches]
+
+    def test_cursor_pages(self):
+        expected = self.expected(
+            43.0361, -76.1275,
+            lambda item: geo.haversine_km(43.0361, -76.1275, item.lat, item.lng) <= 8
+        )
+        for snapshot, cached in [(True, True), (True, False), (False, False)]:
+            with self.subTest(snapshot=snapshot, cached=cached), self.settings(
+                ITEM_SNAPSHOT_ENABLED=snapshot, SEARCH_CACHE_ENABLED=cached
+            ):
+                self.assertEqual(self.walk(lat=43.0361, lng=-76.1275, radius=8), expected)
+
+    def test_viewport(self):
+        south, west, north, east = 43.0, -76.15, 43.08, -76.05
+        inside = lambda item: south <= item.lat <= north and west <= item.lng <= east
+        # Distances from the viewport centre unless lat/lng are given
+        centre = geo.bbox_center(south, west, north, east)
+        bbox = f'{south},{west},{north},{east}'
+        for snapshot in [True, False]:
+            with self.subTest(snapshot=snapshot), self.settings(ITEM_SNAPSHOT_ENABLED=snapshot):
+                self.assertEqual(self.walk(bbox=bbox), self.expected(*centre, inside))
+                self.assertEqual(
+                    self.walk(bbox=bbox, lat=43.0361, lng=-76.1275),
+                    self.expected(43.0361, -76.1275, inside)
+                )
+
+    def test_antimeridian_viewport(self):
+        self.assertEqual(geo.parse_bbox('-10,170,10,-170'), (-10, 170, 10, -170))
+        self.assertEqual(geo.bbox_center(-10, 170, 10, -170), (0, 180))
+        self.assertEqual(self.walk(bbox='-10,170,10,-170'), [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            '/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275, 'cursor': '%%%'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SEARCH_CACHE_ENABLED=True)
+class SearchCacheTests(TestCase):
+    """Cached searches are shared by nearby centres but measured from each one"""
+
+    # Two centres ~10m apart that snap to the same cache key
+    A = (43.036, -76.1276)
+    B = (43.03609, -76.1276)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='pass')
+        cls.near = create_item(cls.owner, title='Near', lat=43.0365, lng=-76.1276)
+        # ~997m south of A, so ~1007m from B
+        cls.edge = create_item(
+            cls.owner, title='Edge', lat=43.036 - 0.997 / 111.195, lng=-76.1276
+        )
+        cls.far = create_item(cls.owner, title='Far', lat=44.5, lng=-75.0)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+        cache.clear()
+
+    def search(self, centre, radius=1):
+        response = self.client.get(
+            '/api/items/items/search/', {'lat': centre[0], 'lng': centre[1], 'radius': radius}
+        )
+        return {result['id']: result['distance_km'] for result in response.json()['results']}
+
+    def cache_key(self, centre):
+        return search_cache.key_for(key_params({
+            'lat': centre[0], 'lng': centre[1], 'radius': 1.0, 'bbox': None, 'category': None,
+            'min_price': None, 'max_price': None, 'available_only': True, 'text': None,
+            'start': None, 'end': None,
+        }))
+
+    def test_exact_distances_on_hit(self):
+        self.assertEqual(self.cache_key(self.A), self.cache_key(self.B))
+        for snapshot in [True, False]:
+            with self.subTest(snapshot=snapshot), self.settings(ITEM_SNAPSHOT_ENABLED=snapshot):
+                cache.clear()
+                from_a = self.search(self.A)
+                hits = search_cache.hits
+                from_b = self.search(self.B)
+                self.assertEqual(search_cache.hits, hits + 1)
+
+                self.assertEqual(set(from_a), {self.near.id, self.edge.id})
+                self.assertEqual(set(from_b), {self.near.id})
+                for centre, found in [(self.A, from_a), (self.B, from_b)]:
+                    self.assertEqual(
+                        found[self.near.id], geo.haversine_km(*centre, self.near.lat, self.near.lng)
+                    )
+
+    def test_invalidated_on_save_and_delete(self):
+        self.assertEqual(set(self.search(self.A)), {self.near.id, self.edge.id})
+
+        # A change elsewhere leaves the cached search alone
+        hits = search_cache.hits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.price_per_hour = 9
+            self.far.save()
+        self.search(self.A)
+        self.assertEqual(search_cache.hits, hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.is_available = False
+            self.near.save()
+        self.assertEqual(set(self.search(self.A)), {self.edge.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.lat, self.far.lng = 43.0362, -76.1276
+            self.far.save()
+        self.assertEqual(set(self.search(self.A)), {self.edge.id, self.far.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.edge.delete()
+        self.assertEqual(set(self.search(self.A)), {self.far.id})
+
+    def test_miss_refreshes_snapshot(self):
+        self.assertEqual(set(self.search(self.A)), {self.near.id, self.edge.id})
+        # Another process moves an item and bumps the versions; this
+        # process's snapshot was refreshed less than a second ago
+        Item.objects.filter(pk=self.far.pk).update(
+            lat=43.0362, lng=-76.1276, updated_at=timezone.now()
+        )
+        search_cache.invalidate([(43.0362, -76.1276)])
+        self.assertEqual(set(self.search(self.A)), {self.near.id, self.edge.id, self.far.id})
+
+    def test_padding_strip_invalidates(self):
+        # The 1km box stays north of the version cell edge at 43.0, but
+        # the box candidates are fetched for (padded by QUANTUM_PAD_KM)
+        # crosses it
+        centre = (43.0092, -76.1276)
+        self.assertGreater(geo.bounding_box(*centre, 1.0)[0], 43.0)
+        self.assertLess(geo.bounding_box(*centre, 1.0 + QUANTUM_PAD_KM)[0], 43.0)
+        key = self.cache_key(centre)
+        search_cache.invalidate([(42.9999, -76.1276)])
+        self.assertNotEqual(self.cache_key(centre), key)
+
+
+@override_settings(ITEM_SNAPSHOT_ENABLED=False, SEARCH_CACHE_ENABLED=False)
+class ItemListQueryCountTests(TestCase):
+    """List endpoints must not run a query per item"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = [
+            create_item(owner, title=f'Item {i}', lat=43.0361 + i * 0.001)
+            for i in range(20)
+        ]
+        for item in cls.items[::2]:
+            ItemVideo.objects.create(
+                item=item,
+                video_url='https://example.com/video.mp4',
+                thumbnail_url='https://example.com/thumb.jpg',
+                duration_seconds=30,
+            )
+        bundle = Bundle.objects.create(creator=owner, name='Kit', description='Test bundle')
+        for item in cls.items[:5]:
+            BundleItem.objects.create(bundle=bundle, item=item)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def test_list_page(self):
+        # Count + page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/items/items/')
+        results = response.json()['results']
+        self.assertEqual(len(results), 20)
+        with_video = {item.id for item in self.items[::2]}
+        for result in results:
+            self.assertEqual(result['has_video_demo'], result['id'] in with_video)
+
+    def test_search_page(self):
+        # Count + page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275})
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_search_facets(self):
+        # Count + page + one aggregate for all facets
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/items/items/search/', {'lat': 43.0361, 'lng': -76.1275, 'facets': 'true'}
+            )
+        facets = response.json()['facets']
+        self.assertEqual(facets['total'], 20)
+        self.assertEqual(facets['categories']['tools'], 20)
+        self.assertEqual(facets['categories']['camera'], 0)
+        self.assertEqual(facets['price'], {'0-5': 0, '5-10': 20, '10-20': 0, '20-50': 0, '50+': 0})
+        self.assertEqual(facets['has_video'], 10)
+        self.assertEqual(facets['rating']['unrated'], 20)
+
+    def test_bundle_list(self):
+        # Count + bundles + bundle items + items
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/items/bundles/')
+        bundle_items = response.json()['results'][0]['bundle_items']
+        self.assertEqual(
+            [entry['item']['has_video_demo'] for entry in bundle_items].count(True), 3
+        )
+
+
+class FullTextSearchTests(TestCase):
+    """?search= uses the full-text index and ranks title matches first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.in_description = create_item(
+            owner, title='Tool kit', description='Screwdrivers and a small drill'
+        )
+        cls.in_title = create_item(owner, description='Comes with two batteries')
+        cls.ladder = create_item(owner, title='Ladder', description='Aluminium step ladder')
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def search(self, text):
+        response = self.client.get('/api/items/items/', {'search': text})
+        return [result['id'] for result in response.json()['results']]
+
+    def test_ranked_matches(self):
+        self.assertEqual(self.search('drills'), [self.in_title.id, self.in_description.id])
+
+    def test_reindexed_on_save(self):
+        self.ladder.title = 'Ladder and drill stand'
+        self.ladder.save()
+        self.assertIn(self.ladder.id, self.search('drill'))
+        self.ladder.delete()
+        self.assertEqual(self.search('ladder'), [])
+
+
+class AutocompleteTests(TestCase):
+    """Title suggestions come from the in-memory index, most rented first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.drill = create_item(owner, title='Cordless Drill', total_rentals=3)
+        cls.driver = create_item(owner, title='Impact driver', total_rentals=7)
+        cls.drone = create_item(owner, title='Camera drone', category='camera', total_rentals=1)
+        cls.far_drill = create_item(owner, title='Hammer drill', total_rentals=9, lat=44.0)
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        title_index.reset()
+
+    def suggest(self, **params):
+        response = self.client.get('/api/items/items/autocomplete/', params)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_prefix_ranked_by_rentals(self):
+        self.assertEqual(
+            self.suggest(q='dr'),
+            [self.far_drill.id, self.driver.id, self.drill.id, self.drone.id]
+        )
+
+    def test_filters(self):
+        self.assertEqual(self.suggest(q='dr', category='camera'), [self.drone.id])
+        self.assertEqual(
+            self.suggest(q='dr', lat=43.0361, lng=-76.1275),
+            [self.driver.id, self.drill.id, self.drone.id]
+        )
+        self.assertEqual(self.suggest(q='cordless dr'), [self.drill.id])
+
+    def test_invalid_coordinates(self):
+        for params in [{'lat': '1e308', 'lng': '-76.1'}, {'lat': '95', 'lng': '-76.1'},
+                       {'lat': 'abc', 'lng': '-76.1'}, {'lat': '43'}]:
+            for enabled in [True, False]:
+                with self.subTest(snapshot=enabled, **params), \
+                        self.settings(ITEM_SNAPSHOT_ENABLED=enabled):
+                    response = self.client.get(
+                        '/api/items/items/autocomplete/', dict(params, q='dr')
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+    def test_follows_item_changes(self):
+        self.driver.is_available = False
+        self.driver.save()
+        self.assertNotIn(self.driver.id, self.suggest(q='dr'))
+
+    def test_retitled_rows_replaced_and_compacted(self):
+        self.suggest(q='dr')
+        self.drill.title = 'Cordless screwdriver'
+        self.drill.save()
+        self.assertEqual(self.suggest(q='screw'), [self.drill.id])
+        self.assertEqual(self.suggest(q='cordless dr'), [])
+        # Two words per title; the old words of the drill are dead
+        self.assertEqual(title_index.stats()['entries'], 8)
+
+        with mock.patch.object(incremental, 'MIN_COMPACT_ROWS', 0):
+            self.drone.title = 'Camera drone kit'
+            self.drone.save()
+            self.assertEqual(self.suggest(q='kit'), [self.drone.id])
+        stats = title_index.stats()
+        self.assertEqual((stats['entries'], stats['tail_entries']), (9, 0))
+
+
+class TimeWindowSearchTests(TestCase):
+    """search?start=&end= leaves out items booked during the window"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        renter = User.objects.create_user(username='renter', password='pass')
+        cls.start = timezone.now() + timedelta(days=1)
+        cls.end = cls.start + timedelta(hours=4)
+
+        cls.items = [
+            create_item(owner, title=f'Item {i}', lat=43.0361 + i * 0.001)
+            for i in range(4)
+        ]
+        for item, status, offset in [
+            (cls.items[0], 'accepted', timedelta(hours=2)),  # overlaps
+            (cls.items[1], 'cancelled', timedelta(hours=2)),  # doesn't block
+            (cls.items[2], 'pending', timedelta(hours=4)),  # starts at the end
+        ]:
+            Booking.objects.create(
+                renter=renter,
+                item=item,
+                start_time=cls.start + offset,
+                end_time=cls.end + offset,
+                total_price=20,
+                status=status,
+            )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME='localhost')
+        item_snapshot.reset()
+        cache.clear()
+
+    def search(self):
+        response = self.client.get('/api/items/items/search/', {
+            'lat': 43.0361,
+            'lng': -76.1275,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+        })
+        return {result['id'] for result in response.json()['results']}
+
+    def test_snapshot_path(self):
+        self.assertEqual(self.search(), {item.id for item in self.items[1:]})
+
+    @override_settings(ITEM_SNAPSHOT_ENABLED=False, SEARCH_CACHE_ENABLED=False)
+    def test_database_path(self):
+        # Count + page, with the anti-join inside both
+        with self.assertNumQueries(2):
+            found = self.search()
+        self.assertEqual(found, {item.id for item in self.items[1:]})
+
+
+class GeocodeItemsCommandTests(TestCase):
+    """geocode_items geocodes each distinct address once, in resumable chunks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='pass')
+        cls.items = [
+            create_item(
+                owner,
+                title=f'Item {i}',
+                address_text=f'{100 + i % 3} Winding Ridge Rd, Syracuse, NY' if i != 5 else ' ',
+                lat=0,
+                lng=0,
+            )
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+        self.retry_file = os.path.join(directory.name, 'failed.jsonl')
+
+    def geocode(self, *args):
+        call_command(
+            'geocode_items', '--all', '--fake', '--fake-latency', '0', '--rate', '1000',
+            '--chunk-size', '3', '--checkpoint', self.checkpoint, '--retry-file', self.retry_file,
+            *args, stdout=StringIO()
+        )
+
+    def test_deduplicated_bulk_update(self):
+        fake = FakeGeocodingService(latency=0)
+        with mock.patch.object(
+            FakeGeocodingService, 'address_to_coords', side_effect=fake.address_to_coords
+        ) as geocode:
+            self.geocode()
+        # Three addresses plus the blank one
+        self.assertEqual(geocode.call_count, 4)
+
+        for item in self.items:
+            before = item.updated_at
+            item.refresh_from_db()
+            if item.id == self.items[5].id:
+                self.assertEqual(item.updated_at, before)
+                continue
+            expected = fake.address_to_coords(item.address_text)
+            self.assertEqual((item.lat, item.lng), (expected['lat'], expected['lng']))
+            self.assertEqual(item.google_place_id, expected['place_id'])
+            self.assertEqual(item.geo_cell, geo.cell_for(item.lat, item.lng))
+            self.assertGreater(item.updated_at, before)
+
+        with open(self.retry_file) as f:
+            self.assertEqual(
+                [json.loads(line) for line in f], [{'id': self.items[5].id, 'address': ' '}]
+            )
+
+    def test_resume(self):
+        self.geocode('--limit', '4')
+        with open(self.checkpoint) as f:
+            progress = json.load(f)
+        self.assertEqual(progress['last_id'], self.items[3].id)
+        self.assertEqual(progress['success'], 4)
+        self.assertEqual(Item.objects.filter(google_place_id='').count(), 3)
+
+        self.geocode('--resume')
+        with open(self.checkpoint) as f:
+            progress = json.load(f)
+        self.assertEqual(progress['last_id'], self.items[6].id)
+        self.assertEqual((progress['success'], progress['failures']), (6, 1))
+        self.assertEqual(Item.objects.filter(google_place_id='').count(), 1)
+
+    def test_unavailable_is_retried_not_failed(self):
+        resolve = FakeGeocodingService(latency=0).address_to_coords
+
+        def geocode(address, raise_unavailable=False):
+            if not address.strip():
+                raise GeocodingUnavailable("Google Maps circuit open")
+            return resolve(address)
+
+        # The second chunk holds the blank address
+        with mock.patch.object(FakeGeocodingService, 'address_to_coords', side_effect=geocode):
+            with self.assertRaises(CommandError):
+                self.geocode()
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['last_id'], self.items[2].id)
+        self.assertFalse(os.path.exists(self.retry_file))
+
+        self.geocode('--resume')
+        with open(self.checkpoint) as f:
+            progress = json.load(f)
+        self.assertEqual((progress['success'], progress['failures']), (6, 1))
+
+    def test_rate_sets_service_limiter(self):
+        fake = FakeGeocodingService(latency=0)
+        with mock.patch('items.management.commands.geocode_items.GeocodingService') as service_class:
+            service = service_class.return_value
+            service.address_to_coords.side_effect = (
+                lambda address, raise_unavailable: fake.address_to_coords(address)
+            )
+            call_command(
+                'geocode_items', '--all', '--rate', '200', '--checkpoint', self.checkpoint,
+                '--retry-file', self.retry_file, stdout=StringIO()
+            )
+        service_class.assert_called_once_with(rate=200.0)
+        # Waits for tokens rather than failing addresses
+        self.assertIsNone(service.RATE_LIMIT_TIMEOUT)
+        self.assertEqual(Item.objects.filter(google_place_id='').count(), 1)
+
+
+class StubGeocodingClient:
+    """Google Maps client stand-in raising the queued errors before answering"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [{
+            'geometry': {'location': {'lat': 43.0361, 'lng': -76.1275}},
+            'place_id': 'stub',
+            'formatted_address': address,
+        }]
+
+    def reverse_geocode(self, latlng):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [{'formatted_address': f'{latlng[0]:.6f}, {latlng[1]:.6f}'}]
+
+
+@mock.patch('items.services.time.sleep')
+class GeocodingServiceResilienceTests(TestCase):
+    """Outbound geocoding calls are rate limited, retried and circuit broken"""
+
+    def setUp(self):
+        cache.clear()
+        geocode_cache.reset()
+
+    def test_transient_errors_retried(self, sleep):
+        client = StubGeocodingClient([
+            googlemaps.exceptions.Timeout(),
+            googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT'),
+        ])
+        result = GeocodingService(client).address_to_coords('100 Winding Ridge Rd')
+        self.assertEqual(result['place_id'], 'stub')
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_permanent_errors_not_retried(self, sleep):
+        client = StubGeocodingClient([googlemaps.exceptions.ApiError('INVALID_REQUEST')])
+        self.assertIsNone(GeocodingService(client).address_to_coords('100 Winding Ridge Rd'))
+        self.assertEqual(client.calls, 1)
+
+    def test_circuit_breaker(self, sleep):
+        client = StubGeocodingClient([googlemaps.exceptions.TransportError()] * 10)
+        service = GeocodingService(client)
+
+        # Four attempts, then the fifth failure opens the circuit
+        self.assertIsNone(service.address_to_coords('1 Main St'))
+        self.assertIsNone(service.address_to_coords('2 Main St'))
+        self.assertEqual(client.calls, 5)
+        self.assertEqual(service.breaker.state, 'open')
+
+        # Fails fast while open
+        self.assertIsNone(service.address_to_coords('3 Main St'))
+        self.assertEqual(client.calls, 5)
+
+        # One trial call once the reset timeout has passed
+        client.errors = []
+        service.breaker.reset_timeout = 0
+        self.assertEqual(service.address_to_coords('3 Main St')['place_id'], 'stub')
+        self.assertEqual(service.breaker.state, 'closed')
+
+    def test_permanent_error_keeps_circuit_state(self, sleep):
+        client = StubGeocodingClient([googlemaps.exceptions.TransportError()] * 5)
+        service = GeocodingService(client)
+        service.MAX_RETRIES = 0
+        for number in range(5):
+            service.address_to_coords(f'{number} Main St')
+        service.breaker.reset_timeout = 0
+        self.assertEqual(service.breaker.state, 'half-open')
+
+        # The trial call is an invalid request: no sign of recovery
+        client.errors = [googlemaps.exceptions.ApiError('INVALID_REQUEST')]
+        self.assertIsNone(service.address_to_coords('nowhere'))
+        self.assertEqual(service.breaker.state, 'half-open')
+
+        # The next trial call is still let through
+        self.assertEqual(service.address_to_coords('5 Main St')['place_id'], 'stub')
+        self.assertEqual(service.breaker.state, 'closed')
+
+    def test_token_bucket(self, sleep):
+        bucket = TokenBucket(rate=0.001, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertFalse(bucket.acquire(timeout=1))
+
+        # Shared through the cache: every instance draws from one budget
+        shared = [CacheTokenBucket('test_rate', rate=2 / 60, window=60) for _ in range(2)]
+        self.assertEqual([bucket.try_acquire() for bucket in shared * 2], [True, True, False, False])
+
+        # Counting in a per-process cache wouldn't limit other workers
+        with self.settings(GOOGLE_MAPS_SHARED_RATE_LIMIT=True, SHARED_CACHE=False):
+            with self.assertRaises(ImproperlyConfigured):
+                GeocodingService(StubGeocodingClient())
+        with self.settings(GOOGLE_MAPS_SHARED_RATE_LIMIT=True, SHARED_CACHE=True):
+            self.assertIsInstance(GeocodingService(StubGeocodingClient()).rate_limiter, CacheTokenBucket)
+
+
+class GeocodeCacheTests(TestCase):
+    """Geocoding results are cached locally and shared under canonical keys"""
+
+    def setUp(self):
+        cache.clear()
+        geocode_cache.reset()
+
+    def test_canonical_address(self):
+        self.assertEqual(
+            canonical_address('  100 Winding  Ridge Road, Apartment #4, Café North '),
+            '100 winding ridge rd apt 4 cafe n'
+        )
+        # Non-Latin words are kept, so such addresses don't all share a key
+        self.assertEqual(canonical_address('東京都千代田区 1-1'), '東京都千代田区 1 1')
+        self.assertEqual(canonical_address('Москва, Тверская улица, 7'), 'москва тверская улица 7')
+        self.assertNotEqual(cache_key('Москва, Тверская 7'), cache_key('Москва, Арбат 7'))
+
+    def test_spelling_variants_share_entry(self):
+        client = StubGeocodingClient()
+        service = GeocodingService(client)
+        first = service.address_to_coords('100 Winding Ridge Road')
+        self.assertEqual(service.address_to_coords('100 winding ridge rd.'), first)
+        self.assertEqual(service.address_to_coords('100  WINDING RIDGE RD'), first)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(geocode_cache.stats()['local_hits'], 2)
+
+        # Another process finds it in the shared cache
+        geocode_cache.reset()
+        self.assertEqual(service.address_to_coords('100 Winding Ridge Rd'), first)
+        stats = geocode_cache.stats()
+        self.assertEqual((stats['shared_hits'], stats['misses']), (1, 0))
+        self.assertEqual(client.calls, 1)
+
+    def test_failures_cached_only_when_permanent(self):
+        client = StubGeocodingClient([googlemaps.exceptions.ApiError('INVALID_REQUEST')])
+        service = GeocodingService(client)
+        self.assertIsNone(service.address_to_coords('nowhere'))
+        self.assertIsNone(service.address_to_coords('Nowhere'))
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(geocode_cache.stats()['negative_hits'], 1)
+
+        # Transient errors aren't cached
+        service.MAX_RETRIES = 0
+        client.errors = [googlemaps.exceptions.Timeout()]
+        self.assertIsNone(service.address_to_coords('1 Main St'))
+        self.assertEqual(service.address_to_coords('1 Main St')['place_id'], 'stub')
+        self.assertEqual(client.calls, 3)
+
+    def test_reverse_lookups_share_grid_cell(self):
+        client = StubGeocodingClient()
+        service = GeocodingService(client)
+        south, west, north, east = cell_bounds(*reverse_cell(43.0361, -76.1275))
+        self.assertAlmostEqual((north - south) * 111320, 25, places=3)
+
+        address = service.coords_to_address(south + 0.00001, west + 0.00001)
+        self.assertEqual(service.coords_to_address(north - 0.00001, east - 0.00001), address)
+        self.assertEqual(client.calls, 1)
+
+        # The next cell is looked up separately
+        service.coords_to_address(north + 0.00001, west + 0.00001)
+        self.assertEqual(client.calls, 2)
+
+    def test_reverse_lookup_uses_geocoded_items(self):
+        owner = User.objects.create_user(
+            username='owner', password='pass', lat=43.03612, lng=-76.12752,
+            address_text='12 Private Home Ln, Syracuse, NY'
+        )
+        # Free text, not from the geocoder
+        create_item(owner, title='Ladder', lat=43.03612, lng=-76.12752)
+        client = StubGeocodingClient()
+        service = GeocodingService(client)
+        south, west, north, east = cell_bounds(*reverse_cell(43.03612, -76.12752))
+        centre = ((south + north) / 2, (west + east) / 2)
+
+        # Neither the owner's home nor free text answers for the cell
+        self.assertEqual(service.coords_to_address(*centre), f'{centre[0]:.6f}, {centre[1]:.6f}')
+        self.assertEqual(client.calls, 1)
+
+        cache.clear()
+        geocode_cache.reset()
+        create_item(
+            owner,
+            address_text='100 Winding Ridge Rd, Syracuse, NY',
+            google_place_id='place',
+            lat=43.03612,
+            lng=-76.12752,
+        )
+        self.assertEqual(service.coords_to_address(*centre), '100 Winding Ridge Rd, Syracuse, NY')
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(geocode_cache.stats()['known_address_hits'], 1)
+
+    def test_edited_address_drops_place_id(self):
+        owner = User.objects.create_user(username='owner', password='pass')
+        item = create_item(
+            owner,
+            address_text='100 Winding Ridge Rd, Syracuse, NY',
+            google_place_id='place',
+            lat=43.03612,
+            lng=-76.12752,
+        )
+        api = APIClient(SERVER_NAME='localhost')
+        api.force_authenticate(user=owner)
+        response = api.patch(
+            f'/api/items/items/{item.id}/', {'address_text': 'Ring the bell twice'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        item.refresh_from_db()
+        self.assertEqual(item.google_place_id, '')
+
+        # The owner's text doesn't answer for the cell
+        client = StubGeocodingClient()
+        south, west, north, east = cell_bounds(*reverse_cell(43.03612, -76.12752))
+        centre = ((south + north) / 2, (west + east) / 2)
+        self.assertEqual(
+            GeocodingService(client).coords_to_address(*centre), f'{centre[0]:.6f}, {centre[1]:.6f}'
+        )
+        self.assertEqual(client.calls, 1)
+
+        # Geocoding again vouches for the new formatted address
+        result = {'lat': 43.03612, 'lng': -76.12752, 'place_id': 'place',
+                  'formatted_address': '100 Winding Ridge Rd, Syracuse, NY 13210'}
+        with mock.patch('items.services.geocoding_service.address_to_coords', return_value=result):
+            item = Item.objects.get(pk=item.pk)
+            item.google_place_id = ''
+            item.save()
+            item.geocode_address()
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(
+            (item.address_text, item.google_place_id),
+            ('100 Winding Ridge Rd, Syracuse, NY 13210', 'place')
+        )
@@ -1,31 +1,50 @@
+import bisect
+import math
+from datetime import timedelta
+
+import numpy as np
+
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
-from django.db.models import Q
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly, IsAdminUser
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from bookings import availability
+from bookings.models import Booking
 from .models import Item, ItemVideo, Bundle
+from .autocomplete import normalize_words, title_index
+from .facets import facet_counts
+from .geocache import geocode_cache
+from .filters import FullTextSearchFilter
+from .pagination import DistanceCursorPagination
+from .search_cache import covering_params, key_params, search_cache
+from .snapshot import item_snapshot
+from . import clustering, geo
 from .serializers import (
     ItemListSerializer, ItemDetailSerializer, 
     ItemCreateUpdateSerializer, BundleSerializer
 )
-import math
 
 class ItemViewSet(viewsets.ModelViewSet):
     """
     ViewSet for items with map search functionality and CRUD operations
     """
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description', 'category']
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
     ordering_fields = ['created_at', 'price_per_hour', 'rating_avg']
     
     def get_queryset(self):
         """Get items queryset"""
-        return Item.objects.select_related('owner').prefetch_related('videos')
+        queryset = Item.objects.select_related('owner')
+        if self.get_serializer_class() is ItemListSerializer:
+            return queryset.with_video_flag()
+        return queryset.prefetch_related('videos')
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
-        if self.action == 'list' or self.action == 'search':
+        if self.action in ['list', 'search', 'nearest']:
             return ItemListSerializer
         elif self.action in ['create', 'update', 'partial_update']:
             return ItemCreateUpdateSerializer
@@ -35,6 +54,8 @@ class ItemViewSet(viewsets.ModelViewSet):
         """Set permissions based on action"""
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAuthenticated()]
+        if self.action == 'search_stats':
+            return [IsAdminUser()]
         return [AllowAny()]
     
     def perform_create(self, serializer):
@@ -64,30 +85,196 @@ class ItemViewSet(viewsets.ModelViewSet):
         - lat (required): User latitude
         - lng (required): User longitude
         - radius (optional): Search radius in km (default: 5)
+        - bbox (optional): Viewport as south,west,north,east; replaces the
+          radius, and lat/lng default to the viewport centre
         - category (optional): Filter by category
         - min_price (optional): Minimum price per hour
         - max_price (optional): Maximum price per hour
         - available (optional): Only available items (default: true)
+        - search (optional): Full-text query over title, description and
+          category; results stay sorted by distance
+        - start, end (optional): ISO 8601 datetimes; only items with no
+          pending/accepted/active booking overlapping the window
+        - facets (optional): "true" adds category, price, video and rating
+          counts over all matches
+        - cursor (optional): Keyset pagination; send it empty for the first
+          page, then follow the "next" link
         """
         # Get and validate parameters
+        bbox = None
+        if request.query_params.get('bbox'):
+            try:
+                bbox = geo.parse_bbox(request.query_params['bbox'])
+            except ValueError as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        lat = request.query_params.get('lat')
+        lng = request.query_params.get('lng')
+        if bbox is not None and not (lat or lng):
+            user_lat, user_lng = geo.bbox_center(*bbox)
+        else:
+            try:
+                user_lat, user_lng = geo.parse_point(lat, lng)
+            except ValueError:
+                return Response(
+                    {'error': 'Valid lat and lng parameters are required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
         try:
-            user_lat = float(request.query_params.get('lat'))
-            user_lng = float(request.query_params.get('lng'))
-        except (TypeError, ValueError):
+            radius = float(request.query_params.get('radius', 50))  # Default 5km
+        except ValueError:
+            radius = math.nan
+        if not (math.isfinite(radius) and radius > 0):
             return Response(
-                {'error': 'Valid lat and lng parameters are required'},
+                {'error': 'radius must be a positive number'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        radius = float(request.query_params.get('radius', 50))  # Default 5km
         category = request.query_params.get('category')
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
+        prices = [request.query_params.get('min_price'), request.query_params.get('max_price')]
+        try:
+            min_price, max_price = [float(price) if price else None for price in prices]
+        except ValueError:
+            min_price = max_price = math.nan
+        if not all(price is None or math.isfinite(price) for price in (min_price, max_price)):
+            return Response(
+                {'error': 'min_price and max_price must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         available_only = request.query_params.get('available', 'true').lower() == 'true'
         
+        start = end = None
+        if request.query_params.get('start') or request.query_params.get('end'):
+            try:
+                start = self._parse_time(request.query_params.get('start'))
+                end = self._parse_time(request.query_params.get('end'))
+            except ValueError:
+                end = None
+            if end is None or end <= start:
+                return Response(
+                    {'error': 'Valid start and end datetimes are required, with end after start'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        cursor = None
+        if DistanceCursorPagination.requested(request):
+            cursor = DistanceCursorPagination(request)
+        
+        params = {
+            'lat': user_lat,
+            'lng': user_lng,
+            'radius': None if bbox else radius,
+            'bbox': bbox,
+            'category': category or None,
+            'min_price': min_price,
+            'max_price': max_price,
+            'available_only': available_only,
+            'text': ' '.join(request.query_params.get('search', '').lower().split()) or None,
+            'start': start,
+            'end': end,
+        }
+        
+        # Searches from nearby points share cached candidates: only the key
+        # is snapped to the cache grid, distances use the exact centre
+        shared = cache_key = None
+        if search_cache.enabled():
+            shared = key_params(params)
+            cache_key = search_cache.key_for(shared)
+        
+        response = self._search_results(params, cursor, cache_key, shared)
+        
+        if request.query_params.get('facets', 'false').lower() == 'true':
+            def compute_facets():
+                return facet_counts(self._search_queryset(**params))
+            if cache_key:
+                # Shared by the searches with this key, so counts can be
+                # off by items within the snapping distance of the edge
+                response.data['facets'] = search_cache.get_or_compute(
+                    cache_key, 'facets', compute_facets
+                )
+            else:
+                response.data['facets'] = compute_facets()
+        
+        return response
+    
+    def _search_results(self, params, cursor, cache_key=None, shared=None):
+        """
+        Response with one page of matches for normalized search params;
+        with a cache key, shared holds the params the key was made from
+        """
+        available_only = params['available_only']
+        use_snapshot = available_only and item_snapshot.enabled()
+        
+        if cache_key:
+            candidates = search_cache.get_or_compute(
+                cache_key, 'candidates',
+                lambda: self._find_candidates(covering_params(shared), use_snapshot)
+            )
+            matches = self._rank_candidates(candidates, params)
+            if cursor:
+                start = 0
+                if cursor.after:
+                    after_distance, after_id = cursor.after
+                    start = bisect.bisect_right(
+                        matches, (after_distance, -after_id),
+                        key=lambda match: (match[1], -match[0])
+                    )
+                matches = matches[start:start + cursor.page_size + 1]
+            return self._matches_response(matches, cursor, available_only)
+        
+        # Available items are matched from the in-memory snapshot
+        if use_snapshot:
+            ids, distances = self._snapshot_search(
+                params,
+                after=cursor.after if cursor else None,
+                limit=cursor.page_size + 1 if cursor else None,
+            )
+            return self._matches_response(list(zip(ids.tolist(), distances.tolist())), cursor)
+        
+        queryset = self._search_queryset(**params)
+        
+        if cursor:
+            queryset = queryset.order_by('distance_km', '-id')
+            if cursor.after:
+                after_distance, after_id = cursor.after
+                queryset = queryset.filter(
+                    Q(distance_km__gt=after_distance) |
+                    Q(distance_km=after_distance, id__lt=after_id)
+                )
+            page = cursor.paginate(
+                queryset[:cursor.page_size + 1],
+                lambda item: (item.distance_km, item.id)
+            )
+            serializer = self.get_serializer(page, many=True)
+            return cursor.get_paginated_response(serializer.data)
+        
+        # Paginate results
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(queryset, many=True)
+        
+        return Response({
+            'count': len(serializer.data),
+            'results': serializer.data
+        })
+    
+    def _search_queryset(self, lat, lng, radius, bbox, category=None, min_price=None,
+                         max_price=None, available_only=True, text=None,
+                         start=None, end=None):
+        """Database search, annotated with distance_km and sorted by it"""
         # Start with base queryset
         queryset = self.get_queryset()
         
+        # Filter by full-text match
+        if text:
+            queryset = queryset.search_text(text)
+        
         # Filter by availability
         if available_only:
             queryset = queryset.filter(is_available=True)
@@ -97,47 +284,108 @@ class ItemViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category=category)
         
         # Filter by price range
-        if min_price:
-            queryset = queryset.filter(price_per_hour__gte=float(min_price))
-        if max_price:
-            queryset = queryset.filter(price_per_hour__lte=float(max_price))
-        
-        # Calculate distances and filter by radius
-        items_with_distance = []
-        distances = {}
-        
-        for item in queryset:
-            distance = self._calculate_distance(
-                user_lat, user_lng, 
-                item.lat, item.lng
-            )
-            
-            if distance <= radius:
-                items_with_distance.append((item, distance))
-                distances[item.id] = distance
+        if min_price is not None:
+            queryset = queryset.filter(price_per_hour__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price_per_hour__lte=max_price)
         
-        # Sort by distance
-        items_with_distance.sort(key=lambda x: x[1])
-        sorted_items = [item for item, _ in items_with_distance]
+        # Filter out items booked during the requested window
+        if start:
+            queryset = queryset.free_between(start, end)
         
-        # Paginate results
-        page = self.paginate_queryset(sorted_items)
-        if page is not None:
-            serializer = self.get_serializer(
-                page, 
-                many=True, 
-                context={'distances': distances}
-            )
-            return self.get_paginated_response(serializer.data)
+        # Filter by viewport or radius and sort by distance in the database
+        if bbox:
+            return queryset.filter(geo.bbox_filter(*bbox)).by_distance(lat, lng)
+        return queryset.within(lat, lng, radius)
+    
+    def _snapshot_search(self, params, **kwargs):
+        """Snapshot search for normalized search params (see ItemLocationSnapshot.search)"""
+        return item_snapshot.search(
+            params['lat'], params['lng'],
+            radius_km=params['radius'],
+            bbox=params['bbox'],
+            category=params['category'],
+            min_price=params['min_price'],
+            max_price=params['max_price'],
+            ids=self._text_matches(params['text']),
+            exclude_ids=(
+                Booking.objects.overlapping(params['start'], params['end']).held_item_ids()
+                if params['start'] else None
+            ),
+            **kwargs
+        )
+    
+    def _find_candidates(self, params, use_snapshot):
+        """(ids, lats, lngs) arrays of the matches for search params"""
+        if use_snapshot:
+            # Cached under the versions just read, which another process
+            # may have bumped since this snapshot's last refresh
+            item_snapshot.ensure_fresh(force=True)
+            ids, _, lats, lngs = self._snapshot_search(params, with_coords=True)
+            return ids, lats, lngs
         
-        serializer = self.get_serializer(
-            sorted_items, 
-            many=True, 
-            context={'distances': distances}
+        rows = list(self._search_queryset(**params).order_by().values_list('id', 'lat', 'lng'))
+        return (
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.float64),
+            np.array([row[2] for row in rows], dtype=np.float64),
         )
+    
+    @staticmethod
+    def _rank_candidates(candidates, params):
+        """
+        (id, distance) matches among cached candidates for the exact
+        centre and radius or viewport, nearest then newest first
+        """
+        ids, lats, lngs = candidates
+        distances = geo.haversine_array(params['lat'], params['lng'], lats, lngs)
+        if params['bbox']:
+            south, west, north, east = params['bbox']
+            keep = (lats >= south) & (lats <= north)
+            if west <= east:
+                keep &= (lngs >= west) & (lngs <= east)
+            else:
+                keep &= (lngs >= west) | (lngs <= east)
+        else:
+            keep = distances <= params['radius']
+        ids, distances = ids[keep], distances[keep]
+        order = np.lexsort((-ids, distances))
+        return list(zip(ids[order].tolist(), distances[order].tolist()))
+    
+    @staticmethod
+    def _parse_time(value):
+        """Timezone-aware datetime from an ISO 8601 string (ValueError if invalid)"""
+        parsed = parse_datetime(value or '')
+        if parsed is None:
+            raise ValueError(f"Invalid datetime: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+    
+    def _text_matches(self, text):
+        """Ids of items matching a full-text query, or None without one"""
+        if not text:
+            return None
+        return list(Item.objects.search_text(text).values_list('id', flat=True))
+    
+    def _matches_response(self, matches, cursor, available_only=True):
+        """
+        Paginated response for (id, distance) matches; with a cursor,
+        matches must already start after it and hold page_size + 1 entries
+        """
+        if cursor:
+            page = cursor.paginate(matches, lambda match: (match[1], match[0]))
+            serializer = self.get_serializer(self._hydrate(page, available_only), many=True)
+            return cursor.get_paginated_response(serializer.data)
         
+        page = self.paginate_queryset(matches)
+        if page is not None:
+            serializer = self.get_serializer(self._hydrate(page, available_only), many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(self._hydrate(matches, available_only), many=True)
         return Response({
-            'count': len(sorted_items),
+            'count': len(serializer.data),
             'results': serializer.data
         })
     
@@ -190,6 +438,44 @@ class ItemViewSet(viewsets.ModelViewSet):
             }
         })
     
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        Busy and free intervals of an item for a calendar
+        Query params:
+        - start (optional): ISO 8601 datetime (default: now)
+        - end (optional): ISO 8601 datetime (default: start + 30 days,
+          at most a year after start)
+        """
+        item = self.get_object()
+        
+        try:
+            start = timezone.now()
+            if request.query_params.get('start'):
+                start = self._parse_time(request.query_params['start'])
+            end = start + timedelta(days=30)
+            if request.query_params.get('end'):
+                end = self._parse_time(request.query_params['end'])
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not start < end <= start + timedelta(days=366):
+            return Response(
+                {'error': 'end must be after start and at most a year later'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        busy = availability.busy_between(item.id, start, end)
+        return Response({
+            'item_id': item.id,
+            'start': start,
+            'end': end,
+            'busy': [{'start': a, 'end': b} for a, b in busy],
+            'free': [{'start': a, 'end': b} for a, b in availability.free_between(busy, start, end)]
+        })
+    
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Get list of available categories"""
@@ -206,62 +492,229 @@ class ItemViewSet(viewsets.ModelViewSet):
         Quick nearby items endpoint (uses 1km radius)
         """
         try:
-            user_lat = float(request.query_params.get('lat'))
-            user_lng = float(request.query_params.get('lng'))
-        except (TypeError, ValueError):
+            user_lat, user_lng = geo.parse_point(
+                request.query_params.get('lat'), request.query_params.get('lng')
+            )
+        except ValueError:
             return Response(
                 {'error': 'Valid lat and lng parameters are required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         # Use 1km radius for "nearby"
-        queryset = self.get_queryset().filter(is_available=True)
+        if item_snapshot.enabled():
+            ids, distances = item_snapshot.search(user_lat, user_lng, 1.0)
+            items = self._hydrate(zip(ids[:10].tolist(), distances[:10].tolist()))  # Top 10
+        else:
+            items = self.get_queryset().filter(
+                is_available=True
+            ).within(user_lat, user_lng, 1.0)[:10]  # Top 10
         
-        nearby_items = []
-        distances = {}
+        serializer = self.get_serializer(items, many=True)
         
-        for item in queryset:
-            distance = self._calculate_distance(
-                user_lat, user_lng, 
-                item.lat, item.lng
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Title suggestions while typing
+        Query params:
+        - q (required): Text typed so far; the last word is a prefix
+        - category (optional): Filter by category
+        - lat, lng (optional): Only items within ~5km of this point
+        - limit (optional): Number of suggestions (default: 8, max: 20)
+        """
+        text = request.query_params.get('q', '')
+        category = request.query_params.get('category')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 8)), 20))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            if distance <= 1.0:  # 1km radius
-                nearby_items.append((item, distance))
-                distances[item.id] = distance
-        
-        # Sort by distance
-        nearby_items.sort(key=lambda x: x[1])
-        sorted_items = [item for item, _ in nearby_items][:10]  # Top 10
-        
-        serializer = self.get_serializer(
-            sorted_items, 
-            many=True, 
-            context={'distances': distances}
-        )
         
+        lat = request.query_params.get('lat')
+        lng = request.query_params.get('lng')
+        cells = None
+        if lat or lng:
+            try:
+                cells = geo.neighbour_cells(*geo.parse_point(lat, lng))
+            except ValueError:
+                return Response(
+                    {'error': 'Valid lat and lng parameters are required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        if item_snapshot.enabled():
+            suggestions = title_index.suggest(text, category=category, cells=cells, limit=limit)
+        else:
+            queryset = Item.objects.filter(is_available=True)
+            words = normalize_words(text)
+            for word in words:
+                queryset = queryset.filter(title__icontains=word)
+            if category:
+                queryset = queryset.filter(category=category)
+            if cells is not None:
+                queryset = queryset.filter(geo_cell__in=cells)
+            suggestions = list(queryset.order_by('-total_rentals', '-id').values_list(
+                'id', 'title', 'category', 'total_rentals'
+            )[:limit]) if words else []
+        
+        return Response({
+            'results': [
+                {
+                    'id': item_id,
+                    'title': title,
+                    'category': item_category,
+                    'total_rentals': total_rentals,
+                }
+                for item_id, title, item_category, total_rentals in suggestions
+            ]
+        })
+    
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        k-nearest available items
+        Query params:
+        - lat (required): User latitude
+        - lng (required): User longitude
+        - k (optional): Number of items (default: 10, max: 100)
+        - category (optional): Filter by category
+        """
+        try:
+            user_lat, user_lng = geo.parse_point(
+                request.query_params.get('lat'), request.query_params.get('lng')
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Valid lat and lng parameters are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            k = int(request.query_params.get('k', 10))
+        except ValueError:
+            return Response(
+                {'error': 'k must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        k = max(1, min(k, 100))
+        category = request.query_params.get('category')
+        
+        if item_snapshot.enabled():
+            ids, distances = item_snapshot.nearest(user_lat, user_lng, k, category=category)
+            items = self._hydrate(zip(ids.tolist(), distances.tolist()))
+        else:
+            queryset = self.get_queryset().filter(is_available=True)
+            if category:
+                queryset = queryset.filter(category=category)
+            items = queryset.by_distance(user_lat, user_lng)[:k]
+        
+        serializer = self.get_serializer(items, many=True)
         return Response(serializer.data)
     
-    @staticmethod
-    def _calculate_distance(lat1, lng1, lat2, lng2):
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
         """
-        Calculate distance using Haversine formula
-        Returns distance in kilometers
+        Map marker clusters for a viewport
+        Query params:
+        - bbox (required): south,west,north,east
+        - zoom (required): Map zoom level
+        
+        Up to zoom 16 returns pre-aggregated clusters (count, centroid,
+        min price, category counts); deeper zooms return individual items.
         """
-        R = 6371  # Earth's radius in kilometers
+        try:
+            south, west, north, east = geo.parse_bbox(request.query_params.get('bbox'))
+            zoom = int(request.query_params.get('zoom'))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Valid bbox (south,west,north,east) and zoom parameters are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lng = math.radians(lng2 - lng1)
+        if zoom > clustering.MAX_CLUSTER_ZOOM:
+            if item_snapshot.enabled():
+                columns = item_snapshot.in_bbox(south, west, north, east)
+                category_names = list(item_snapshot.category_codes)
+                items = [
+                    {
+                        'id': item_id,
+                        'lat': lat,
+                        'lng': lng,
+                        'category': category_names[code] if code >= 0 else None,
+                        'price_per_hour': round(price, 2),
+                    }
+                    for item_id, lat, lng, code, price in zip(
+                        columns['id'].tolist(), columns['lat'].tolist(),
+                        columns['lng'].tolist(), columns['category'].tolist(),
+                        columns['price'].tolist(),
+                    )
+                ]
+            else:
+                items = [
+                    {
+                        'id': item_id,
+                        'lat': lat,
+                        'lng': lng,
+                        'category': category,
+                        'price_per_hour': float(price),
+                    }
+                    for item_id, lat, lng, category, price in Item.objects.filter(
+                        geo.bbox_filter(south, west, north, east), is_available=True
+                    ).values_list('id', 'lat', 'lng', 'category', 'price_per_hour')
+                ]
+            return Response({'zoom': zoom, 'clusters': [], 'items': items})
+        
+        if item_snapshot.enabled():
+            index = item_snapshot.cluster_index()
+        else:
+            index = clustering.ClusterIndex.from_rows(
+                Item.objects.filter(
+                    geo.bbox_filter(south, west, north, east), is_available=True
+                ).values_list('id', 'lat', 'lng', 'category', 'price_per_hour'),
+                [value for value, _ in Item.CATEGORY_CHOICES],
+            )
         
-        a = (math.sin(delta_lat / 2) ** 2 +
-             math.cos(lat1_rad) * math.cos(lat2_rad) *
-             math.sin(delta_lng / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        return Response({
+            'zoom': zoom,
+            'clusters': index.clusters(south, west, north, east, zoom),
+            'items': []
+        })
+    
+    @action(detail=False, methods=['get'], url_path='search-stats')
+    def search_stats(self, request):
+        """Search index and geocoding cache metrics for this process (staff only)"""
+        return Response({
+            'snapshot': item_snapshot.stats(),
+            'titles': title_index.stats(),
+            'cache': search_cache.stats(),
+            'geocoding': geocode_cache.stats()
+        })
+    
+    def _hydrate(self, matches, available_only=True):
+        """
+        Load full items for (id, distance) pairs, keeping their order
         
-        distance = R * c
-        return round(distance, 2)
+        Items that stopped being available since the matches were found
+        are dropped.
+        """
+        matches = list(matches)
+        queryset = self.get_queryset()
+        if available_only:
+            queryset = queryset.filter(is_available=True)
+        items = queryset.in_bulk(
+            [item_id for item_id, _ in matches]
+        )
+        results = []
+        for item_id, distance in matches:
+            item = items.get(item_id)
+            if item is not None:
+                item.distance_km = distance
+                results.append(item)
+        return results
 
 
 class BundleViewSet(viewsets.ReadOnlyModelViewSet):
@@ -276,4 +729,9 @@ class BundleViewSet(viewsets.ReadOnlyModelViewSet):
         """Get active bundles"""
         return Bundle.objects.filter(
             is_active=True
-        ).select_related('creator').prefetch_related('bundle_items__item')
\ No newline at end of file
+        ).select_related('creator').prefetch_related(
+            Prefetch(
+                'bundle_items__item',
+                queryset=Item.objects.select_related('owner').with_video_flag()
+            )
+        )
\ No newline at end of file